@@ -1,31 +1,29 @@
-import json
-import re
-from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
-from config import OLLAMA_MODEL, RESULTS_PATH, OLLAMA_BASE_URL
+from config import RESULTS_PATH
+from utils.llm_client import get_llm
+from utils.run_context import as_context
+from utils.invoice_record import InvoiceRecord
+from utils.cost_center_classifier import get_cost_center_classifier
 
 from utils.cost_center import COST_CENTER_RULES, DEFAULT_COST_CENTER
 class AccountingAgent:
-    def __init__(self, validation_result_path=RESULTS_PATH):
-        # Initialisiere das LLM (lokales Mistral-Modell über Ollama)
-        self.llm = OllamaLLM(
-    model=OLLAMA_MODEL,
-    base_url=OLLAMA_BASE_URL
-)
+    def __init__(self, context=RESULTS_PATH):
+        # Geteilter LLM-Client (lokales Mistral-Modell über Ollama, siehe utils/llm_client.py)
+        self.llm = get_llm(agent="accounting")
 
-        # Lade das Ergebnis der Validierung (Pflichtangaben-Tabelle) aus der JSON-Datei
-        with open(validation_result_path, "r", encoding="utf-8") as file:
-            self.data = json.load(file).get("validation", "")
+        # Ergebnis der Validierung (Pflichtangaben-Tabelle) aus dem Laufzustand
+        self.context = as_context(context)
+        self.data = self.context.get("validation", "")
+        self.record = InvoiceRecord.from_context(self.context)
 
     def goal(self):
         # Ziel des Agents in einem Satz – wird u.a. im Prompt verwendet
         return "Weise die Rechnung anhand ihrer Positionen einer passenden Kostenstelle zu."
 
-    def think(self):
-        # Extrahiere aus der Validierung die Leistung (Pflichtangabe 7)
+    def think_prompt(self):
+        # Leistung (Pflichtangabe 7) aus dem Rechnungsdatensatz
         # Die Leistung wird benötigt, um daraus semantisch eine Kostenstelle zu erschließen
-        match = re.findall(r"7\.\s*Menge.*?\|\s*Ja\s*\|\s*(.*?)\|", self.data.replace("\n", " "))
-        leistung_text = match[0].strip() if match else "nicht gefunden"
+        leistung_text = self.record.leistung if self.record.vorhanden(7) and self.record.leistung else "nicht gefunden"
 
         # Prompt für ein erstes „Nachdenken“ des Agents zur Interpretation der Leistung
         thought_prompt = PromptTemplate(
@@ -40,20 +38,49 @@ Analysiere den folgenden Rechnungsinhalt aus der Spalte „Leistung“:
 """
         )
 
-        # LLM-Antwort auf das Think-Prompt abrufen
-        thought = self.llm.invoke(thought_prompt.format(
+        return thought_prompt.format(
             goal=self.goal(),
             leistung=leistung_text
-        ))
+        )
+
+    def think(self):
+        # LLM-Antwort auf das Think-Prompt abrufen
+        thought = self.llm.invoke(self.think_prompt())
 
         print(f"AccountingAgent Think(): {thought.strip()}")
         return thought.strip()
 
     def action(self, agent_thoughts=None):
+        # Stufenweise Klassifikation; das LLM (think + Zuordnung) nur bei geringer Konfidenz
+        leistung = self.record.leistung if self.record.vorhanden(7) else None
+        ergebnis = get_cost_center_classifier().classify(leistung, lambda: self.assign_with_llm(agent_thoughts))
+        return self._save(ergebnis)
+
+    async def aaction(self):
+        # Asynchrone Variante von action(): think- und Zuordnungs-Prompt ohne blockierende LLM-Aufrufe
+        async def assign():
+            thought = (await self.llm.ainvoke(self.think_prompt())).strip()
+            print(f"AccountingAgent Think(): {thought}")
+            return (await self.llm.ainvoke(self.assign_prompt(thought))).strip()
+
+        leistung = self.record.leistung if self.record.vorhanden(7) else None
+        return self._save(await get_cost_center_classifier().aclassify(leistung, assign))
+
+    def _save(self, ergebnis):
+        self.context.set("accounting_klassifikation", ergebnis.to_dict())
+        print(f"AccountingAgent Action(): {ergebnis.kostenstelle} "
+              f"(Stufe: {ergebnis.stufe}, Konfidenz: {ergebnis.konfidenz})")
+        return ergebnis.kostenstelle
+
+    def assign_with_llm(self, agent_thoughts=None):
         # Falls kein Gedanke übergeben wurde, wird dieser aus think() erzeugt
         if not agent_thoughts:
             agent_thoughts = self.think()
 
+        # LLM-Antwort enthält die finale Kostenstellen-Zuweisung
+        return self.llm.invoke(self.assign_prompt(agent_thoughts)).strip()
+
+    def assign_prompt(self, agent_thoughts):
         # Baue den Regel-Text auf, mit dem das LLM die richtige Kostenstelle zuordnen soll
         regel_text = "\n".join([f"{k.capitalize()} → {v}" for k, v in COST_CENTER_RULES.items()])
 
@@ -72,8 +99,4 @@ Rechnungsauszug (Pflichtangaben-Tabelle):
 
 Antwortformat: Nur Kostenstelle, z. B.: 1001-Beratung
 """
-
-        # LLM-Antwort enthält die finale Kostenstellen-Zuweisung
-        costcenter = self.llm.invoke(prompt).strip()
-        print(f"AccountingAgent Action(): {costcenter}")
-        return costcenter
+        return prompt
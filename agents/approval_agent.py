@@ -1,34 +1,38 @@
-import json
 import re
-from langchain_ollama import OllamaLLM
 from config import (
-    OLLAMA_MODEL,
     RESULTS_PATH,
     TEAMLEITER_ROLE,
     ABTEILUNGSLEITER_ROLE,
-    OLLAMA_BASE_URL
+    MANAGER_ROLE
 )
-from utils.login import check_credentials
+from utils.llm_client import get_llm
+from utils.approval_queue import ApprovalQueue, STATUS_OFFEN, STATUS_GENEHMIGT
 from utils.approval_tool import map_bruttobetrag_to_role
+from utils.run_context import as_context
+from utils.invoice_record import InvoiceRecord
 
-class ApprovalAgent:
-    def __init__(self, result_path=RESULTS_PATH):
-        # Initialisiere LLM und lade das results.json
-        self.llm = OllamaLLM(
-    model=OLLAMA_MODEL,
-    base_url=OLLAMA_BASE_URL
-)
+# Entscheidungswert → Rolle, die über die Freigabe-Warteschlange genehmigen muss
+FREIGABE_ROLLEN = {"2": TEAMLEITER_ROLE, "3": ABTEILUNGSLEITER_ROLE, "4": MANAGER_ROLE}
 
-        self.result_path = result_path
 
-        # Lade vorhandene Ergebnisse aus der Datei
-        with open(self.result_path, "r", encoding="utf-8") as f:
-            self.data = json.load(f)
+class ApprovalAgent:
+    def __init__(self, context=RESULTS_PATH, queue=None):
+        # Initialisiere LLM und übernimm den Laufzustand
+        self.llm = get_llm(agent="approval")
+
+        # Vorhandene Ergebnisse (gleiches Objekt wie im RunContext)
+        self.context = as_context(context)
+        self.data = self.context.results
+        self.queue = queue or ApprovalQueue()
 
         # Speichere den extrahierten Validation-Text
         self.validation_text = self.data.get("validation", "")
-        # Extrahiere Bruttobetrag (als Float), z. B. für Genehmigungsentscheidung
-        self.bruttobetrag = float(self.extract_bruttobetrag_with_llm(self.validation_text))
+        # Bruttobetrag (als Float) aus dem Rechnungsdatensatz, z. B. für Genehmigungsentscheidung;
+        # das LLM wird nur gefragt, wenn der Betrag nicht eindeutig geparst werden konnte
+        record = InvoiceRecord.from_context(self.context)
+        self.bruttobetrag = float(record.brutto_mit_fallback(
+            lambda: self.extract_bruttobetrag_with_llm(self.validation_text)
+        ))
 
     def goal(self):
         # Zieldefinition für Agenten
@@ -87,42 +91,35 @@ Gib nur den Betrag in dieser Form zurück, z. B.: 2915.50
             result = "Genehmigt - Rolle: Mitarbeiter"
             status = "genehmigt"
 
-        # Teamleiter-Login (bis 5.000 €)
-        elif entscheidung == "2":
-            print(f"Login {TEAMLEITER_ROLE}:")
-            username = input("Benutzername: ")
-            password = input("Passwort: ")
-            if check_credentials(username, password, role=TEAMLEITER_ROLE):
-                result = f"Genehmigt - Rolle: {TEAMLEITER_ROLE}"
+        # Teamleiter (bis 5.000 €), Abteilungsleiter (bis 20.000 €), Manager (darüber):
+        # Freigabe über die Warteschlange anfordern; bis zur Entscheidung parkt die Rechnung
+        elif entscheidung in FREIGABE_ROLLEN:
+            rolle = FREIGABE_ROLLEN[entscheidung]
+            item = self.queue.request(
+                self.context, "approval", rolle,
+                grund=f"Bruttobetrag {self.bruttobetrag:.2f} €", brutto=self.bruttobetrag
+            )
+            if item["status"] == STATUS_OFFEN:
+                result = f"Wartet auf Freigabe - Rolle: {rolle}"
+                status = "wartend"
+            elif item["status"] == STATUS_GENEHMIGT:
+                result = f"Genehmigt - Rolle: {rolle} ({item['entschieden_von']})"
                 status = "genehmigt"
             else:
-                result = "Login fehlgeschlagen - Genehmigung verweigert"
-                status = "verweigert"
-
-        # Abteilungsleiter-Login (bis 20.000 €)
-        elif entscheidung == "3":
-            print(f"Login {ABTEILUNGSLEITER_ROLE}:")
-            username = input("Benutzername: ")
-            password = input("Passwort: ")
-            if check_credentials(username, password, role=ABTEILUNGSLEITER_ROLE):
-                result = f"Genehmigt - Rolle: {ABTEILUNGSLEITER_ROLE}"
-                status = "genehmigt"
-            else:
-                result = "Login fehlgeschlagen - Genehmigung verweigert"
+                result = f"Genehmigung verweigert - Rolle: {rolle} ({item['entschieden_von']})"
                 status = "verweigert"
+            self.data["approval_freigabe_id"] = item["id"]
+            self.data["approval_rolle"] = rolle
 
         # 0 = explizite Ablehnung (z. B. fehlerhafter Betrag oder keine Regel erfüllt)
         elif entscheidung == "0":
             result = "Genehmigung verweigert"
             status = "verweigert"
 
-        # Ergebnis in results.json speichern
+        # Ergebnis im Laufzustand ablegen
         self.data["approval"] = result
         self.data["approval_status"] = status
 
-        with open(self.result_path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, indent=4)
-
         print("ApprovalAgent: Entscheidung gespeichert.")
         return result
 
@@ -0,0 +1,125 @@
+# async_engine.py – asynchrone Ausführung der sechs Workflow-Schritte; viele Rechnungen teilen sich eine Event-Loop
+import asyncio
+from agents.supervisor_agent import SupervisorAgent, WARTET, ZEITUEBERSCHREITUNG
+from agents.accounting_agent import AccountingAgent
+from agents.check_agent import CheckAgent
+from agents.approval_agent import ApprovalAgent
+from agents.booking_agent import BookingAgent
+from agents.archive_agent import ArchiveAgent
+from config import ASYNC_STEP_TIMEOUTS, ASYNC_STEP_TIMEOUT_DEFAULT, ASYNC_MAX_INVOICES
+from utils.async_threads import to_thread
+
+
+class AsyncSupervisor:
+    # Gleiche Schritt-Abhängigkeiten und Statuslogik wie der SupervisorAgent, LLM-Aufrufe ohne blockierte Threads.
+    # Die Anzahl gleichzeitiger Ollama-Anfragen begrenzt der LLM-Client (OLLAMA_MAX_CONCURRENT_REQUESTS).
+    def __init__(self, supervisor, timeouts=None):
+        self.supervisor = supervisor
+        self.timeouts = {**ASYNC_STEP_TIMEOUTS, **(timeouts or {})}
+        context = supervisor.context
+
+        # Genehmigung (Warteschlange, ggf. Betrags-LLM) und Archivierung (Datei-IO) bleiben synchron und laufen im Thread
+        self.agents = {
+            "validation": lambda: supervisor.validation_agent.arun(),
+            "accounting": lambda: AccountingAgent(context).aaction(),
+            "check": lambda: CheckAgent(context).aaction(),
+            "approval": lambda: to_thread(lambda: ApprovalAgent(context, supervisor.approval_queue).run()),
+            "booking": lambda: BookingAgent(context).aaction(),
+            "archiving": lambda: to_thread(lambda: ArchiveAgent(context, supervisor.pdf_path).action())
+        }
+
+    @classmethod
+    async def create(cls, pdf_path, timeouts=None, **kwargs):
+        # SupervisorAgent im Thread anlegen; steht die Validierung noch aus, startet dort auch die PDF-Extraktion
+        supervisor = await asyncio.to_thread(SupervisorAgent, pdf_path, **kwargs)
+        if supervisor.workflow.get("1_validation", 0) != 2:
+            await asyncio.to_thread(lambda: supervisor.validation_agent)
+        return cls(supervisor, timeouts)
+
+    @property
+    def workflow(self):
+        return self.supervisor.workflow
+
+    def timeout(self, step):
+        return self.timeouts.get(step, ASYNC_STEP_TIMEOUT_DEFAULT)
+
+    async def run_step(self, step):
+        supervisor = self.supervisor
+        print(f"SupervisorAgent: Starte {step}-Agent.")
+        with supervisor.cache_scope(step):
+            result = await self.agents[step]()
+
+            # Nachlauf-Logik: Validation mit Pflichtfeldprüfung (wie SupervisorAgent.run_agent_and_validate)
+            if step == "validation":
+                fehlende_felder = supervisor.extract_missing_fields(result)
+                if fehlende_felder:
+                    print(f"SupervisorAgent: Fehlende Pflichtangaben erkannt: {fehlende_felder}")
+                    improved_result = await supervisor.validation_agent.arun(missing_fields=fehlende_felder)
+                    result = supervisor.merge_validation_results(result, improved_result)
+
+        review = None
+        if supervisor.needs_review(step):
+            review = (await supervisor.llm.ainvoke(supervisor.review_prompt(result, step))).strip().lower()
+
+        # Statuslogik inkl. Rückfrage über die Freigabe-Warteschlange und Checkpoint; einmal begonnen, wird der
+        # Schritt auch bei Zeitüberschreitung regulär abgeschlossen
+        return await to_thread(supervisor.complete_step, step, result, review, complete=True)
+
+    async def run_step_with_timeout(self, step):
+        supervisor = self.supervisor
+        print(f"SupervisorAgent: Ausführung von Schritt '{step}' begonnen.")
+        try:
+            return await asyncio.wait_for(self.run_step(step), self.timeout(step))
+        except asyncio.TimeoutError:
+            # Threads des Schritts sind beendet (siehe utils.async_threads); der Status bleibt unverändert offen,
+            # der Schritt wird beim nächsten Lauf erneut ausgeführt
+            supervisor.save_workflow_status()
+            return f"{ZEITUEBERSCHREITUNG} in Schritt '{step}'."
+
+    async def next_step(self):
+        # Alle bereiten Schritte (siehe STEP_DEPENDENCIES) gleichzeitig ausführen
+        supervisor = self.supervisor
+        if any(v == 3 for v in self.workflow.values()):
+            return "Abbruch"
+
+        bereit = [step for step, _ in supervisor.ready_steps()]
+        if not bereit:
+            return "Done"
+
+        try:
+            results = await asyncio.gather(*(self.run_step_with_timeout(step) for step in bereit))
+        except asyncio.CancelledError:
+            # Bisherigen Stand sichern, damit ein späterer Lauf hier fortsetzen kann
+            supervisor.save_workflow_status()
+            raise
+
+        abbruch = next((r for r in results if isinstance(r, str) and "Abbruch" in r), None)
+        if abbruch:
+            return abbruch
+        zeitueberschreitung = next((r for r in results if isinstance(r, str) and r.startswith(ZEITUEBERSCHREITUNG)), None)
+        if zeitueberschreitung:
+            return zeitueberschreitung
+        wartend = next((r for r in results if isinstance(r, str) and r.startswith(WARTET)), None)
+        if wartend:
+            return wartend
+        if len(bereit) == 1:
+            return f"Schritt '{bereit[0]}' erfolgreich durchgeführt."
+        return f"Schritte {', '.join(repr(step) for step in bereit)} erfolgreich durchgeführt."
+
+    async def action(self):
+        # Alle Schritte entlang der Abhängigkeiten, bis "Done", Abbruch, Zeitüberschreitung oder Warten auf Freigabe
+        while True:
+            result = await self.next_step()
+            if result == "Done" or "Abbruch" in result or result.startswith((WARTET, ZEITUEBERSCHREITUNG)):
+                return result
+
+
+async def run_many(pdf_paths, run_one, max_invoices=ASYNC_MAX_INVOICES):
+    # run_one(pdf_path) als Coroutine für alle Rechnungen, höchstens max_invoices gleichzeitig
+    slots = asyncio.Semaphore(max(1, int(max_invoices)))
+
+    async def limited(pdf_path):
+        async with slots:
+            return await run_one(pdf_path)
+
+    return await asyncio.gather(*(limited(path) for path in pdf_paths))
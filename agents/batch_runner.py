@@ -0,0 +1,225 @@
+# batch_runner.py – verarbeitet alle PDFs aus INVOICE_FOLDER parallel mit je eigenem SupervisorAgent
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agents.supervisor_agent import SupervisorAgent, WARTET, ZEITUEBERSCHREITUNG, MAX_PARALLEL_STEPS
+from agents.async_engine import AsyncSupervisor, run_many
+from config import INVOICE_FOLDER, BATCH_RUN_DIR, BATCH_MAX_WORKERS, ASYNC_MAX_INVOICES
+from utils.run_context import RunContext
+from utils.approval_queue import ApprovalQueue
+from utils.checkpoint_store import CheckpointStore
+from utils.scheduler import InvoiceScheduler, prescan
+from utils.amount_parser import amount_stats
+from utils.llm_cache import llm_cache_stats
+from utils.archive_db import prefilter_stats
+from utils.matching import match_stats
+from utils.cost_center_classifier import classifier_stats
+
+
+class BatchRunner:
+    def __init__(self, invoice_folder=INVOICE_FOLDER, run_dir=BATCH_RUN_DIR, max_workers=BATCH_MAX_WORKERS):
+        # Posteingang, Ablage für den Laufzustand und Anzahl paralleler Worker
+        self.invoice_folder = invoice_folder
+        self.run_dir = run_dir
+        self.max_workers = max(1, int(max_workers))
+        # Ein Pool für die parallelen Schritte aller Rechnungen (statt neuer Threads je Rechnung und Schritt)
+        self.step_executor = ThreadPoolExecutor(max_workers=self.max_workers * MAX_PARALLEL_STEPS)
+
+    def scan(self):
+        # Alle PDF-Dateien im Posteingang (sortiert, damit die Reihenfolge reproduzierbar ist)
+        if not os.path.isdir(self.invoice_folder):
+            return []
+        return sorted(
+            os.path.join(self.invoice_folder, name)
+            for name in os.listdir(self.invoice_folder)
+            if name.lower().endswith(".pdf")
+        )
+
+    def run_id(self, pdf_path):
+        # Eindeutige Lauf-ID aus Dateiname und Pfad-Hash (kollisionsfrei bei gleichen Dateinamen)
+        stem = os.path.splitext(os.path.basename(pdf_path))[0]
+        digest = hashlib.sha1(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()[:8]
+        return f"{stem}_{digest}"
+
+    def prepare_run(self, pdf_path):
+        # Laufzustand mit eigenem Verzeichnis (results.json + Workflow-Status) je Rechnung;
+        # eine bereits begonnene Rechnung (gleicher PDF-Hash) setzt beim ersten offenen Schritt fort
+        run_path = os.path.join(self.run_dir, self.run_id(pdf_path))
+        context = RunContext.resume(
+            pdf_path,
+            results_path=os.path.join(run_path, "results.json"),
+            workflow_status_path=os.path.join(run_path, "workflow_status.json")
+        )
+        context.checkpoint()
+        return context
+
+    @staticmethod
+    def outcome_status(result):
+        if result == "Done":
+            return "abgeschlossen"
+        if result.startswith(ZEITUEBERSCHREITUNG):
+            return "zeitueberschreitung"
+        return "wartend" if result.startswith(WARTET) else "abgebrochen"
+
+    def run_invoice(self, pdf_path, context=None):
+        # Eine Rechnung vollständig durch die sechs Schritte führen (context: fortzusetzender Laufzustand)
+        start = time.perf_counter()
+        outcome = {"pdf": pdf_path, "run_id": self.run_id(pdf_path)}
+
+        try:
+            context = context or self.prepare_run(pdf_path)
+            outcome["results_path"] = context.results_path
+
+            supervisor = SupervisorAgent(pdf_path, context=context, step_executor=self.step_executor)
+            result = supervisor.action()
+
+            outcome["status"] = self.outcome_status(result)
+            outcome["result"] = result
+            outcome["workflow"] = supervisor.workflow
+        except Exception as e:
+            # Fehler einer Rechnung dürfen den restlichen Batch nicht stoppen
+            outcome["status"] = "fehler"
+            outcome["result"] = f"{type(e).__name__}: {e}"
+
+        outcome["dauer_s"] = round(time.perf_counter() - start, 3)
+        return outcome
+
+    async def arun_invoice(self, pdf_path):
+        # Wie run_invoice(), aber als Coroutine auf der gemeinsamen Event-Loop
+        start = time.perf_counter()
+        outcome = {"pdf": pdf_path, "run_id": self.run_id(pdf_path)}
+
+        try:
+            context = await asyncio.to_thread(self.prepare_run, pdf_path)
+            outcome["results_path"] = context.results_path
+
+            supervisor = await AsyncSupervisor.create(pdf_path, context=context)
+            result = await supervisor.action()
+
+            outcome["status"] = self.outcome_status(result)
+            outcome["result"] = result
+            outcome["workflow"] = supervisor.workflow
+        except Exception as e:
+            outcome["status"] = "fehler"
+            outcome["result"] = f"{type(e).__name__}: {e}"
+
+        outcome["dauer_s"] = round(time.perf_counter() - start, 3)
+        print(f"BatchRunner: {outcome['run_id']} → {outcome['status']} ({outcome['dauer_s']} s)")
+        return outcome
+
+    def run(self, pdf_paths=None):
+        # Alle Rechnungen parallel verarbeiten und Ergebnis je Rechnung + Durchsatz melden;
+        # die Reihenfolge bestimmt der Scheduler (Frist/Kleinbetrag zuerst, fair über die Lieferanten)
+        pdf_paths = self.scan() if pdf_paths is None else list(pdf_paths)
+        start = time.perf_counter()
+        scheduler = InvoiceScheduler()
+        outcomes = []
+        outcomes_lock = threading.Lock()
+
+        def worker():
+            while (eintrag := scheduler.pop()) is not None:
+                outcome = self.run_invoice(eintrag["item"])
+                scheduler.done(eintrag)
+                outcome["klasse"] = eintrag["klasse"]
+                with outcomes_lock:
+                    outcomes.append(outcome)
+                print(f"BatchRunner: {outcome['run_id']} [{eintrag['klasse']}] → {outcome['status']} "
+                      f"({outcome['dauer_s']} s)")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Vorab-Scan (Betrag, Frist, Lieferant) parallel, danach holen sich die Worker die Rechnungen ab
+            for path, facts in zip(pdf_paths, executor.map(prescan, pdf_paths)):
+                scheduler.push(path, facts)
+            for future in [executor.submit(worker) for _ in range(self.max_workers)]:
+                future.result()
+
+        return self.report(outcomes, time.perf_counter() - start, self.max_workers, scheduler.report())
+
+    def resume(self, queue=None):
+        # Geparkte Läufe fortsetzen, für die inzwischen eine Entscheidung in der Warteschlange vorliegt
+        queue = queue or ApprovalQueue()
+        items = {}
+        for item in queue.resumable():
+            items.setdefault(item["results_path"], []).append(item)
+        start = time.perf_counter()
+        outcomes = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self.run_invoice, gruppe[0]["pdf_path"],
+                    RunContext.resume(gruppe[0]["pdf_path"], results_path, gruppe[0]["workflow_status_path"])
+                ): gruppe
+                for results_path, gruppe in items.items()
+            }
+            for future in as_completed(futures):
+                outcome = future.result()
+                outcomes.append(outcome)
+                for item in futures[future]:
+                    queue.mark_resumed(item["id"])
+                print(f"BatchRunner: {outcome['run_id']} fortgesetzt → {outcome['status']} ({outcome['dauer_s']} s)")
+
+        return self.report(outcomes, time.perf_counter() - start, self.max_workers)
+
+    def recover(self, store=None):
+        # Nach einem Neustart alle unterbrochenen Rechnungen fortsetzen (Aufwand ~ Anzahl offener Läufe)
+        store = store or CheckpointStore()
+        pdf_paths = [eintrag["pdf_path"] for eintrag in store.in_flight() if os.path.exists(eintrag["pdf_path"] or "")]
+        print(f"BatchRunner: {len(pdf_paths)} unterbrochene Rechnung(en) werden fortgesetzt.")
+        return self.run(pdf_paths)
+
+    def run_async(self, pdf_paths=None, max_invoices=ASYNC_MAX_INVOICES):
+        # Alle Rechnungen verschränkt auf einer Event-Loop (Begrenzung der Ollama-Anfragen im LLM-Client)
+        pdf_paths = self.scan() if pdf_paths is None else list(pdf_paths)
+        start = time.perf_counter()
+        outcomes = asyncio.run(run_many(pdf_paths, self.arun_invoice, max_invoices))
+        return self.report(outcomes, time.perf_counter() - start, max_invoices)
+
+    def report(self, outcomes, dauer, worker, planung=None):
+        # planung: Wartezeit vs. Bearbeitungszeit je Scheduler-Klasse (nur bei run())
+        return {
+            "rechnungen": len(outcomes),
+            "abgeschlossen": sum(1 for o in outcomes if o["status"] == "abgeschlossen"),
+            "abgebrochen": sum(1 for o in outcomes if o["status"] == "abgebrochen"),
+            "wartend": sum(1 for o in outcomes if o["status"] == "wartend"),
+            "zeitueberschreitung": sum(1 for o in outcomes if o["status"] == "zeitueberschreitung"),
+            "fehler": sum(1 for o in outcomes if o["status"] == "fehler"),
+            "worker": worker,
+            "dauer_s": round(dauer, 3),
+            "durchsatz_pro_min": round(len(outcomes) / dauer * 60, 2) if dauer > 0 else 0.0,
+            "bruttobetrag_parser": amount_stats(),
+            "llm_cache": llm_cache_stats(),
+            "archiv_prefilter": prefilter_stats(),
+            "sachliche_pruefung": match_stats(),
+            "kostenstellen": classifier_stats(),
+            "freigaben": ApprovalQueue().stats(),
+            "planung": planung,
+            "ergebnisse": sorted(outcomes, key=lambda o: o["pdf"])
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-Verarbeitung aller Rechnungen im Posteingang")
+    parser.add_argument("--folder", default=INVOICE_FOLDER, help="Ordner mit den PDF-Rechnungen")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="Anzahl paralleler Worker")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Rechnungen auf einer Event-Loop verarbeiten statt im Thread-Pool")
+    parser.add_argument("--resume", action="store_true",
+                        help="Nur geparkte Läufe mit inzwischen getroffener Freigabe-Entscheidung fortsetzen")
+    parser.add_argument("--recover", action="store_true",
+                        help="Alle nach einem Absturz unterbrochenen Läufe aus den Checkpoints fortsetzen")
+    args = parser.parse_args()
+
+    runner = BatchRunner(invoice_folder=args.folder, max_workers=args.workers)
+    if args.recover:
+        report = runner.recover()
+    elif args.resume:
+        report = runner.resume()
+    else:
+        report = runner.run_async() if args.use_async else runner.run()
+    print(json.dumps(report, indent=4, ensure_ascii=False))
@@ -1,21 +1,19 @@
-import json
 import re
-import sqlite3
-from langchain_ollama import OllamaLLM
-from config import RESULTS_PATH, ARCHIVE_DB_PATH, OLLAMA_MODEL, OLLAMA_BASE_URL
+from config import RESULTS_PATH, ARCHIVE_DB_PATH
+from utils.llm_client import get_llm
+from utils.run_context import as_context
+from utils.invoice_record import InvoiceRecord
+from utils import archive_db
+from utils.async_threads import to_thread
 
 class BookingAgent:
-    def __init__(self, intermediate_path=RESULTS_PATH):
-        # Initialisierung des LLM und Laden des result.json
-        self.llm = OllamaLLM(
-    model=OLLAMA_MODEL,
-    base_url=OLLAMA_BASE_URL
-)
+    def __init__(self, context=RESULTS_PATH):
+        # Initialisierung des LLM und Übernahme des Laufzustands
+        self.llm = get_llm(agent="booking")
 
-        self.path = intermediate_path
-
-        with open(self.path, "r", encoding="utf-8") as f:
-            self.data = json.load(f)
+        self.context = as_context(context)
+        self.data = self.context.results
+        self.record = InvoiceRecord.from_context(self.context)
 
     def goal(self):
         # Zieldefinition: Buchung durchführen und als "gebucht" markieren
@@ -27,14 +25,9 @@ class BookingAgent:
             return "Diese Rechnung wurde bereits gebucht. Keine Aktion notwendig."
         return "Die Rechnung ist freigegeben und kann jetzt gebucht werden."
 
-    def is_invoice_already_booked(self, rechnungsnummer: str) -> bool:
+    def is_invoice_already_booked(self, rechnungsnummer: str, lieferant: str = None) -> bool:
         # Prüfe anhand der Archivdatenbank, ob die Rechnung schon archiviert (also gebucht) wurde
-        conn = sqlite3.connect(ARCHIVE_DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM archive WHERE rechnungsnummer = ?", (rechnungsnummer,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count > 0
+        return archive_db.is_archived(lieferant, rechnungsnummer, ARCHIVE_DB_PATH)
 
     def extract_amount_with_llm(self, validation_text: str) -> str:
         # 1. Versuch: LLM soll den Bruttobetrag aus Zeile 9 extrahieren
@@ -80,25 +73,38 @@ class BookingAgent:
         return "0.00"
 
     def action(self):
-        # Denkprozess ausführen
+        # Buchung vorbereiten; das LLM formuliert nur noch die Buchungsbestätigung
+        abbruch, buchung_prompt = self.prepare()
+        if abbruch:
+            return abbruch
+        return self.finish(self.llm.invoke(buchung_prompt))
+
+    async def aaction(self):
+        # Asynchrone Variante von action(); die Vorbereitung (DB, ggf. Betrags-LLM) läuft im Thread
+        abbruch, buchung_prompt = await to_thread(self.prepare)
+        if abbruch:
+            return abbruch
+        return self.finish(await self.llm.ainvoke(buchung_prompt))
+
+    def prepare(self):
+        # (Abbruchmeldung, None) bei bereits gebuchter Rechnung, sonst (None, Prompt)
         gedanke = self.think()
         validation = self.data.get("validation", "")
 
-        # Extrahiere die Rechnungsnummer aus Zeile 6
-        match_nr = re.search(r"\|6\. Fortlaufende Rechnungsnummer\s*\|\s*Ja\s*\|\s*(.*?)\s*\|", validation)
-        rechnungsnummer = match_nr.group(1).strip() if match_nr else "UNBEKANNT"
+        # Rechnungsnummer (Zeile 6) aus dem Rechnungsdatensatz; ohne Nummer gibt es keinen Archivschlüssel
+        # (wie im ArchiveAgent) und damit keine Dublettenprüfung
+        rechnungsnummer = self.record.rechnungsnummer if self.record.vorhanden(6) and self.record.rechnungsnummer else None
 
         # Abbruch, wenn bereits gebucht (doppelte Buchung vermeiden)
-        if self.is_invoice_already_booked(rechnungsnummer):
+        if rechnungsnummer and self.is_invoice_already_booked(rechnungsnummer, self.record.lieferant):
             result = f"Buchung abgebrochen - Rechnung {rechnungsnummer} wurde bereits gebucht."
             self.data["booking"] = result
             self.data["booking_status"] = "abgebrochen"
-            self._save()
-            return result
+            return result, None
 
-        # Hole die Kostenstelle und den Bruttobetrag
+        # Hole die Kostenstelle und den Bruttobetrag (LLM nur, falls nicht eindeutig parsebar)
         kostenstelle = self.data.get("accounting", "Unbekannt")
-        betrag = self.extract_amount_with_llm(validation)
+        betrag = f"{self.record.brutto_mit_fallback(lambda: self.extract_amount_with_llm(validation)):.2f}"
 
         # LLM soll simulierte Buchungsbestätigung erzeugen
         buchung_prompt = f"""
@@ -111,16 +117,13 @@ Rechnungsdaten:
 Gib folgenden Satz exakt aus:
 Buchung erfolgt: [Betrag] EUR auf [Kostenstelle] - Status: gebucht
 """
-        buchung_text = self.llm.invoke(buchung_prompt).strip()
+        return None, buchung_prompt
+
+    def finish(self, buchung_text):
+        buchung_text = buchung_text.strip()
 
-        # Ergebnisse in result.json speichern
+        # Ergebnisse im Laufzustand ablegen
         self.data["booking"] = buchung_text
         self.data["booking_status"] = "gebucht"
-        self._save()
 
         return buchung_text
-
-    def _save(self):
-        # Speichere Änderungen in results.json
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, indent=4)
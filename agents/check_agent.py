@@ -1,62 +1,80 @@
-import json
-import re
-from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
-from config import RESULTS_PATH, REFERENCE_DATA_PATH, OLLAMA_MODEL, OWN_COMPANY_FULL, OLLAMA_BASE_URL
+from config import (
+    RESULTS_PATH, REFERENCE_DATA_PATH, MATCH_ACCEPT_SCORE, MATCH_REJECT_SCORE,
+    CHECK_CANDIDATES_K, CANDIDATE_NUMBER_MIN
+)
+from utils.llm_client import get_llm
+from utils.run_context import as_context
+from utils.invoice_record import InvoiceRecord
+from utils.reference_store import get_reference_store
+from utils.matching import match_invoice, number_similarity
 
 class CheckAgent:
-    def __init__(self, validation_result_path=RESULTS_PATH, reference_path=REFERENCE_DATA_PATH):
-        # Initialisiere LLM mit lokalem Ollama-Modell
-        self.llm = OllamaLLM(
-            model=OLLAMA_MODEL,
-            base_url=OLLAMA_BASE_URL
-        )
-
-        # Lade Validierungsdaten aus vorherigem Agentenlauf
-        with open(validation_result_path, "r", encoding="utf-8") as f:
-            self.raw_data = json.load(f).get("validation", "")
+    def __init__(self, context=RESULTS_PATH, reference_path=REFERENCE_DATA_PATH):
+        # Geteilter LLM-Client mit lokalem Ollama-Modell
+        self.llm = get_llm(agent="check")
 
-        # Lade bekannte Rechnungsreferenzen für den Abgleich
-        with open(reference_path, "r", encoding="utf-8") as f:
-            self.known = json.load(f).get("invoices", [])
+        # Rechnungsdatensatz aus dem Validierungsschritt (Laufzustand im Speicher)
+        self.context = as_context(context)
+        self.record = InvoiceRecord.from_context(self.context)
 
-        # Bereinige den extrahierten Text zur Weiterverarbeitung
-        self.data = self._normalize_text(self.raw_data)
+        # Bekannte Rechnungsreferenzen (einmal geladen, indiziert, von allen Läufen geteilt)
+        self.references = get_reference_store(reference_path)
 
     def goal(self):
         # Zieldefinition für den Prompt
         return "Prüfe die sachliche Richtigkeit einer Rechnung mit Fokus auf Rechnungsnummer, plausiblen Lieferanten, Leistung und Bruttobetrag."
 
     def think(self):
-        # Extrahiere alle prüfungsrelevanten Felder aus der Tabelle
-        unternehmer = self._extract("1. Name & Anschrift des leistenden Unternehmers")
-        empfaenger = self._extract("2. Name & Anschrift des Leistungsempfängers")
-
-        # Bestimme den Lieferanten (nicht das eigene Unternehmen)
-        if OWN_COMPANY_FULL in unternehmer:
-            lieferant = empfaenger
-        else:
-            lieferant = unternehmer
-
+        # Prüfungsrelevante Felder aus dem Rechnungsdatensatz (Lieferant ist bereits bestimmt)
         return {
-            "rechnungsnummer": self._extract("6. Fortlaufende Rechnungsnummer"),
-            "lieferant": lieferant,
-            "leistung": self._extract("7. Menge und Art der gelieferten Leistung"),
-            "betrag": self._extract("9. Entgelt nach Steuersätzen aufgeschlüsselt")
+            "rechnungsnummer": self.record.rechnungsnummer or "unbekannt",
+            "lieferant": self._normalize_text(self.record.lieferant or "unbekannt"),
+            "leistung": self._normalize_text(self.record.leistung or "unbekannt"),
+            "brutto": self.record.brutto
         }
 
     def action(self):
+        # Eindeutige Fälle ohne LLM; nur im Grenzfall wird das Modell gefragt
+        entscheidung, prompt = self.prepare()
+        if entscheidung:
+            return entscheidung
+        return self.decide(self.llm.invoke(prompt))
+
+    async def aaction(self):
+        # Asynchrone Variante von action()
+        entscheidung, prompt = self.prepare()
+        if entscheidung:
+            return entscheidung
+        return self.decide(await self.llm.ainvoke(prompt))
+
+    def prepare(self):
+        # (Entscheidung, None) für eindeutige Fälle, sonst (None, Prompt für das LLM)
         extracted = self.think()
-        brutto = self._extract_bruttobetrag(extracted["betrag"])
+        brutto = f"{extracted['brutto']:.2f}" if extracted["brutto"] is not None else "0.00"
 
-        referenz = next(
-            (r for r in self.known if r["rechnungsnummer"].strip() == extracted["rechnungsnummer"].strip()),
-            None
-        )
+        # Indexsuche über die normalisierte Rechnungsnummer, sonst ähnlichste Referenzen (OCR-/Formatvarianten)
+        referenz = self.references.find(extracted["rechnungsnummer"], self.record.lieferant)
+        nummer = extracted["rechnungsnummer"]
+        if not referenz:
+            referenz = self.best_candidate(extracted)
+            if referenz:
+                # Zuordnung über Kandidatensuche ist bereits geprüft; Abgleich mit der Referenznummer
+                nummer = referenz["rechnungsnummer"]
 
         if not referenz:
             self._save_result("nicht_nachvollziehbar")
-            return "nicht_nachvollziehbar"
+            return "nicht_nachvollziehbar", None
+
+        # Deterministischer Abgleich; das LLM wird nur für Grenzfälle gefragt
+        match = match_invoice(
+            nummer, extracted["lieferant"], extracted["brutto"], extracted["leistung"], referenz
+        )
+        self.context.set("check_match", match.to_dict())
+        if match.entscheidung != "grenzfall":
+            self._save_result(match.entscheidung)
+            return match.entscheidung, None
+        self.match = match
 
         referenz_text = (
             f"Rechnungsnummer: {referenz['rechnungsnummer']}\n"
@@ -103,7 +121,11 @@ class CheckAgent:
             rechnung=rechnung_text,
             referenz=referenz_text
         )
-        result = self.llm.invoke(prompt).strip().lower()
+        return None, prompt
+
+    def decide(self, result):
+        # Modellantwort für einen Grenzfall auswerten
+        result = result.strip().lower()
 
         # 1. Wenn Modell korrekt reagiert
         if "sachlich_korrekt" in result:
@@ -111,17 +133,13 @@ class CheckAgent:
             return "sachlich_korrekt"
 
         if "nicht_nachvollziehbar" in result:
-            # Prüfe trotzdem Fallback
-            if referenz["rechnungsnummer"].strip() == extracted["rechnungsnummer"].strip():
-                print("CheckAgent Fallback: Rechnungsnummer stimmt exakt – setze auf sachlich_korrekt.")
-                self._save_result("sachlich_korrekt")
-                return "sachlich_korrekt"
+            # Im Grenzfall gilt die Modellantwort (kein Überschreiben allein wegen gleicher Rechnungsnummer)
             self._save_result("nicht_nachvollziehbar")
             return "nicht_nachvollziehbar"
 
-        # 2. Fallback bei Rechnungsnummer (auch wenn Modell keine klare Antwort gibt)
-        if referenz["rechnungsnummer"].strip() == extracted["rechnungsnummer"].strip():
-            print("CheckAgent Safety-Fallback: Rechnungsnummer stimmt exakt – Modellantwort unklar – setze auf sachlich_korrekt.")
+        # 2. Fallback bei unklarer Modellantwort: Abgleich-Score in der oberen Hälfte des Grenzbereichs
+        if self.match.score >= (MATCH_ACCEPT_SCORE + MATCH_REJECT_SCORE) / 2:
+            print("CheckAgent Safety-Fallback: Modellantwort unklar – Abgleich-Score ausreichend – setze auf sachlich_korrekt.")
             self._save_result("sachlich_korrekt")
             return "sachlich_korrekt"
 
@@ -130,27 +148,32 @@ class CheckAgent:
         return "unklar"
 
 
+    def best_candidate(self, extracted):
+        # Top-k Kandidaten; übernommen wird nur ein eindeutiger Treffer (Nummer ähnlich, Lieferant und Betrag passen)
+        kandidaten = self.references.candidates(
+            extracted["rechnungsnummer"], self.record.lieferant, extracted["brutto"], k=CHECK_CANDIDATES_K
+        )
+        self.context.set("check_kandidaten", [{"score": score, **entry} for score, entry in kandidaten])
+
+        passend = [
+            entry for _, entry in kandidaten
+            if number_similarity(extracted["rechnungsnummer"], entry.get("rechnungsnummer")) >= CANDIDATE_NUMBER_MIN
+            and match_invoice(
+                entry.get("rechnungsnummer"), extracted["lieferant"], extracted["brutto"],
+                extracted["leistung"], entry, count=False
+            ).entscheidung == "sachlich_korrekt"
+        ]
+        if len(passend) != 1:
+            return None
+
+        print(f"CheckAgent: Rechnungsnummer {extracted['rechnungsnummer']} über Kandidatensuche "
+              f"der Referenz {passend[0]['rechnungsnummer']} zugeordnet.")
+        self.context.set("check_referenz", passend[0]["rechnungsnummer"])
+        return passend[0]
+
     def _save_result(self, result_value):
-        # Speichere das Ergebnis in results.json
-        try:
-            with open(RESULTS_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            data = {}
-        data["check"] = result_value
-        with open(RESULTS_PATH, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
-
-    def _extract(self, label):
-        # Extrahiere spezifische Zeile aus der Markdown-Tabelle
-        pattern = fr"\|\s*{label}.*?\|\s*(Ja|Nein|Fehlt)\s*\|\s*(.*?)\|"
-        match = re.search(pattern, self.data.replace("\n", " "))
-        return match.group(2).strip() if match else "unbekannt"
-
-    def _extract_bruttobetrag(self, betrag_text):
-        # Versuche den Bruttobetrag aus der Textzeile zu extrahieren
-        match = re.search(r"([\d\.,]+)\s*€?\s*\((Brutto|Gesamt).*?\)", betrag_text, re.IGNORECASE)
-        return match.group(1).replace(",", ".") if match else "0.00"
+        # Ergebnis im Laufzustand ablegen (persistiert der Supervisor an der Schrittgrenze)
+        self.context.set("check", result_value)
 
     def _normalize_text(self, text):
         # HTML und Sonderzeichen entfernen
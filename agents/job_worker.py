@@ -0,0 +1,93 @@
+# job_worker.py – Worker-Prozesse, die Aufträge aus der JobQueue mit der Pipeline (SupervisorAgent) abarbeiten
+# Aufruf: python -m agents.job_worker [--processes 2] [--threads 4]
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from agents.batch_runner import BatchRunner
+from config import BATCH_MAX_WORKERS, JOB_LEASE_S, JOB_POLL_S, JOB_WORKER_PROCESSES
+from utils.approval_queue import ApprovalQueue
+from utils.job_queue import JobQueue
+
+
+class JobWorker:
+    def __init__(self, queue=None, threads=BATCH_MAX_WORKERS, poll_s=JOB_POLL_S, name=None):
+        # Jeder Worker-Prozess verarbeitet bis zu `threads` Rechnungen gleichzeitig
+        self.queue = queue or JobQueue()
+        self.runner = BatchRunner(max_workers=threads)
+        self.poll_s = poll_s
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+
+    def process(self, job):
+        # Ein Auftrag = ein Rechnungslauf; eine bereits begonnene Rechnung setzt am Checkpoint fort
+        outcome = self.runner.run_invoice(job["pdf_path"])
+        self.queue.finish(job["id"], outcome["status"], outcome["result"], outcome.get("results_path"))
+        print(f"JobWorker {self.name}: {job['id']} ({job['name']}) → {outcome['status']} ({outcome['dauer_s']} s)")
+        return outcome
+
+    def resume_decided(self, approvals):
+        # Wartende Aufträge mit inzwischen getroffener Freigabe-Entscheidung wieder einreihen
+        for item in approvals.resumable():
+            self.queue.reopen(item["pdf_path"])
+            approvals.mark_resumed(item["id"])
+
+    def stop(self):
+        self._stop.set()
+
+    def plan_forever(self):
+        # Neue Aufträge laufend einstufen (PDF-Vorab-Scan), getrennt von der Annahme in der API
+        while not self._stop.is_set():
+            try:
+                if self.queue.plan():
+                    continue
+            except Exception as e:
+                print(f"JobWorker {self.name}: Einplanung fehlgeschlagen ({type(e).__name__}: {e})")
+            self._stop.wait(self.poll_s)
+
+    def run_forever(self):
+        approvals = ApprovalQueue()
+        frei = threading.Semaphore(self.runner.max_workers)
+        letzter_heartbeat = 0.0
+        threading.Thread(target=self.plan_forever, name="job-planer", daemon=True).start()
+
+        with ThreadPoolExecutor(max_workers=self.runner.max_workers) as executor:
+            while not self._stop.is_set():
+                # Leases laufender Aufträge verlängern und verwaiste Aufträge anderer Worker zurückholen
+                if time.monotonic() - letzter_heartbeat > JOB_LEASE_S / 3:
+                    self.queue.heartbeat(self.name)
+                    self.queue.requeue_stale()
+                    letzter_heartbeat = time.monotonic()
+
+                # Nur so viele Aufträge übernehmen, wie Threads frei sind (der Rest bleibt für andere Worker)
+                if not frei.acquire(timeout=self.poll_s):
+                    continue
+                job = self.queue.claim(self.name)
+                if job is None:
+                    frei.release()
+                    self.resume_decided(approvals)
+                    self._stop.wait(self.poll_s)
+                    continue
+                executor.submit(self.process, job).add_done_callback(lambda _: frei.release())
+
+
+def _worker_main(threads):
+    JobWorker(threads=threads).run_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aufträge aus der Warteschlange verarbeiten")
+    parser.add_argument("--processes", type=int, default=JOB_WORKER_PROCESSES, help="Anzahl Worker-Prozesse")
+    parser.add_argument("--threads", type=int, default=BATCH_MAX_WORKERS, help="Rechnungen je Prozess")
+    args = parser.parse_args()
+
+    # spawn statt fork: SQLite-Verbindungen und LLM-Clients werden je Prozess neu aufgebaut
+    ctx = multiprocessing.get_context("spawn")
+    prozesse = [ctx.Process(target=_worker_main, args=(args.threads,)) for _ in range(max(1, args.processes))]
+    for prozess in prozesse:
+        prozess.start()
+    for prozess in prozesse:
+        prozess.join()
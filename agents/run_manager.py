@@ -0,0 +1,102 @@
+# run_manager.py – Rechnungsläufe im Hintergrund (Worker-Pool) mit Live-Status im Speicher, z. B. für die Streamlit-App
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from agents.batch_runner import BatchRunner
+from agents.supervisor_agent import SupervisorAgent
+from config import BATCH_MAX_WORKERS, UPLOAD_DIR
+from utils.approval_queue import ApprovalQueue
+from utils.checkpoint_store import CheckpointStore
+from utils.job_queue import store_pdf
+from utils.run_context import default_workflow_status
+
+# Läufe in diesen Zuständen werden nicht erneut eingereiht
+AKTIV = ("eingereiht", "läuft")
+
+
+@dataclass
+class RunState:
+    run_id: str
+    name: str
+    pdf_path: str
+    status: str = "eingereiht"                          # eingereiht | läuft | abgeschlossen | wartend | abgebrochen | fehler
+    result: str = None
+    eingereicht: float = field(default_factory=time.time)
+    gestartet: float = None
+    beendet: float = None
+    supervisor: SupervisorAgent = field(default=None, repr=False)
+
+    def workflow(self):
+        # Live-Status direkt aus dem Laufzustand im Speicher (keine Dateizugriffe)
+        return dict(self.supervisor.workflow) if self.supervisor else default_workflow_status()
+
+    def aktive_schritte(self):
+        # Schritte, die gerade ausgeführt werden (bereit und Lauf aktiv)
+        if self.status != "läuft" or self.supervisor is None:
+            return []
+        return [step for step, _ in self.supervisor.ready_steps()]
+
+    def results(self):
+        # Momentaufnahme der Schrittergebnisse (der Worker schreibt parallel weiter)
+        return dict(self.supervisor.context.results) if self.supervisor else {}
+
+
+class RunManager:
+    def __init__(self, upload_dir=UPLOAD_DIR, max_workers=BATCH_MAX_WORKERS):
+        self.upload_dir = upload_dir
+        self.runner = BatchRunner(max_workers=max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.runner.max_workers)
+        self.runs = {}
+        self._lock = threading.Lock()
+
+    def submit_bytes(self, data, name):
+        # Upload unter seinem Inhalts-Hash ablegen (gleiche Rechnung = gleiche Datei) und einreihen
+        return self.submit(store_pdf(data, self.upload_dir), name)
+
+    def submit(self, pdf_path, name=None):
+        # Lauf einreihen; ein bereits eingereihter oder laufender Lauf derselben Datei wird zurückgegeben
+        run_id = self.runner.run_id(pdf_path)
+        with self._lock:
+            state = self.runs.get(run_id)
+            if state is not None and state.status in AKTIV:
+                return state
+            state = self.runs[run_id] = RunState(run_id, name or os.path.basename(pdf_path), pdf_path)
+        self.executor.submit(self._run, state)
+        return state
+
+    def _run(self, state):
+        state.status, state.gestartet = "läuft", time.time()
+        try:
+            context = self.runner.prepare_run(state.pdf_path)
+            state.supervisor = SupervisorAgent(state.pdf_path, context=context, step_executor=self.runner.step_executor)
+            state.result = state.supervisor.action()
+            state.status = self.runner.outcome_status(state.result)
+        except Exception as e:
+            # Fehler eines Laufs dürfen den Worker nicht beenden
+            state.status, state.result = "fehler", f"{type(e).__name__}: {e}"
+        state.beendet = time.time()
+
+    def resume_decided(self, queue=None):
+        # Geparkte Läufe mit inzwischen getroffener Freigabe-Entscheidung erneut einreihen
+        queue = queue or ApprovalQueue()
+        fortgesetzt = []
+        for item in queue.resumable():
+            if item["pdf_path"] and os.path.exists(item["pdf_path"]):
+                fortgesetzt.append(self.submit(item["pdf_path"]))
+            queue.mark_resumed(item["id"])
+        return fortgesetzt
+
+    def recover(self, store=None):
+        # Nach einem Neustart alle unterbrochenen Rechnungen aus den Checkpoints wieder einreihen
+        store = store or CheckpointStore()
+        return [
+            self.submit(eintrag["pdf_path"]) for eintrag in store.in_flight()
+            if eintrag["pdf_path"] and os.path.exists(eintrag["pdf_path"])
+        ]
+
+    def snapshot(self):
+        # Alle bekannten Läufe, neueste zuerst
+        with self._lock:
+            return sorted(self.runs.values(), key=lambda s: s.eingereicht, reverse=True)
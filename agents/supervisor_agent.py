@@ -1,65 +1,112 @@
 # supervisor_agent.py
-import json
 import re
-from langchain_ollama import OllamaLLM
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from agents.validation_agent import ValidationAgent
 from agents.accounting_agent import AccountingAgent
 from agents.approval_agent import ApprovalAgent
 from agents.booking_agent import BookingAgent
 from agents.check_agent import CheckAgent
 from agents.archive_agent import ArchiveAgent
-from config import RESULTS_PATH, OLLAMA_MODEL, WORKFLOW_STATUS_PATH, OLLAMA_BASE_URL
+from config import RESULTS_PATH, WORKFLOW_STATUS_PATH, CHECK_REVIEW_ROLE
+from utils.llm_client import get_llm, llm_cache_bypass
+from utils.approval_queue import ApprovalQueue, STATUS_OFFEN, STATUS_GENEHMIGT
+from utils.run_context import RunContext, default_workflow_status
+from utils.invoice_record import InvoiceRecord, parse_validation_table
+
+# Abhängigkeiten der Schritte: ein Schritt ist bereit, sobald alle Vorgänger abgeschlossen (2) sind.
+# Kontierung und sachliche Prüfung brauchen nur die Validierung und laufen parallel.
+STEP_DEPENDENCIES = {
+    "validation": [],
+    "accounting": ["validation"],
+    "check": ["validation"],
+    "approval": ["accounting", "check"],
+    "booking": ["approval"],
+    "archiving": ["booking"]
+}
+
+# Höchstens so viele Schritte einer Rechnung laufen gleichzeitig (Kontierung und sachliche Prüfung)
+MAX_PARALLEL_STEPS = max(
+    sum(1 for deps in STEP_DEPENDENCIES.values() if deps == gruppe) for gruppe in STEP_DEPENDENCIES.values()
+)
+
+# Ergebnis eines Laufs, der auf eine Entscheidung in der Freigabe-Warteschlange wartet
+WARTET = "Wartet auf Freigabe"
+
+# Ergebnis eines Laufs, dessen Schritt das Zeitlimit überschritten hat (nur asynchrone Pipeline); der Schritt
+# bleibt offen und wird beim nächsten Lauf fortgesetzt
+ZEITUEBERSCHREITUNG = "Zeitüberschreitung"
 
 class SupervisorAgent:
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, results_path=RESULTS_PATH, workflow_status_path=WORKFLOW_STATUS_PATH, context=None,
+                 approval_queue=None, step_executor=None):
         # LLM und Pfad speichern
-        self.llm = OllamaLLM(
-    model=OLLAMA_MODEL,
-    base_url=OLLAMA_BASE_URL
-)
+        self.llm = get_llm(agent="supervisor")
 
         self.pdf_path = pdf_path
 
-        # ValidationAgent vorbereiten
-        self.validation_agent = ValidationAgent(pdf_path)
-        self.results = {}
+        # Laufzustand im Speicher; wird nur an Schrittgrenzen auf die Platte geschrieben
+        self.context = context or RunContext.load(results_path, workflow_status_path, pdf_path=pdf_path)
+        self.results_path = self.context.results_path
+        self.workflow_status_path = self.context.workflow_status_path
+
+        # ValidationAgent erst bei Bedarf (ein fortgesetzter Lauf nach der Validierung liest die PDF nicht erneut)
+        self._validation_agent = None
+        self.results = self.context.results
+
+        # Workflow-Status (gleiches Objekt wie im RunContext)
+        self.workflow = self.context.workflow
+
+        # Menschliche Entscheidungen laufen über die Warteschlange statt über input()
+        self.approval_queue = approval_queue or ApprovalQueue()
 
-        # Workflow-Status laden
-        self.workflow = self.load_workflow_status()
+        # Thread-Pool für parallele Schritte; der BatchRunner teilt einen Pool über alle Rechnungen,
+        # sonst legt der Supervisor bei Bedarf einmalig einen eigenen an
+        self._step_executor = step_executor
 
-        # Reihenfolge der Agenten im Workflow
+        # Schritte, deren letztes Ergebnis mit "nein" bewertet wurde; ihr nächster Versuch umgeht den LLM-Cache
+        self.abgelehnt = set()
+
+        # Agenten des Workflows (Reihenfolge = Nummerierung im Workflow-Status, Ablauf über STEP_DEPENDENCIES)
         self.steps = [
             ("validation", lambda: self.validation_agent.run()),
-            ("accounting", lambda: AccountingAgent(RESULTS_PATH).action()),
-            ("check", lambda: CheckAgent(RESULTS_PATH).action()),
-            ("approval", lambda: ApprovalAgent(RESULTS_PATH).run()),
-            ("booking", lambda: BookingAgent(RESULTS_PATH).action()),
-            ("archiving", lambda: ArchiveAgent(RESULTS_PATH, self.pdf_path).action())
+            ("accounting", lambda: AccountingAgent(self.context).action()),
+            ("check", lambda: CheckAgent(self.context).action()),
+            ("approval", lambda: ApprovalAgent(self.context, self.approval_queue).run()),
+            ("booking", lambda: BookingAgent(self.context).action()),
+            ("archiving", lambda: ArchiveAgent(self.context, self.pdf_path).action())
         ]
 
-    def load_workflow_status(self):
-        # Lade aktuellen Status des Workflows (z. B. grün, gelb, rot)
-        with open(WORKFLOW_STATUS_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+    @property
+    def validation_agent(self):
+        if self._validation_agent is None:
+            self._validation_agent = ValidationAgent(self.pdf_path)
+        return self._validation_agent
+
+    @validation_agent.setter
+    def validation_agent(self, agent):
+        # Eigenen ValidationAgent einsetzen (z. B. anderer Extraktionsmodus im Benchmark)
+        self._validation_agent = agent
+
+    @property
+    def step_executor(self):
+        if self._step_executor is None:
+            self._step_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_STEPS)
+        return self._step_executor
+
+    @staticmethod
+    def default_workflow_status():
+        # Ausgangsstatus: alle sechs Schritte offen (0)
+        return default_workflow_status()
 
     def save_workflow_status(self):
-        # Speichere den Workflow-Status zurück ins JSON
-        with open(WORKFLOW_STATUS_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.workflow, f, indent=4)
+        # Schrittgrenze: Ergebnisse und Workflow-Status gemeinsam atomar sichern
+        self.context.checkpoint()
 
     def save_results(self, step, result):
-        # Zwischenergebnisse in results.json sichern
-        try:
-            with open(RESULTS_PATH, "r", encoding="utf-8") as f:
-                self.results = json.load(f)
-        except FileNotFoundError:
-            self.results = {}
-
+        # Zwischenergebnis nur im Speicher ablegen (persistiert wird an der Schrittgrenze)
         self.results[step] = result
 
-        with open(RESULTS_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.results, f, indent=4)
-
     def step_to_key(self, step_name):
         # Übersetzt Schrittname in Key des Workflow-Status
         mapping = {
@@ -74,15 +121,17 @@ class SupervisorAgent:
 
     def extract_missing_fields(self, validation_text: str) -> list:
         # Extrahiert alle Pflichtfelder (1–10), die fehlen oder auf "Nein" stehen
-        pattern = r"\|\s*(\d+\..*?)\s*\|\s*(Nein|Fehlt)\s*\|"
-        matches = re.findall(pattern, validation_text)
-        return [feld for feld, status in matches if feld.strip().startswith(tuple(f"{i}." for i in range(1, 11)))]
+        felder = parse_validation_table(validation_text)
+        return [
+            feld for nr, (feld, vorhanden, wert) in sorted(felder.items())
+            if 1 <= nr <= 10 and vorhanden in ("Nein", "Fehlt")
+        ]
 
     def rerun_validation_for_missing(self, fehlende_felder: list) -> str:
         # Führt den ValidationAgent gezielt nochmal aus mit nur den fehlenden Feldern
+        # (gleiche Instanz – der PDF-Text wird nicht erneut extrahiert)
         print("SupervisorAgent: Starte gezielte Nachprüfung im ValidationAgent.")
-        agent = ValidationAgent(self.pdf_path)
-        return agent.run(missing_fields=fehlende_felder)
+        return self.validation_agent.run(missing_fields=fehlende_felder)
 
     def merge_validation_results(self, original: str, improved: str) -> str:
         original_lines = original.splitlines()
@@ -103,34 +152,54 @@ class SupervisorAgent:
         return "\n".join(updated)
 
 
-    def think(self, agent_result, step):
-        # LLM-Evaluation: Prüfe, ob der Agent alles korrekt geliefert hat
-        prompt = (
+    def review_prompt(self, agent_result, step):
+        return (
             f"Du prüfst den Schritt '{step}'. Ergebnis: {agent_result}. "
             "Ist das Ergebnis vollständig und korrekt nach §14 UStG? Antworte nur mit 'ja' oder 'nein' "
             "und nenne, was fehlt, falls 'nein'."
         )
-        return self.llm.invoke(prompt).strip().lower()
+
+    def think(self, agent_result, step):
+        # LLM-Evaluation: Prüfe, ob der Agent alles korrekt geliefert hat
+        return self.llm.invoke(self.review_prompt(agent_result, step)).strip().lower()
+
+    def needs_review(self, step):
+        # Genehmigung, Kontierung und Prüfung haben eigene Nachlauf-Logik ohne LLM-Bewertung
+        return step not in ("approval", "accounting", "check")
+
+    def cache_scope(self, step):
+        # Nach negativer Bewertung neu erzeugen statt dieselbe Antwort aus dem Cache zu lesen
+        return llm_cache_bypass() if step in self.abgelehnt else nullcontext()
 
     def run_agent_and_validate(self, step, agent_fn):
         print(f"SupervisorAgent: Starte {step}-Agent.")
-        result = agent_fn()
+        with self.cache_scope(step):
+            result = agent_fn()
+
+            # Nachlauf-Logik: Validation mit Pflichtfeldprüfung
+            if step == "validation":
+                fehlende_felder = self.extract_missing_fields(result)
+                if fehlende_felder:
+                    print(f"SupervisorAgent: Fehlende Pflichtangaben erkannt: {fehlende_felder}")
+                    improved_result = self.rerun_validation_for_missing(fehlende_felder)
+                    result = self.merge_validation_results(result, improved_result)
+
+        review = self.think(result, step) if self.needs_review(step) else None
+        return self.complete_step(step, result, review)
+
+    def complete_step(self, step, result, review=None):
+        # Ergebnis übernehmen, Status setzen und an der Schrittgrenze sichern (review = LLM-Bewertung)
         self.save_results(step, result)
 
-        # Nachlauf-Logik: Validation mit Pflichtfeldprüfung
         if step == "validation":
-            fehlende_felder = self.extract_missing_fields(result)
-            if fehlende_felder:
-                print(f"SupervisorAgent: Fehlende Pflichtangaben erkannt: {fehlende_felder}")
-                improved_result = self.rerun_validation_for_missing(fehlende_felder)
-                result = self.merge_validation_results(result, improved_result)
-                self.save_results(step, result)
-
-        # Nachlauf-Logik: Genehmigung – falls verweigert → Workflowabbruch
+            # Tabelle einmal in einen typisierten Rechnungsdatensatz überführen (für alle Folge-Agenten)
+            self.save_results("invoice_record", InvoiceRecord.from_validation(result).to_dict())
+
+        # Nachlauf-Logik: Genehmigung – falls verweigert → Workflowabbruch, offen → Rechnung parkt
         if step == "approval":
-            with open(RESULTS_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if data.get("approval_status") == "verweigert":
+            if self.results.get("approval_status") == "wartend":
+                return self.park(step, f"Genehmigung - Rolle: {self.results.get('approval_rolle')}")
+            if self.results.get("approval_status") == "verweigert":
                 self.workflow[self.step_to_key(step)] = 3
                 self.save_workflow_status()
                 return "Abbruch durch Genehmigung."
@@ -145,11 +214,17 @@ class SupervisorAgent:
             self.save_workflow_status()
             return result
 
-        # CheckAgent: Bei "nicht nachvollziehbar" → Nutzer entscheidet
+        # CheckAgent: Bei "nicht nachvollziehbar" → CHECK_REVIEW_ROLE entscheidet über die Warteschlange
         if step == "check":
             if self.results.get("check") == "nicht_nachvollziehbar":
-                user_decision = input("Sachliche Prüfung nicht nachvollziehbar. Trotzdem fortfahren? (ja/nein): ").strip().lower()
-                if user_decision != "ja":
+                item = self.approval_queue.request(
+                    self.context, step, CHECK_REVIEW_ROLE,
+                    grund="Sachliche Prüfung nicht nachvollziehbar. Trotzdem fortfahren?"
+                )
+                self.save_results("check_freigabe_id", item["id"])
+                if item["status"] == STATUS_OFFEN:
+                    return self.park(step, f"Rückfrage zur sachlichen Prüfung - Rolle: {CHECK_REVIEW_ROLE}")
+                if item["status"] != STATUS_GENEHMIGT:
                     self.workflow[self.step_to_key(step)] = 3
                     self.save_workflow_status()
                     return "Abbruch durch Check."
@@ -163,40 +238,60 @@ class SupervisorAgent:
                 return result
 
         # Für alle übrigen Schritte: LLM evaluiert ob Ergebnis okay war
-        thought = self.think(result, step)
-        if "nein" in thought:
+        if review is not None and "nein" in review:
             self.workflow[self.step_to_key(step)] = 1
+            self.abgelehnt.add(step)
         else:
             self.workflow[self.step_to_key(step)] = 2
+            self.abgelehnt.discard(step)
 
         self.save_workflow_status()
         return result
 
+    def park(self, step, grund):
+        # Schritt bleibt "läuft" (1), bis die Entscheidung vorliegt; der Lauf wird danach fortgesetzt
+        self.workflow[self.step_to_key(step)] = 1
+        self.save_workflow_status()
+        print(f"SupervisorAgent: {WARTET} in Schritt '{step}' ({grund}).")
+        return f"{WARTET}: {grund}"
+
+    def ready_steps(self):
+        # Offene Schritte, deren Vorgänger alle abgeschlossen sind (in Workflow-Reihenfolge)
+        done = {step for step, _ in self.steps if self.workflow.get(self.step_to_key(step), 0) == 2}
+        return [
+            (step, agent_fn) for step, agent_fn in self.steps
+            if step not in done and all(dep in done for dep in STEP_DEPENDENCIES.get(step, []))
+        ]
+
     def next_step(self):
-        # Führt den nächsten fälligen Schritt im Workflow aus
+        # Führt alle aktuell bereiten Schritte aus (unabhängige Schritte parallel)
         if any(v == 3 for v in self.workflow.values()):
             return "Abbruch"
 
-        for i, (step, agent_fn) in enumerate(self.steps):
-            key = f"{i+1}_{step}"
-            status = self.workflow.get(key, 0)
-
-            if status == 2:
-                continue
-            if status == 3:
-                return "Abbruch"
+        bereit = self.ready_steps()
+        if not bereit:
+            return "Done"
 
+        for step, _ in bereit:
             print(f"SupervisorAgent: Ausführung von Schritt '{step}' begonnen.")
-            result = self.run_agent_and_validate(step, agent_fn)
-            if isinstance(result, str) and "Abbruch" in result:
-                return result
-            return f"Schritt '{step}' erfolgreich durchgeführt."
+        if len(bereit) == 1:
+            results = [self.run_agent_and_validate(*bereit[0])]
+        else:
+            results = list(self.step_executor.map(lambda s: self.run_agent_and_validate(*s), bereit))
 
-        return "Done"
+        abbruch = next((r for r in results if isinstance(r, str) and "Abbruch" in r), None)
+        if abbruch:
+            return abbruch
+        wartend = next((r for r in results if isinstance(r, str) and r.startswith(WARTET)), None)
+        if wartend:
+            return wartend
+        if len(bereit) == 1:
+            return f"Schritt '{bereit[0][0]}' erfolgreich durchgeführt."
+        return f"Schritte {', '.join(repr(step) for step, _ in bereit)} erfolgreich durchgeführt."
 
     def action(self):
-        # Hauptmethode: führt alle Schritte in Schleife aus, bis "Done" oder Fehler
+        # Hauptmethode: führt alle Schritte in Schleife aus, bis "Done", Abbruch oder Warten auf Freigabe
         while True:
             result = self.next_step()
-            if result == "Done" or "Abbruch" in result:
+            if result == "Done" or "Abbruch" in result or result.startswith(WARTET):
                 return result
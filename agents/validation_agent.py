@@ -1,45 +1,97 @@
+import itertools
+import json
 import re
 import pandas as pd
-from langchain_ollama import OllamaLLM
 from langchain.prompts import PromptTemplate
-from utils.pdf_parser import extract_text_from_pdf
-from config import OLLAMA_MODEL, OWN_COMPANY_FULL, OLLAMA_BASE_URL
+from utils.pdf_parser import iter_pdf_pages
+from utils.async_threads import to_thread
+from utils.invoice_record import parse_validation_table
+from config import OWN_COMPANY_FULL, VALIDATION_MODE, VALIDATION_HEADER_PAGES
+from utils.llm_client import get_llm
+
+# Liste aller Pflichtfelder gemäß §14 Abs. 4 UStG
+PFLICHTFELDER = [
+    "1. Name & Anschrift des leistenden Unternehmers",
+    "2. Name & Anschrift des Leistungsempfängers",
+    "3. Steuernummer des Unternehmers",
+    "4. Umsatzsteuer-ID des Unternehmers",
+    "5. Ausstellungsdatum",
+    "6. Fortlaufende Rechnungsnummer",
+    "7. Menge und Art der gelieferten Leistung",
+    "8. Zeitpunkt der Leistung oder Leistungszeitraum",
+    "9. Entgelt nach Steuersätzen aufgeschlüsselt",
+    "10. Steuersatz oder Hinweis auf Steuerbefreiung",
+    "11. Hinweis auf Aufbewahrungspflicht (§14b UStG)",
+    "12. Angabe „Gutschrift“ (falls zutreffend)"
+]
+
+# Erwartetes Format je Feld im strukturierten Modus (Spalte „Extrahierter Wert“)
+FELD_HINWEISE = {
+    1: "Nur Name und Anschrift",
+    2: "Nur Name und Anschrift",
+    3: "Nur die Steuernummer",
+    4: "Nur die Umsatzsteuer-ID",
+    5: "Datum",
+    6: "Rechnungsnummer",
+    7: "Aufzählung der Leistungen (kurz)",
+    8: "Zeitraum oder Datum",
+    9: "Nettobetrag, Steuerbetrag, Bruttobetrag (Gesamtbetrag = Netto + Steuer)",
+    10: "Steuersatz oder Hinweis",
+    11: "Exakt \"Hinweis vorhanden\" oder \"Fehlt\"",
+    12: "Exakt \"Gutschrift\" oder \"Fehlt\""
+}
+
+
+def feld_nummer(feld):
+    # Führende Feldnummer aus einer Pflichtangabe lesen, z. B. "6. Fortlaufende ..." → 6
+    match = re.match(r"\s*(\d+)\.", feld)
+    return int(match.group(1)) if match else None
+
 
 class ValidationAgent:
-    def __init__(self, pdf_path):
+    def __init__(self, pdf_path, mode=VALIDATION_MODE):
         # PDF-Pfad speichern
         self.pdf_path = pdf_path
 
-        # Text aus der PDF extrahieren
-        self.invoice_text = extract_text_from_pdf(pdf_path)
+        # "structured" = ein JSON-Aufruf für alle Felder, "legacy" = think() + action()
+        self.mode = mode
+
+        # Seitentexte werden gestreamt: die Kopfseiten liegen vor, während große PDFs
+        # im Hintergrund (Prozesspool) weiter extrahiert werden
+        self._pages = iter_pdf_pages(pdf_path)
+        self._page_texts = []
+        self.header_text()
 
         # Modellinstanz initialisieren
-        self.llm = OllamaLLM(
-    model=OLLAMA_MODEL,
-    base_url=OLLAMA_BASE_URL
-)
+        self.llm = get_llm(agent="validation")
+
+
+    def header_text(self, max_pages=VALIDATION_HEADER_PAGES):
+        # Text der ersten Seiten (Rechnungskopf) – wartet nicht auf das Ende des Dokuments
+        fehlend = max_pages - len(self._page_texts)
+        if fehlend > 0:
+            self._page_texts.extend(itertools.islice(self._pages, fehlend))
+        return "".join(self._page_texts[:max_pages])
+
+    def beyond_header(self, max_pages=VALIDATION_HEADER_PAGES):
+        # True, wenn auf die Kopfseiten weitere Seiten folgen (wartet nur auf die nächste Seite)
+        self.header_text(max_pages)
+        if len(self._page_texts) == max_pages:
+            self._page_texts.extend(itertools.islice(self._pages, 1))
+        return len(self._page_texts) > max_pages
 
+    @property
+    def invoice_text(self):
+        # Vollständiger Rechnungstext (restliche Seiten werden bei Bedarf abgewartet)
+        self._page_texts.extend(self._pages)
+        return "".join(self._page_texts)
 
     def goal(self):
         # Zieldefinition für Prompt
         return "Alle Pflichtangaben gemäß §14 UStG müssen vorhanden und korrekt extrahiert sein."
 
     def prompt(self, missing_fields=None):
-        # Liste aller Pflichtfelder gemäß §14 Abs. 4 UStG
-        full_table = [
-            "1. Name & Anschrift des leistenden Unternehmers",
-            "2. Name & Anschrift des Leistungsempfängers",
-            "3. Steuernummer des Unternehmers",
-            "4. Umsatzsteuer-ID des Unternehmers",
-            "5. Ausstellungsdatum",
-            "6. Fortlaufende Rechnungsnummer",
-            "7. Menge und Art der gelieferten Leistung",
-            "8. Zeitpunkt der Leistung oder Leistungszeitraum",
-            "9. Entgelt nach Steuersätzen aufgeschlüsselt",
-            "10. Steuersatz oder Hinweis auf Steuerbefreiung",
-            "11. Hinweis auf Aufbewahrungspflicht (§14b UStG)",
-            "12. Angabe „Gutschrift“ (falls zutreffend)"
-        ]
+        full_table = PFLICHTFELDER
 
         # Wenn fehlende Felder angegeben sind, nur diese verwenden
         if missing_fields:
@@ -103,7 +155,7 @@ Rechnungstext:
 {{invoice_text}}"""
         )
 
-    def think(self):
+    def think_prompt(self):
         # Prompt zur Beschreibung der nächsten Handlung erzeugen
         thought_prompt = PromptTemplate(
             input_variables=["invoice_text", "goal"],
@@ -118,26 +170,29 @@ Rechnungstext: {invoice_text}
 Antworte kurz und präzise mit einem Satz."""
         )
 
-        # Prompt ausfüllen und an LLM senden
-        formatted_thought_prompt = thought_prompt.format(
-            invoice_text=self.invoice_text,
+        # Prompt ausfüllen
+        return thought_prompt.format(
+            invoice_text=self.header_text(),
             goal=self.goal()
         )
 
-        agent_thoughts = self.llm.invoke(formatted_thought_prompt)
+    def think(self):
+        agent_thoughts = self.llm.invoke(self.think_prompt())
         print(f"ValidationAgent Think(): {agent_thoughts}")
         return agent_thoughts.strip()
 
-    def action(self, agent_thoughts, custom_prompt=None):
+    def action_prompt(self, agent_thoughts, custom_prompt=None):
         if custom_prompt:
-            formatted_prompt = custom_prompt
-        else:
-            formatted_prompt = self.prompt().format(
-                invoice_text=self.invoice_text,
-                agent_thoughts=agent_thoughts
-            )
+            return custom_prompt
+        return self.prompt().format(
+            invoice_text=self.invoice_text,
+            agent_thoughts=agent_thoughts
+        )
+
+    def action(self, agent_thoughts, custom_prompt=None):
+        return self.parse_table(self.llm.invoke(self.action_prompt(agent_thoughts, custom_prompt)))
 
-        result = self.llm.invoke(formatted_prompt)
+    def parse_table(self, result):
         print("ValidationAgent Raw Output:\n", result)
 
         # Nur gültige Markdown-Zeilen mit genau drei Spalten extrahieren
@@ -153,8 +208,138 @@ Antworte kurz und präzise mit einem Satz."""
         return clean_result
 
 
+    def structured_prompt(self, feldnummern, invoice_text):
+        # Kompakter Prompt für die JSON-Extraktion (nur die angefragten Felder)
+        felder = "\n".join(
+            f'- "{nr}": {PFLICHTFELDER[nr - 1]} – {FELD_HINWEISE[nr]}' for nr in feldnummern
+        )
+        return f"""Du bist ein KI-Agent zur präzisen Extraktion der Pflichtangaben einer Rechnung gemäß §14 UStG.
+
+Die eigene Firma ist IMMER der Leistungsempfänger (Feld 2): {OWN_COMPANY_FULL}
+Der leistende Unternehmer (Feld 1) ist der andere Name mit Anschrift.
+Für Feld 3/4 gilt: Steuernummer ODER USt-IdNr. genügt.
+Unterscheide streng zwischen Nettobetrag, Steuerbetrag und Bruttobetrag (Brutto = Netto + Steuer).
+
+Gib ausschließlich ein JSON-Objekt zurück. Schlüssel ist die Feldnummer, Wert ein Objekt
+{{"vorhanden": "Ja" oder "Nein", "wert": "<extrahierter Wert oder Fehlt>"}}.
+
+Felder:
+{felder}
+
+Rechnungstext:
+{invoice_text}"""
+
+    def json_schema(self, feldnummern):
+        # JSON-Schema für Ollamas strukturierte Ausgabe (format=...)
+        feld_schema = {
+            "type": "object",
+            "properties": {
+                "vorhanden": {"type": "string", "enum": ["Ja", "Nein"]},
+                "wert": {"type": "string"}
+            },
+            "required": ["vorhanden", "wert"]
+        }
+        return {
+            "type": "object",
+            "properties": {str(nr): feld_schema for nr in feldnummern},
+            "required": [str(nr) for nr in feldnummern]
+        }
+
+    def first_pass(self, feldnummern=None):
+        # (Feldnummern, nur Kopfseiten?) des ersten Aufrufs: ohne Vorgabe alle Felder über die Kopfseiten, damit
+        # das LLM nicht auf die Extraktion großer PDFs wartet; eine Nachprüfung einzelner Felder nutzt den Volltext
+        if feldnummern:
+            return feldnummern, False
+        return list(range(1, len(PFLICHTFELDER) + 1)), True
+
+    def fehlende_nummern(self, werte):
+        return [nr for nr, (vorhanden, _) in sorted(werte.items()) if vorhanden != "Ja"]
+
+    def extract_structured(self, feldnummern=None):
+        # Ein LLM-Aufruf mit JSON-Ausgabe; was in den Kopfseiten fehlt, wird einmal über den Volltext nachgefragt
+        feldnummern, kopf = self.first_pass(feldnummern)
+        text = self.header_text() if kopf else self.invoice_text
+        raw = self.llm.invoke(self.structured_prompt(feldnummern, text), format=self.json_schema(feldnummern))
+        werte = self.parse_structured(raw, feldnummern)
+
+        fehlend = self.fehlende_nummern(werte) if kopf else []
+        if fehlend and self.beyond_header():
+            raw = self.llm.invoke(self.structured_prompt(fehlend, self.invoice_text), format=self.json_schema(fehlend))
+            werte.update(self.parse_structured(raw, fehlend))
+        return werte
+
+    def parse_structured(self, raw, feldnummern):
+        # JSON-Antwort in {Feldnummer: (Vorhanden, Wert)} überführen
+        print("ValidationAgent Structured Output:\n", raw)
+
+        try:
+            data = json.loads(raw)
+        except (TypeError, json.JSONDecodeError):
+            raise ValueError("Keine gültige JSON-Antwort im Ergebnis gefunden.")
+
+        werte = {}
+        for nr in feldnummern:
+            eintrag = data.get(str(nr)) or {}
+            wert = " ".join(str(eintrag.get("wert", "")).split()).replace("|", "/") or "Fehlt"
+            vorhanden = "Ja" if eintrag.get("vorhanden") == "Ja" and wert != "Fehlt" else "Nein"
+            werte[nr] = (vorhanden, wert)
+        return werte
+
+    def to_markdown(self, werte):
+        # Strukturierte Werte im gewohnten Tabellenformat ausgeben (kompatibel zu den Folge-Agenten)
+        lines = [
+            "| Pflichtangabe | Vorhanden | Extrahierter Wert |",
+            "|---------------|-----------|-------------------|"
+        ]
+        for nr in sorted(werte):
+            vorhanden, wert = werte[nr]
+            lines.append(f"| {PFLICHTFELDER[nr - 1]} | {vorhanden} | {wert} |")
+        return "\n".join(lines)
+
+    def requested_fields(self, missing_fields=None):
+        # Feldnummern der Nachprüfung; None = alle Felder
+        if missing_fields:
+            return sorted({feld_nummer(f) for f in missing_fields} - {None})
+        return None
+
+    def run_structured(self, missing_fields=None):
+        # Strukturierter Modus: ohne think(); bei Nachprüfung nur die fehlenden Felder erneut anfragen
+        werte = self.extract_structured(self.requested_fields(missing_fields))
+        print("ValidationAgent Action(): Strukturierte Extraktion abgeschlossen.")
+        return self.to_markdown(werte)
+
+    async def arun(self, missing_fields=None):
+        # Asynchrone Variante von run(): Restseiten im Thread abwarten, LLM-Aufrufe ohne Blockade
+        if self.mode == "structured":
+            feldnummern, kopf = self.first_pass(self.requested_fields(missing_fields))
+            text = self.header_text() if kopf else await to_thread(lambda: self.invoice_text)
+            raw = await self.llm.ainvoke(self.structured_prompt(feldnummern, text), format=self.json_schema(feldnummern))
+            werte = self.parse_structured(raw, feldnummern)
+
+            fehlend = self.fehlende_nummern(werte) if kopf else []
+            if fehlend and await to_thread(self.beyond_header):
+                text = await to_thread(lambda: self.invoice_text)
+                raw = await self.llm.ainvoke(self.structured_prompt(fehlend, text), format=self.json_schema(fehlend))
+                werte.update(self.parse_structured(raw, fehlend))
+            print("ValidationAgent Action(): Strukturierte Extraktion abgeschlossen.")
+            return self.to_markdown(werte)
+
+        await to_thread(lambda: self.invoice_text)
+        thoughts = (await self.llm.ainvoke(self.think_prompt())).strip()
+        print(f"ValidationAgent Think(): {thoughts}")
+        custom_prompt = None
+        if missing_fields:
+            custom_prompt = self.prompt(missing_fields).format(
+                invoice_text=self.invoice_text,
+                agent_thoughts=thoughts
+            )
+        return self.parse_table(await self.llm.ainvoke(self.action_prompt(thoughts, custom_prompt)))
+
     def run(self, missing_fields=None):
         # Hauptmethode: Durchführung mit oder ohne gezielte Pflichtfelder
+        if self.mode == "structured":
+            return self.run_structured(missing_fields)
+
         thoughts = self.think()
         if missing_fields:
             prompt_template = self.prompt(missing_fields)
@@ -179,21 +364,11 @@ Antworte kurz und präzise mit einem Satz."""
         return self.action("User-ergänzte Eingabe", custom_prompt=user_input_prompt)
 
     def to_dataframe(self, markdown_table):
-        # Wandelt die extrahierte Tabelle in ein pandas DataFrame um
-        pattern = r"\|\s*(.*?)\s*\|\s*(.*?)\s*\|\s*(.*?)\s*\|"
-        matches = re.findall(pattern, markdown_table.replace("\n", ""))
+        # Wandelt die extrahierte Tabelle in ein pandas DataFrame um (gemeinsamer Tabellen-Parser)
+        felder = parse_validation_table(markdown_table)
 
-        if not matches or len(matches) < 3:
+        if len(felder) < 2:
             raise ValueError(f"Fehlerhafte Tabelle erkannt:\n{markdown_table}")
 
-        header = [col.strip() for col in matches[0]]
-        data_rows = [
-            [col.strip() for col in row]
-            for row in matches[1:]
-            if all(col.strip() for col in row) and len(row) == 3
-        ]
-
-        if any(len(row) != 3 for row in data_rows):
-            raise ValueError("Nicht alle Zeilen haben exakt 3 Spalten.")
-
-        return pd.DataFrame(data_rows, columns=header)
+        data_rows = [list(felder[nr]) for nr in sorted(felder)]
+        return pd.DataFrame(data_rows, columns=["Pflichtangabe", "Vorhanden", "Extrahierter Wert"])
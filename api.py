@@ -0,0 +1,127 @@
+# api.py – lokale HTTP-Schnittstelle zum Einreichen von Rechnungen (Mail-Eingang, Scanner)
+# Die API legt PDFs nur ab und reiht sie in die JobQueue ein; verarbeitet wird in agents/job_worker.py.
+# Aufruf: python api.py [--host 127.0.0.1] [--port 8503]
+#   POST /jobs               PDF als Body (application/pdf, Name per ?name=) oder multipart/form-data mit mehreren Dateien
+#   GET  /jobs[?status=…]    zuletzt eingereichte Aufträge
+#   GET  /jobs/<id>          Status eines Auftrags
+#   GET  /jobs/<id>/result   Schrittergebnisse (results.json) eines Auftrags
+#   GET  /stats              Aufträge je Status, Wartezeit vs. Bearbeitungszeit je Scheduler-Klasse
+import argparse
+import email.policy
+import json
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from config import API_HOST, API_PORT, API_MAX_UPLOAD_BYTES
+from utils.job_queue import JobQueue, store_pdf
+
+
+def parse_multipart(content_type, body):
+    # Alle Dateiteile eines multipart/form-data-Bodys als (Dateiname, Bytes)
+    nachricht = BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    return [
+        (teil.get_filename(), teil.get_payload(decode=True))
+        for teil in nachricht.iter_parts() if teil.get_filename()
+    ]
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    queue = None
+
+    def _send(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_view(self, job):
+        return {
+            "id": job["id"], "name": job["name"], "status": job["status"], "klasse": job.get("klasse"),
+            "result": job.get("result"),
+            "eingereicht": job["eingereicht"], "gestartet": job.get("gestartet"), "beendet": job.get("beendet"),
+            "dupliziert": job.get("dupliziert", False), "url": f"/jobs/{job['id']}"
+        }
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._send(HTTPStatus.NOT_FOUND, {"fehler": "Unbekannter Pfad"})
+
+        if not self.headers.get("Content-Length"):
+            return self._send(HTTPStatus.LENGTH_REQUIRED, {"fehler": "Content-Length fehlt"})
+        try:
+            laenge = int(self.headers["Content-Length"])
+        except ValueError:
+            laenge = -1
+        if laenge <= 0:
+            return self._send(HTTPStatus.BAD_REQUEST, {"fehler": "Ungültige Content-Length"})
+        if laenge > API_MAX_UPLOAD_BYTES:
+            return self._send(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"fehler": f"Maximal {API_MAX_UPLOAD_BYTES} Bytes"})
+        body = self.rfile.read(laenge)
+
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            dateien = parse_multipart(content_type, body)
+        else:
+            dateien = [(parse_qs(url.query).get("name", [None])[0], body)]
+
+        # Nur echte PDFs annehmen; der ganze Stapel wird abgewiesen, damit der Absender eindeutig neu senden kann
+        ungueltig = [name for name, daten in dateien if not daten or not daten.startswith(b"%PDF-")]
+        if not dateien or ungueltig:
+            return self._send(HTTPStatus.BAD_REQUEST, {"fehler": "Keine gültige PDF", "dateien": ungueltig})
+
+        jobs = self.queue.enqueue_many(
+            [(store_pdf(daten), name) for name, daten in dateien],
+            quelle=self.headers.get("X-Quelle") or self.client_address[0]
+        )
+        self._send(HTTPStatus.ACCEPTED, {"jobs": [self._job_view(job) for job in jobs]})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        teile = [teil for teil in url.path.split("/") if teil]
+
+        if teile == ["stats"]:
+            return self._send(HTTPStatus.OK, {"status": self.queue.stats(), "planung": self.queue.timing()})
+        if teile == ["jobs"]:
+            status = parse_qs(url.query).get("status", [None])[0]
+            return self._send(HTTPStatus.OK, {"jobs": [self._job_view(job) for job in self.queue.list(status)]})
+        if len(teile) in (2, 3) and teile[0] == "jobs":
+            job = self.queue.get(teile[1])
+            if job is None:
+                return self._send(HTTPStatus.NOT_FOUND, {"fehler": "Unbekannter Auftrag"})
+            if len(teile) == 2:
+                return self._send(HTTPStatus.OK, self._job_view(job))
+            if teile[2] == "result":
+                results = self.queue.results(job["id"])
+                if results is None:
+                    # Noch keine Ergebnisse: Status mitsenden, damit der Client weiter abfragen kann
+                    return self._send(HTTPStatus.ACCEPTED, self._job_view(job))
+                return self._send(HTTPStatus.OK, {**self._job_view(job), "results": results})
+        self._send(HTTPStatus.NOT_FOUND, {"fehler": "Unbekannter Pfad"})
+
+
+def make_server(host=API_HOST, port=API_PORT, queue=None):
+    # Ein Thread je Anfrage; Anfragen warten nur auf Dateiablage und SQLite, nie auf das LLM
+    IngestHandler.queue = queue or JobQueue()
+    server = ThreadingHTTPServer((host, port), IngestHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP-Schnittstelle zum Einreichen von Rechnungen")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Rechnungs-API läuft auf http://{args.host}:{args.port} (Worker: python -m agents.job_worker)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
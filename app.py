@@ -1,113 +1,134 @@
 # app.py – zentrale Streamlit-Oberfläche für den Rechnungsfreigabe-Workflow
+# Die Rechnungen laufen im Worker-Pool des RunManagers; die Seite zeigt nur deren Live-Status an.
 
-import streamlit as st
-from agents.supervisor_agent import SupervisorAgent
-from config import WORKFLOW_STATUS_PATH
-import tempfile
-import json
-import os
 import time
+import streamlit as st
+from agents.run_manager import RunManager
+from config import UI_REFRESH_S
+from utils.approval_queue import ApprovalQueue
 
 # Layout der Streamlit-App definieren (volle Breite)
 st.set_page_config(layout="wide")
 st.title("💼 Agentischer Workflow zur Rechnungsfreigabe")
 
-# === Initialstatus der Workflow-Schritte zurücksetzen ===
-def initialize_workflow_status():
-    default_status = {
-        "1_validation": 0,
-        "2_accounting": 0,
-        "3_check": 0,
-        "4_approval": 0,
-        "5_booking": 0,
-        "6_archiving": 0
-    }
-    os.makedirs(os.path.dirname(WORKFLOW_STATUS_PATH), exist_ok=True)
-    with open(WORKFLOW_STATUS_PATH, "w", encoding="utf-8") as f:
-        json.dump(default_status, f, indent=4)
-
-# results.json leeren (damit keine vorherigen Ergebnisse übernommen werden)
-def clear_results_json():
-    empty_data = {}
-    os.makedirs(os.path.dirname("data/results.json"), exist_ok=True)
-    with open("data/results.json", "w", encoding="utf-8") as f:
-        json.dump(empty_data, f, indent=4)
-
-# === Fortschrittsanzeige für die sechs Schritte rendern ===
-def render_status_bar(container):
-    with open(WORKFLOW_STATUS_PATH, "r", encoding="utf-8") as f:
-        status = json.load(f)
-
-    labels = {
-        "1_validation": "Validation",
-        "2_accounting": "Accounting",
-        "3_check": "Check",
-        "4_approval": "Approval",
-        "5_booking": "Booking",
-        "6_archiving": "Archiving"
-    }
-
-    # 0 = offen, 1 = läuft, 2 = abgeschlossen, 3 = abgebrochen
-    emoji = {0: "⚪", 1: "🟡", 2: "🟢", 3: "🔴"}
-
-    # Fortschrittsbalken anzeigen
-    with container:
-        bar = " → ".join(f"{emoji[status[k]]} {labels[k]}" for k in labels)
-        st.markdown(f"### 📊 Workflow-Fortschritt\n{bar}")
-
-    # Rückgabe: True, wenn alle Schritte Status 2 (abgeschlossen) haben
-    return all(v == 2 for v in status.values())
-
-# === Streamlit Session-Variablen initialisieren ===
-if "supervisor" not in st.session_state:
-    st.session_state.supervisor = None
-if "workflow_done" not in st.session_state:
-    st.session_state.workflow_done = False
-
-# === Rechnung (PDF) hochladen ===
-uploaded_pdf = st.file_uploader("Bitte Rechnung hochladen (PDF)", type="pdf")
-
-# Wenn Datei vorhanden → temporär speichern + Workflow starten
-if uploaded_pdf:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(uploaded_pdf.getbuffer())
-        tmp_pdf_path = tmp_file.name
-
-    # SupervisorAgent nur einmal instanziieren
-    if st.session_state.supervisor is None:
-        initialize_workflow_status()
-        clear_results_json()
-        st.session_state.supervisor = SupervisorAgent(tmp_pdf_path)
-
-    # Fortschrittsbalken rendern
-    status_container = st.empty()
-    render_status_bar(status_container)
-
-    # Workflow starten, wenn noch nicht abgeschlossen
-    if not st.session_state.workflow_done:
-        st.info("⚙️ Workflow wird automatisch gestartet...")
-        while True:
-            step_result = st.session_state.supervisor.next_step()
-            render_status_bar(status_container)
-            time.sleep(1.5)  # kurze Pause für visuelle Nachvollziehbarkeit
-
-            if step_result == "Done":
-                st.session_state.workflow_done = True
-                st.success("✅ Workflow erfolgreich abgeschlossen!")
-                break
-            elif "Abbruch" in step_result:
-                st.session_state.workflow_done = True
-                st.error(f"⛔ {step_result}")
-                break
-            else:
-                st.info(f"ℹ️ {step_result}")
-
-    else:
-        st.success("✅ Workflow vollständig abgeschlossen.")
-
-    # === Ergebnisse am Ende anzeigen ===
-    if st.session_state.workflow_done:
-        st.markdown("### 🧾 Ergebnisse aus results.json")
-        with open("data/results.json", "r", encoding="utf-8") as f:
-            results = json.load(f)
-        st.json(results, expanded=True)
+LABELS = {
+    "1_validation": "Validation",
+    "2_accounting": "Accounting",
+    "3_check": "Check",
+    "4_approval": "Approval",
+    "5_booking": "Booking",
+    "6_archiving": "Archiving"
+}
+
+# 0 = offen, 1 = läuft/wartend, 2 = abgeschlossen, 3 = abgebrochen
+EMOJI = {0: "⚪", 1: "🟡", 2: "🟢", 3: "🔴"}
+
+LAUF_EMOJI = {
+    "eingereiht": "⏳", "läuft": "⚙️", "abgeschlossen": "✅", "wartend": "🕒", "abgebrochen": "⛔", "fehler": "❗"
+}
+
+
+# === Ein Worker-Pool je Server-Prozess, geteilt von allen Sitzungen ===
+@st.cache_resource
+def get_run_manager():
+    manager = RunManager()
+    # Nach einem Neustart unterbrochene Rechnungen automatisch wieder aufnehmen
+    manager.recover()
+    return manager
+
+
+manager = get_run_manager()
+
+if "eingereicht" not in st.session_state:
+    st.session_state.eingereicht = set()
+
+
+# === Fortschrittsanzeige für die sechs Schritte eines Laufs ===
+def status_bar(state):
+    status = state.workflow()
+    aktiv = set(state.aktive_schritte())
+    return " → ".join(
+        f"{EMOJI[1] if step.split('_', 1)[1] in aktiv else EMOJI[status[step]]} {label}"
+        for step, label in LABELS.items()
+    )
+
+
+# === Offene Freigaben (Warteschlange) in der Seitenleiste entscheiden ===
+def render_approval_queue():
+    queue = ApprovalQueue()
+    st.sidebar.markdown("### 🕒 Offene Freigaben")
+    rollen = ["Alle"] + sorted({item["rolle"] for item in queue.pending()})
+    rolle = st.sidebar.selectbox("Rolle", rollen)
+    offen = queue.pending(rolle=None if rolle == "Alle" else rolle)
+    if not offen:
+        st.sidebar.info("Keine offenen Freigaben.")
+        return
+
+    for item in offen:
+        st.sidebar.markdown(
+            f"**#{item['id']}** {item['rechnungsnummer'] or '–'} · {item['lieferant'] or '–'} · "
+            f"{item['brutto'] or 0:.2f} € · {item['rolle']}<br>{item['grund']}",
+            unsafe_allow_html=True
+        )
+
+    username = st.sidebar.text_input("Benutzername")
+    password = st.sidebar.text_input("Passwort", type="password")
+    auswahl = st.sidebar.multiselect("Einträge", [item["id"] for item in offen])
+    col_ja, col_nein = st.sidebar.columns(2)
+    genehmigen = col_ja.button("Genehmigen")
+    ablehnen = col_nein.button("Ablehnen")
+    if genehmigen or ablehnen:
+        entschieden = [i for i in auswahl if queue.decide(i, genehmigen, username, password)]
+        if entschieden:
+            st.sidebar.success(f"Entschieden: {entschieden}")
+            # Geparkte Läufe mit Entscheidung wieder in den Worker-Pool geben
+            manager.resume_decided(queue)
+        else:
+            st.sidebar.error("Keine Berechtigung für die gewählten Einträge.")
+
+
+render_approval_queue()
+
+# === Rechnungen (PDF) hochladen → Worker-Pool ===
+uploaded_pdfs = st.file_uploader("Bitte Rechnungen hochladen (PDF)", type="pdf", accept_multiple_files=True)
+
+# Jede Datei nur einmal je Sitzung einreihen (Streamlit führt das Skript bei jeder Interaktion erneut aus)
+for uploaded_pdf in uploaded_pdfs or []:
+    if uploaded_pdf.file_id not in st.session_state.eingereicht:
+        manager.submit_bytes(uploaded_pdf.getvalue(), uploaded_pdf.name)
+        st.session_state.eingereicht.add(uploaded_pdf.file_id)
+
+
+# === Laufübersicht: wird im Hintergrund neu gezeichnet, ohne das übrige Skript auszuführen ===
+@st.fragment(run_every=UI_REFRESH_S)
+def render_runs():
+    runs = manager.snapshot()
+    st.markdown("### 📊 Workflow-Fortschritt")
+    if not runs:
+        st.info("Noch keine Rechnungen hochgeladen.")
+        return
+
+    zaehler = {}
+    for state in runs:
+        zaehler[state.status] = zaehler.get(state.status, 0) + 1
+    st.caption(" · ".join(f"{LAUF_EMOJI[status]} {status}: {anzahl}" for status, anzahl in zaehler.items()))
+
+    jetzt = time.time()
+    for state in runs:
+        dauer = (state.beendet or jetzt) - (state.gestartet or jetzt)
+        st.markdown(
+            f"{LAUF_EMOJI[state.status]} **{state.name}** · {state.status} · {dauer:.0f} s<br>{status_bar(state)}",
+            unsafe_allow_html=True
+        )
+        if state.result and state.status != "abgeschlossen":
+            st.caption(state.result)
+
+    # === Ergebnisse eines Laufs anzeigen ===
+    namen = {state.run_id: state.name for state in runs}
+    auswahl = st.selectbox("Ergebnisse anzeigen", list(namen), format_func=namen.get)
+    gewaehlt = manager.runs.get(auswahl)
+    if gewaehlt is not None:
+        st.json(gewaehlt.results(), expanded=False)
+
+
+render_runs()
@@ -1,4 +1,5 @@
 # config.py – zentrale Konfigurationsdatei für Pfade, Rollen, Schwellenwerte und Modelle
+import os
 
 # === Eigene Unternehmensdaten ===
 OWN_COMPANY_NAME = "Karbo-Power UG"
@@ -8,23 +9,108 @@ OWN_COMPANY_FULL = f"{OWN_COMPANY_NAME}, {OWN_COMPANY_ADDRESS}"
 
 # === Archivverzeichnis für Ergebnisse und Originalrechnungen ===
 ARCHIVE_DIR = "archive"
+ARCHIVE_BLOB_DIR = "archive/blobs"                         # Inhaltsadressierte Ablage (SHA-256) für PDFs und Ergebnisse
+ARCHIVE_BLOB_PLACEMENT = ("reflink", "copy")               # Reihenfolge der Ablageverfahren für PDFs
+ARCHIVE_BLOB_COMPRESS = True                               # results.json mit zstd komprimieren (falls "zstandard" installiert)
+ARCHIVE_STORE_BACKEND = "segments"                         # "segments" (große Segmentdateien) oder "blobs" (eine Datei je Inhalt)
+ARCHIVE_SEGMENT_DIR = "archive/segments"                   # Segmentdateien + Offset-Index (index.db)
+ARCHIVE_SEGMENT_MAX_BYTES = 1024 ** 3                      # Danach wird das Segment versiegelt und ein neues begonnen
+ARCHIVE_SEGMENT_FSYNC = True                               # Jeden Datensatz vor dem Indexeintrag auf die Platte bringen
+ARCHIVE_RETENTION_YEARS = 10                               # Aufbewahrungsfrist (GoBD) je Datensatz
 
 # === Wichtige Datenpfade (JSON, SQLite etc.) ===
 RESULTS_PATH = "data/results.json"                         # Zwischenergebnisse der Agenten
 ARCHIVE_DB_PATH = "data/archive.db"                        # SQLite-Datenbank zur Archivprüfung
+SQLITE_BUSY_TIMEOUT_MS = 30000                             # Wartezeit bei gesperrter Datenbank (parallele Worker)
+SQLITE_STATEMENT_CACHE = 256                               # Vorbereitete Statements je Verbindung
+ARCHIVE_BLOOM_PATH = "data/cache/archive_bloom.bin"        # Snapshot des Bloom-Filters über alle Archivschlüssel
+ARCHIVE_BLOOM_ERROR_RATE = 0.001                           # Gewünschte Falsch-positiv-Rate
+ARCHIVE_BLOOM_MIN_CAPACITY = 100000                        # Mindestgröße; wächst mit dem Archiv
+ARCHIVE_BLOOM_REFRESH_S = 5                                # Neue Zeilen anderer Prozesse spätestens nach n Sekunden nachladen
 INVOICE_FOLDER = "data/invoices/"                          # Optionaler Speicherort für PDF-Dateien
 ARCHIVE_FOLDER = "archive/"                                # Zielordner für archivierte Rechnungen
 REFERENCE_DATA_PATH = "data/known_transactions.json"       # Referenzdaten für CheckAgent
+REFERENCE_STORE_BACKEND = "memory"                         # "memory" oder "sqlite" (große ERP-Exporte)
+REFERENCE_DB_PATH = "data/cache/reference.db"              # Indizierte Kopie der Referenzdaten (Backend "sqlite")
+MATCH_ACCEPT_SCORE = 0.85                                  # Ab diesem Abgleich-Score sachlich korrekt ohne LLM
+MATCH_REJECT_SCORE = 0.4                                   # Darunter nicht nachvollziehbar ohne LLM; dazwischen fragt das LLM
+CHECK_CANDIDATES_K = 5                                     # Ähnlichste Referenzen, wenn die Rechnungsnummer nicht exakt passt
+CANDIDATE_POOL_SIZE = 50                                   # Höchstzahl Kandidaten je Index vor der Bewertung
+CANDIDATE_AMOUNT_RANGE = 0.01                              # Betragsfenster ±1 % um den Bruttobetrag
+CANDIDATE_NUMBER_MIN = 0.8                                 # Mindestähnlichkeit der Nummer für automatische Übernahme
+
+# === Kostenstellen-Klassifikation (AccountingAgent) ===
+COST_CENTER_MIN_CONFIDENCE = 0.6                           # Darunter entscheidet das LLM
+COST_CENTER_VECTOR_MODEL = True                            # Zweite Stufe: aus dem Archiv gelerntes Vektormodell
+COST_CENTER_VECTOR_MIN_EXAMPLES = 20                       # Mindestanzahl archivierter Zuordnungen für das Vektormodell
 CREDENTIALS_PATH = "data/credentials.json"                 # Zugangsdaten für ApprovalAgent
+PDF_TEXT_CACHE_DIR = "data/cache/pdf_text/"                # Extrahierter PDF-Text je Datei-Hash
+PDF_PARALLEL_MIN_PAGES = 100                               # Ab so vielen Seiten: Prozesspool (darunter sequentiell schneller)
+PDF_PARALLEL_WORKERS = os.cpu_count() or 1                 # Anzahl Worker-Prozesse für die PDF-Extraktion
 WORKFLOW_STATUS_PATH = "data/workflow_status.json"         # Status-Tracking der Agenten (Streamlit)
 
+# === Batch-Betrieb (Posteingang INVOICE_FOLDER) ===
+BATCH_RUN_DIR = "data/runs/"                               # Isolierter Laufzustand je Rechnung
+BATCH_MAX_WORKERS = 4                                      # Anzahl parallel verarbeiteter Rechnungen
+CHECKPOINT_DB_PATH = "data/checkpoints.db"                 # Checkpoints je Rechnung (PDF-Hash) für die Wiederaufnahme
+
+# === Streamlit-Oberfläche (app.py, agents/run_manager.py) ===
+UPLOAD_DIR = "data/uploads/"                               # Hochgeladene PDFs, abgelegt unter ihrem SHA-256
+UI_REFRESH_S = 1.0                                         # Sekunden zwischen zwei Aktualisierungen der Laufübersicht
+
+# === HTTP-Eingang und Auftragswarteschlange (api.py, utils/job_queue.py, agents/job_worker.py) ===
+API_HOST = "127.0.0.1"                                     # Nur lokal erreichbar (Mail-Eingang, Scanner)
+API_PORT = 8503
+API_MAX_UPLOAD_BYTES = 50 * 1024 * 1024                    # Maximale Größe einer Anfrage (auch Multipart-Stapel)
+JOB_QUEUE_DB_PATH = "data/jobs.db"
+JOB_LEASE_S = 900                                          # Ohne Lebenszeichen des Workers wird ein Auftrag neu vergeben
+JOB_POLL_S = 0.5                                           # Wartezeit eines untätigen Workers bis zur nächsten Abfrage
+JOB_WORKER_PROCESSES = 2                                   # Worker-Prozesse (je BATCH_MAX_WORKERS Rechnungen)
+JOB_PLAN_BATCH = 20                                        # Aufträge, die ein Worker je Durchgang vorab einstuft
+
+# === Reihenfolge der Verarbeitung (utils/scheduler.py) ===
+SCHEDULER_DEADLINE_DAYS = 5                                # Zahlungs-/Skontofrist in höchstens so vielen Tagen → Klasse "frist"
+SCHEDULER_MAX_WAIT_S = 3600                                # Danach rückt eine wartende Rechnung vor alle Klassen
+SCHEDULER_SUPPLIER_WEIGHTS = {}                            # Lieferantenname (klein, ohne Rechtsform) → Gewicht, Standard 1
+
+# === Asynchrone Pipeline (agents/async_engine.py) ===
+ASYNC_MAX_INVOICES = 32                                    # Rechnungen gleichzeitig auf einer Event-Loop
+ASYNC_STEP_TIMEOUT_DEFAULT = 600                           # Sekunden je Schritt
+ASYNC_STEP_TIMEOUTS = {                                    # Abweichende Zeitlimits; None = ohne Limit
+    "validation": 900
+}
+
 # === Rollenzuweisungen für Genehmigungsschritte ===
 TEAMLEITER_ROLE = "Teamleiter"
 ABTEILUNGSLEITER_ROLE = "Abteilungsleiter"
+MANAGER_ROLE = "Manager"
+CHECK_REVIEW_ROLE = TEAMLEITER_ROLE                        # Entscheidet bei nicht nachvollziehbarer sachlicher Prüfung
+
+# === Warteschlange für menschliche Entscheidungen (utils/approval_queue.py) ===
+APPROVAL_QUEUE_DB_PATH = "data/approval_queue.db"
 
 # === Genutztes LLM-Modell über Ollama (lokal) ===
 OLLAMA_MODEL = "mistral"
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")   # z. B. auf lokalen Stub-Server umbiegbar
+
+# === Geteilter LLM-Client (utils/llm_client.py) ===
+OLLAMA_KEEP_ALIVE = "30m"                                  # Modell bleibt zwischen Anfragen im Speicher
+OLLAMA_MAX_CONCURRENT_REQUESTS = 4                         # Gleichzeitige Anfragen je Backend
+OLLAMA_POOL_CONNECTIONS = 8                                # HTTP-Keep-Alive-Verbindungen je Client
+OLLAMA_TIMEOUT = 300                                       # Sekunden je Anfrage
+
+# === Cache für LLM-Antworten (utils/llm_cache.py) ===
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = "data/llm_cache.db"
+LLM_CACHE_TTL = 7 * 24 * 3600                              # Sekunden, bis ein Eintrag verfällt
+LLM_CACHE_MAX_ENTRIES = 10000                              # Danach werden die ältesten Zugriffe verdrängt
+LLM_CACHE_OPT_OUT = ["supervisor"]                         # Agenten ohne Cache (Bewertungen sollen neu entstehen)
+
+# === Extraktionsmodus des ValidationAgent ===
+# "structured": ein JSON-Aufruf für alle Pflichtfelder, Nachfrage nur für fehlende Felder
+# "legacy": think() + Markdown-Tabelle in action()
+VALIDATION_MODE = "structured"
+VALIDATION_HEADER_PAGES = 2                                # Kopfseiten für think() und den ersten JSON-Aufruf
 
 
 # === Schwellenwerte für Genehmigungsrollen (brutto) ===
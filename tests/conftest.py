@@ -0,0 +1,24 @@
+# conftest.py – gemeinsame Fixtures: jeder Test arbeitet in einem eigenen, leeren Arbeitsverzeichnis
+import os
+import pytest
+from utils.db import close_all
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # Relative Pfade aus config.py (data/…, archive/…) zeigen in das temporäre Verzeichnis
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    yield tmp_path
+    # Geteilte SQLite-Verbindungen schließen, damit der nächste Test seine eigenen Dateien öffnet
+    close_all()
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    # PDF-Datei mit eindeutigem Inhalt (für Hash-Schlüssel genügt ein minimaler Rumpf)
+    def make(name, inhalt=None):
+        pfad = tmp_path / name
+        pfad.write_bytes(b"%PDF-1.4\n" + (inhalt or name).encode() + b"\n%%EOF\n")
+        return str(pfad)
+    return make
@@ -0,0 +1,82 @@
+# test_amount_parser.py – Beträge aus Feld 9 und Entscheidung, ob der Bruttobetrag ohne LLM genutzt wird
+from decimal import Decimal
+import pytest
+from utils.amount_parser import AmbiguousAmountError, extract_amounts, parse_amount
+from utils.invoice_record import InvoiceRecord
+
+
+@pytest.mark.parametrize("text, erwartet", [
+    ("2.915,50 €", "2915.50"),
+    ("2,915.50", "2915.50"),
+    ("2915.5", "2915.5"),
+    ("1'234.00", "1234.00"),
+    ("1.234.567", "1234567"),
+    ("-12,00", "-12.00"),
+])
+def test_parse_amount_formats(text, erwartet):
+    assert parse_amount(text) == Decimal(erwartet)
+
+
+def test_parse_amount_ambiguous_separator_needs_locale():
+    with pytest.raises(AmbiguousAmountError):
+        parse_amount("1.234")
+    assert parse_amount("1.234", locale="de") == Decimal("1234")
+    assert parse_amount("1.234", locale="en") == Decimal("1.234")
+
+
+def test_consistent_breakdown_is_unambiguous():
+    betraege = extract_amounts(
+        "Nettobetrag: 2.450,00 €, Steuerbetrag (7%): 0,00 €, Steuerbetrag (19%): 465,50 €, Gesamtbetrag: 2.915,50 €"
+    )
+    assert (betraege.netto, betraege.steuer, betraege.brutto) == (Decimal("2450.00"), Decimal("465.50"), Decimal("2915.50"))
+    assert betraege.konsistent is True and betraege.eindeutig
+
+
+def test_english_breakdown():
+    betraege = extract_amounts("2,450.00 EUR (subtotal), 465.50 EUR (VAT), 2,915.50 EUR (total)")
+    assert betraege.netto == Decimal("2450.00") and betraege.brutto == Decimal("2915.50")
+    assert betraege.eindeutig
+
+
+def test_qualifier_does_not_count_as_own_amount():
+    betraege = extract_amounts("Gesamtbetrag inkl. 19% MwSt: 2.915,50 €")
+    assert betraege.brutto == Decimal("2915.50") and betraege.eindeutig
+
+
+@pytest.mark.parametrize("text", [
+    "Bruttobetrag 2.915,50 € inkl. 465,50 € MwSt",
+    "2.915,50 € brutto (2.450,00 € netto)",
+])
+def test_several_amounts_in_one_segment_go_to_llm(text):
+    betraege = extract_amounts(text)
+    assert betraege.mehrdeutig and not betraege.eindeutig
+
+
+def test_unchecked_pair_goes_to_llm():
+    # Brutto und Netto ohne Steuer: Summenprobe nicht möglich
+    betraege = extract_amounts("Netto: 2.450,00 €; Brutto: 2.915,50 €")
+    assert betraege.konsistent is None and not betraege.eindeutig
+
+
+def test_inconsistent_breakdown_goes_to_llm():
+    betraege = extract_amounts("Netto: 2.450,00 €; MwSt: 465,50 €; Gesamt: 2.900,00 €")
+    assert betraege.konsistent is False and not betraege.eindeutig
+
+
+def test_ambiguous_separator_resolved_by_sum_check():
+    betraege = extract_amounts("Netto: 1.000; MwSt: 190; Brutto: 1.190")
+    assert betraege.brutto == Decimal("1190") and betraege.eindeutig
+
+
+def test_record_asks_llm_only_when_not_unambiguous():
+    aufrufe = []
+
+    def llm():
+        aufrufe.append(1)
+        return "2915.50"
+
+    record = InvoiceRecord(brutto=Decimal("465.50"), betrag_eindeutig=False)
+    assert record.brutto_mit_fallback(llm) == Decimal("2915.50") and aufrufe
+    record = InvoiceRecord(brutto=Decimal("2915.50"), betrag_eindeutig=True)
+    aufrufe.clear()
+    assert record.brutto_mit_fallback(llm) == Decimal("2915.50") and not aufrufe
@@ -0,0 +1,77 @@
+# test_approval_queue.py – Freigabe-Warteschlange: Anfrage je Vorgang, Rollenprüfung, Sammelfreigabe
+import json
+from decimal import Decimal
+import pytest
+from utils.approval_queue import ApprovalQueue, STATUS_GENEHMIGT, STATUS_OFFEN, STATUS_VERWEIGERT
+from utils.invoice_record import InvoiceRecord
+from utils.run_context import RunContext
+
+
+@pytest.fixture(autouse=True)
+def credentials(workdir):
+    with open("data/credentials.json", "w", encoding="utf-8") as f:
+        json.dump({"users": [
+            {"username": "teamleiter", "password": "secure456", "role": "Teamleiter"},
+            {"username": "abteilungsleiter", "password": "secure789", "role": "Abteilungsleiter"}
+        ]}, f)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return ApprovalQueue(str(tmp_path / "approvals.db"))
+
+
+def _request(queue, tmp_path, make_pdf, name, rolle="Teamleiter", lieferant="Karbo-Power UG", brutto="2915.50"):
+    context = RunContext.load(str(tmp_path / name / "results.json"), None, pdf_path=make_pdf(f"{name}.pdf"))
+    context.set("invoice_record", InvoiceRecord(lieferant=lieferant, brutto=Decimal(brutto)).to_dict())
+    return queue.request(context, "approval", rolle, grund="Genehmigung")
+
+
+def test_same_invoice_gets_one_entry(queue, tmp_path, make_pdf):
+    erste = _request(queue, tmp_path, make_pdf, "a")
+    assert _request(queue, tmp_path, make_pdf, "a")["id"] == erste["id"]
+    assert erste["status"] == STATUS_OFFEN and erste["brutto"] == 2915.5
+    assert len(queue.pending()) == 1
+
+
+def test_decision_needs_credentials_of_requested_role(queue, tmp_path, make_pdf):
+    item = _request(queue, tmp_path, make_pdf, "a")
+    assert not queue.decide(item["id"], True, "abteilungsleiter", "secure789")
+    assert not queue.decide(item["id"], True, "teamleiter", "falsch")
+    assert queue.get(item["id"])["status"] == STATUS_OFFEN
+
+    assert queue.decide(item["id"], False, "teamleiter", "secure456", kommentar="Betrag unklar")
+    entschieden = queue.get(item["id"])
+    assert entschieden["status"] == STATUS_VERWEIGERT and entschieden["entschieden_von"] == "teamleiter"
+    # Bereits entschieden: keine zweite Entscheidung
+    assert not queue.decide(item["id"], True, "teamleiter", "secure456")
+
+
+def test_bulk_approve_only_own_role(queue, tmp_path, make_pdf):
+    _request(queue, tmp_path, make_pdf, "a")
+    _request(queue, tmp_path, make_pdf, "b", lieferant="Bürobedarf Müller", brutto="89.90")
+    fremd = _request(queue, tmp_path, make_pdf, "c", rolle="Abteilungsleiter", brutto="9000.00")
+
+    assert queue.bulk_approve("Teamleiter", "teamleiter", "falsch") == 0
+    assert queue.bulk_approve("Abteilungsleiter", "teamleiter", "secure456") == 0
+    assert queue.bulk_approve("Teamleiter", "teamleiter", "secure456") == 2
+
+    assert queue.get(fremd["id"])["status"] == STATUS_OFFEN
+    assert {item["status"] for item in queue.list(None, rolle="Teamleiter")} == {STATUS_GENEHMIGT}
+    assert [item["id"] for item in queue.resumable()] == [1, 2]
+
+
+def test_bulk_approve_with_filter(queue, tmp_path, make_pdf):
+    _request(queue, tmp_path, make_pdf, "a")
+    klein = _request(queue, tmp_path, make_pdf, "b", lieferant="Bürobedarf Müller", brutto="89.90")
+    assert queue.bulk_approve("Teamleiter", "teamleiter", "secure456", max_brutto=100) == 1
+    assert queue.get(klein["id"])["status"] == STATUS_GENEHMIGT
+    assert [item["lieferant"] for item in queue.pending()] == ["Karbo-Power UG"]
+
+
+def test_resumed_entries_are_not_listed_again(queue, tmp_path, make_pdf):
+    item = _request(queue, tmp_path, make_pdf, "a")
+    queue.decide(item["id"], True, "teamleiter", "secure456")
+    queue.mark_resumed(item["id"])
+    assert queue.resumable() == []
+    assert queue.stats() == {STATUS_GENEHMIGT: {"Teamleiter": 1}}
@@ -0,0 +1,50 @@
+# test_archive_db.py – atomare Archivierung (claim) mit eindeutigem Rechnungsschlüssel
+import threading
+import pytest
+from utils import archive_db
+from utils.db import get_connection, transaction
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    pfad = str(tmp_path / "archive.db")
+    archive_db.migrate(pfad)
+    return pfad
+
+
+def _claim(pfad, lieferant, rechnungsnummer):
+    with transaction(pfad) as conn:
+        return archive_db.claim(conn, lieferant, rechnungsnummer, "01.01.2019", "archiv/x", db_path=pfad)
+
+
+def test_claim_rejects_same_invoice_in_other_spelling(archive_path):
+    assert _claim(archive_path, "Falling Consult GmbH, Südviertel 2", "R-1321321")
+    assert not _claim(archive_path, "falling consult", "R 1321321")
+    assert archive_db.is_archived("Falling Consult", "R-1321321", db_path=archive_path)
+    assert _claim(archive_path, "Falling Consult", "R-1321322")
+
+
+def test_concurrent_claims_archive_once(archive_path):
+    ergebnisse = []
+    start = threading.Barrier(8)
+
+    def worker():
+        start.wait()
+        ergebnisse.append(_claim(archive_path, "Falling Consult GmbH", "R-1321321"))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(ergebnisse) == [False] * 7 + [True]
+    assert get_connection(archive_path).execute("SELECT COUNT(*) FROM archive").fetchone()[0] == 1
+
+
+def test_invoice_without_number_is_never_a_duplicate(archive_path):
+    # Ohne Rechnungsnummer kein Schlüssel: weder Dublette noch Sperre für weitere Rechnungen des Lieferanten
+    assert archive_db.invoice_key("Falling Consult", None) is None
+    assert _claim(archive_path, "Falling Consult", None)
+    assert _claim(archive_path, "Falling Consult", None)
+    assert not archive_db.is_archived("Falling Consult", None, db_path=archive_path)
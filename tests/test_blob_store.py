@@ -0,0 +1,71 @@
+# test_blob_store.py – inhaltsadressierte Archivablage: Deduplizierung, Unabhängigkeit von der Quelle, Übernahme
+import json
+import os
+import pytest
+from utils import archive_db, blob_store
+from utils.blob_store import BlobStore
+from utils.db import get_connection, transaction
+from utils.hashing import sha256_file
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def test_same_pdf_is_stored_once(store, make_pdf):
+    erste = store.put_file(make_pdf("a.pdf", "Rechnung 1"))
+    zweite = store.put_file(make_pdf("b.pdf", "Rechnung 1"))
+    assert erste == zweite == sha256_file(store.path(erste))
+    assert store.stats()["blobs"] == 1
+
+
+def test_archived_pdf_does_not_follow_later_changes_of_source(store, make_pdf):
+    quelle = make_pdf("upload.pdf", "Original")
+    digest = store.put_file(quelle)
+    with open(quelle, "ab") as f:
+        f.write(b"nachtraeglich geaendert")
+
+    assert sha256_file(store.path(digest)) == digest
+    assert os.stat(store.path(digest)).st_ino != os.stat(quelle).st_ino
+
+
+def test_placement_falls_back_to_copy(store, make_pdf, monkeypatch):
+    def kein_reflink(src, dst):
+        open(dst, "wb").close()
+        raise OSError(95, "Operation not supported")
+
+    monkeypatch.setattr(blob_store, "_reflink", kein_reflink)
+    dst = str(store.path("0" * 64))
+    os.makedirs(os.path.dirname(dst))
+    assert store._place(make_pdf("a.pdf"), dst) == "copy"
+    assert [name for name in os.listdir(os.path.dirname(dst)) if name.endswith(".tmp")] == []
+
+
+def test_json_is_canonical_and_compressed(store):
+    erste = store.put_json({"b": 1, "a": "Prüfung"})
+    assert store.put_json({"a": "Prüfung", "b": 1}) == erste
+    assert store.get_json(erste) == {"a": "Prüfung", "b": 1}
+    assert store.path(erste).endswith(blob_store.ZSTD_SUFFIX) == store.compress
+
+
+def test_uncompressed_bytes(store):
+    digest = store.put_bytes(b"roh", compress=False)
+    assert store.get_bytes(digest) == b"roh" and not store.path(digest).endswith(blob_store.ZSTD_SUFFIX)
+
+
+def test_legacy_folders_are_imported(store, tmp_path, make_pdf):
+    db = str(tmp_path / "archive.db")
+    archive_db.migrate(db)
+    ordner = tmp_path / "archiv" / "R-1"
+    ordner.mkdir(parents=True)
+    os.replace(make_pdf("alt.pdf"), ordner / "invoice.pdf")
+    (ordner / "results.json").write_text(json.dumps({"check": "sachlich_korrekt"}), encoding="utf-8")
+    with transaction(db) as conn:
+        archive_db.claim(conn, "Karbo-Power UG", "R-1", "01.01.2019", str(ordner), db_path=db)
+
+    assert blob_store.import_legacy(store, db, delete=True) == 1
+    pdf_blob, results_blob = get_connection(db).execute("SELECT pdf_blob, results_blob FROM archive").fetchone()
+    assert store.get_json(results_blob) == {"check": "sachlich_korrekt"} and store.exists(pdf_blob)
+    assert not ordner.exists()
+    assert blob_store.import_legacy(store, db) == 0
@@ -0,0 +1,56 @@
+# test_bloom_filter.py – Bloom-Filter, Snapshot auf der Platte und Vorfilter des Archivs
+import json
+from utils import archive_db
+from utils.bloom_filter import BloomFilter
+from utils.db import transaction
+
+
+def test_added_keys_are_always_found():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"lieferant|r-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert len(bloom) <= 1000
+
+
+def test_false_positive_rate_stays_near_target():
+    bloom = BloomFilter(2000, 0.01)
+    for i in range(2000):
+        bloom.add(f"archiv|{i}")
+    falsch = sum(f"fremd|{i}" in bloom for i in range(10000))
+    assert falsch / 10000 < 0.03
+
+
+def test_snapshot_round_trip(tmp_path):
+    bloom = BloomFilter(100)
+    bloom.add("a|1")
+    pfad = str(tmp_path / "bloom.bin")
+    bloom.save(pfad, max_id=7)
+
+    geladen, meta = BloomFilter.load(pfad)
+    assert "a|1" in geladen and "b|2" not in geladen
+    assert meta == {"max_id": 7} and len(geladen) == 1
+
+
+def test_incomplete_or_foreign_snapshot_is_ignored(tmp_path):
+    pfad = tmp_path / "bloom.bin"
+    for kopf in ({"capacity": 100, "size": 958}, ["keine", "map"], {"capacity": 100, "error_rate": 0.001,
+                                                                     "size": 0, "hashes": 0, "count": 0}):
+        pfad.write_bytes(json.dumps(kopf).encode() + b"\n" + bytes(120))
+        assert BloomFilter.load(str(pfad)) == (None, {})
+    assert BloomFilter.load(str(tmp_path / "fehlt.bin")) == (None, {})
+
+
+def test_prefilter_rebuilds_from_broken_snapshot(tmp_path):
+    db = str(tmp_path / "archive.db")
+    snapshot = tmp_path / "bloom.bin"
+    archive_db.migrate(db)
+    with transaction(db) as conn:
+        archive_db.claim(conn, "Karbo-Power UG", "R-1321321", "01.01.2019", "archiv/x", db_path=db)
+    snapshot.write_bytes(b'{"capacity": 10}\n')
+
+    prefilter = archive_db.ArchivePrefilter(db, str(snapshot))
+    assert prefilter.might_contain(archive_db._lookup_keys("Karbo-Power UG", "R-1321321"))
+    assert not prefilter.might_contain(archive_db._lookup_keys("Karbo-Power UG", "R-999"))
+    assert BloomFilter.load(str(snapshot))[0] is not None
@@ -0,0 +1,58 @@
+# test_check_agent.py – sachliche Prüfung: Referenzsuche über den Index und über ähnliche Kandidaten
+import json
+from decimal import Decimal
+import pytest
+from agents.check_agent import CheckAgent
+from utils.invoice_record import InvoiceRecord
+from utils.run_context import RunContext
+
+REFERENZEN = [
+    {"rechnungsnummer": "R-1321321", "lieferant": "Karbo-Power UG", "betrag_brutto": 2915.5,
+     "leistung": "Eingangsberatung, Erstellung Businessplan, Begleitung Bankgespräch"},
+    {"rechnungsnummer": "R-1321399", "lieferant": "Karbo-Power UG", "betrag_brutto": 120.0,
+     "leistung": "Nachbetreuung"},
+    {"rechnungsnummer": "RE-2024-0001", "lieferant": "Bürobedarf Müller", "betrag_brutto": 89.9,
+     "leistung": "Druckerpapier"},
+]
+
+
+@pytest.fixture
+def reference_path(tmp_path):
+    pfad = tmp_path / "known_transactions.json"
+    pfad.write_text(json.dumps({"invoices": REFERENZEN}, ensure_ascii=False), encoding="utf-8")
+    return str(pfad)
+
+
+def _agent(reference_path, tmp_path, rechnungsnummer, lieferant="Karbo-Power UG, Gutenbergstraße 32",
+           brutto="2915.50"):
+    record = InvoiceRecord(
+        rechnungsnummer=rechnungsnummer, lieferant=lieferant, brutto=Decimal(brutto), betrag_eindeutig=True,
+        leistung="Eingangsberatung, Erstellung Businessplan, Begleitung Bankgespräch"
+    )
+    context = RunContext.load(str(tmp_path / "results.json"), None)
+    context.set("invoice_record", record.to_dict())
+    return CheckAgent(context, reference_path), context
+
+
+def test_exact_number_is_found_in_index(reference_path, tmp_path):
+    agent, context = _agent(reference_path, tmp_path, "R 1321321")
+    assert agent.prepare() == ("sachlich_korrekt", None)
+    assert context.get("check_kandidaten") is None
+
+
+def test_ocr_variant_is_assigned_through_candidates(reference_path, tmp_path):
+    agent, context = _agent(reference_path, tmp_path, "R-132l32l")
+    assert agent.prepare() == ("sachlich_korrekt", None)
+    assert context.get("check_referenz") == "R-1321321"
+    assert context.get("check_kandidaten")[0]["rechnungsnummer"] == "R-1321321"
+
+
+def test_similar_number_with_other_amount_is_not_assigned(reference_path, tmp_path):
+    agent, context = _agent(reference_path, tmp_path, "R-132l32l", brutto="500.00")
+    assert agent.prepare() == ("nicht_nachvollziehbar", None)
+    assert context.get("check_referenz") is None and context.get("check") == "nicht_nachvollziehbar"
+
+
+def test_unknown_invoice_is_not_traceable(reference_path, tmp_path):
+    agent, context = _agent(reference_path, tmp_path, "X-1", lieferant="Unbekannt AG", brutto="1.00")
+    assert agent.prepare() == ("nicht_nachvollziehbar", None)
@@ -0,0 +1,47 @@
+# test_checkpoint.py – Wiederaufnahme eines Laufs aus dem CheckpointStore (Schlüssel = PDF-Hash)
+import pytest
+from utils.checkpoint_store import CheckpointStore
+from utils.run_context import RunContext, default_workflow_status
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints.db"))
+
+
+def _run(pdf_path, store, tmp_path):
+    return RunContext.resume(
+        pdf_path, results_path=str(tmp_path / "run" / "results.json"),
+        workflow_status_path=str(tmp_path / "run" / "workflow_status.json"), store=store
+    )
+
+
+def _checkpoint(context, **status):
+    context.workflow.update(status)
+    context.results["validation"] = "| Pflichtangabe | Vorhanden | Wert |"
+    context.checkpoint()
+
+
+def test_interrupted_run_resumes_at_first_open_step(store, make_pdf, tmp_path):
+    pdf = make_pdf("rechnung.pdf", "R-1321321")
+    _checkpoint(_run(pdf, store, tmp_path), **{"1_validation": 2, "2_accounting": 2, "3_check": 1})
+
+    # Gleiche Rechnung unter anderem Dateinamen: derselbe Checkpoint
+    fortgesetzt = _run(make_pdf("kopie.pdf", "R-1321321"), store, tmp_path)
+    assert fortgesetzt.workflow["2_accounting"] == 2 and fortgesetzt.workflow["3_check"] == 1
+    assert "validation" in fortgesetzt.results
+    assert [e["pdf_path"] for e in store.in_flight()] == [pdf]
+
+
+@pytest.mark.parametrize("status", [
+    {key: 2 for key in default_workflow_status()},
+    {"1_validation": 2, "2_accounting": 3}
+])
+def test_finished_or_aborted_run_starts_fresh(store, make_pdf, tmp_path, status):
+    pdf = make_pdf("rechnung.pdf")
+    _checkpoint(_run(pdf, store, tmp_path), **status)
+    assert store.in_flight() == []
+
+    neu = _run(pdf, store, tmp_path)
+    assert neu.workflow == default_workflow_status()
+    assert neu.results == {}
@@ -0,0 +1,87 @@
+# test_cost_center_classifier.py – Kostenstellen in Stufen: Schlüsselwörter → Vektormodell (Archiv) → LLM
+import pytest
+from utils import archive_db
+from utils.cost_center import DEFAULT_COST_CENTER
+from utils.cost_center_classifier import CostCenterClassifier, KeywordMatcher, classifier_stats, parse_llm_answer
+from utils.db import transaction
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    pfad = str(tmp_path / "archive.db")
+    archive_db.migrate(pfad)
+    return pfad
+
+
+def _archivieren(pfad, zuordnungen, start=0):
+    with transaction(pfad) as conn:
+        for i, (leistung, kostenstelle) in enumerate(zuordnungen, start=start):
+            archive_db.claim(conn, "Lieferant", f"R-{i}", "01.01.2019", "archiv/x", db_path=pfad,
+                             kostenstelle=kostenstelle, leistung=leistung)
+
+
+def test_keywords_decide_inside_compounds():
+    ergebnis = KeywordMatcher().classify("Eingangsberatung, Erstellung Businessplan")
+    assert ergebnis.kostenstelle == "1001-Beratung" and ergebnis.konfidenz == 1.0
+
+
+def test_mixed_keywords_lower_confidence():
+    ergebnis = KeywordMatcher().classify("Softwarelizenz, Druckerpapier")
+    assert ergebnis.kostenstelle == "1002-IT" and ergebnis.konfidenz == 0.75
+
+
+def test_llm_only_for_unknown_service(archive_path):
+    classifier = CostCenterClassifier(archive_path)
+    aufrufe = []
+
+    def llm():
+        aufrufe.append(1)
+        return "Kostenstelle: 1003-Marketing"
+
+    assert classifier.classify("Beratung", llm).stufe == "keyword" and not aufrufe
+    ergebnis = classifier.classify("Messestand", llm)
+    assert (ergebnis.kostenstelle, ergebnis.stufe) == ("1003-Marketing", "llm") and aufrufe == [1]
+
+
+def test_without_llm_unknown_service_gets_default(archive_path):
+    ergebnis = CostCenterClassifier(archive_path).classify("Messestand")
+    assert (ergebnis.kostenstelle, ergebnis.stufe) == (DEFAULT_COST_CENTER, "default")
+
+
+def test_vector_model_learns_from_archive(archive_path):
+    classifier = CostCenterClassifier(archive_path)
+    assert classifier.classify("Reinigung Büroräume").stufe == "default"
+
+    # Neue Archivzeilen verwerfen das gemerkte Ergebnis und trainieren das Modell nach
+    _archivieren(archive_path, [(f"Reinigung Büroräume Etage {i}", "1099-Sonstiges") for i in range(12)]
+                 + [(f"Messestand Aufbau Halle {i}", "1003-Marketing") for i in range(12)])
+    ergebnis = classifier.classify("Aufbau Messestand")
+    assert (ergebnis.kostenstelle, ergebnis.stufe) == ("1003-Marketing", "vektor")
+    assert classifier.vectors.examples == 24
+
+
+def test_unknown_cost_centers_are_not_learned(archive_path):
+    _archivieren(archive_path, [("Reinigung", "9999-Erfunden")] * 3)
+    classifier = CostCenterClassifier(archive_path)
+    classifier.classify("Reinigung")
+    assert classifier.vectors.examples == 0
+
+
+def test_bulk_asks_llm_once_per_text(archive_path):
+    gefragt = []
+    ergebnisse = CostCenterClassifier(archive_path).classify_bulk(
+        ["Messestand", "Beratung", "Messestand"], lambda text: gefragt.append(text) or "1003-Marketing"
+    )
+    assert [e.kostenstelle for e in ergebnisse] == ["1003-Marketing", "1001-Beratung", "1003-Marketing"]
+    assert gefragt == ["Messestand"]
+
+
+def test_decisions_are_counted_per_stage(archive_path):
+    vorher = classifier_stats()
+    CostCenterClassifier(archive_path).classify("Schulung")
+    assert classifier_stats()["keyword"] == vorher["keyword"] + 1
+
+
+def test_llm_answer_outside_known_cost_centers():
+    assert parse_llm_answer("keine Ahnung").konfidenz == 0.0
+    assert parse_llm_answer("").kostenstelle == DEFAULT_COST_CENTER
@@ -0,0 +1,60 @@
+# test_job_queue.py – Leases, Wiederaufnahme verwaister Aufträge und Dublettenerkennung der JobQueue
+import time
+import pytest
+from utils.job_queue import JobQueue, STATUS_EINGEREIHT, STATUS_LAEUFT
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(db_path=str(tmp_path / "jobs.db"))
+
+
+def test_claim_leases_job_to_one_worker(queue, make_pdf):
+    job = queue.enqueue(make_pdf("a.pdf"))
+    erster = queue.claim("w1", lease_s=60)
+    assert erster["id"] == job["id"]
+    assert erster["status"] == STATUS_LAEUFT and erster["worker"] == "w1"
+    assert erster["lease_bis"] > time.time()
+    assert queue.claim("w2", lease_s=60) is None
+
+
+def test_expired_lease_is_requeued_and_claimed_again(queue, make_pdf):
+    job = queue.enqueue(make_pdf("a.pdf"))
+    queue.claim("w1", lease_s=-1)
+    assert queue.requeue_stale() == 1
+    assert queue.get(job["id"])["status"] == STATUS_EINGEREIHT
+
+    zweiter = queue.claim("w2", lease_s=60)
+    assert zweiter["id"] == job["id"] and zweiter["worker"] == "w2"
+    assert zweiter["versuche"] == 2
+
+
+def test_heartbeat_keeps_lease_alive(queue, make_pdf):
+    job = queue.enqueue(make_pdf("a.pdf"))
+    queue.claim("w1", lease_s=-1)
+    queue.heartbeat("w1", lease_s=60)
+    assert queue.requeue_stale() == 0
+    assert queue.get(job["id"])["status"] == STATUS_LAEUFT
+
+
+def test_finished_job_is_not_requeued(queue, make_pdf):
+    job = queue.enqueue(make_pdf("a.pdf"))
+    queue.claim("w1", lease_s=-1)
+    queue.finish(job["id"], "abgeschlossen", "Done")
+    assert queue.requeue_stale() == 0
+    assert queue.get(job["id"])["status"] == "abgeschlossen"
+
+
+def test_same_pdf_is_merged_while_active(queue, make_pdf):
+    # Gleicher Inhalt unter anderem Namen, auch innerhalb eines Stapels: nur ein aktiver Auftrag
+    a, b = make_pdf("a.pdf", "Rechnung 1"), make_pdf("kopie.pdf", "Rechnung 1")
+    erster, zweiter = queue.enqueue_many([(a, None), (b, None)])
+    assert not erster["dupliziert"] and zweiter["dupliziert"]
+    assert zweiter["id"] == erster["id"]
+
+    queue.claim("w1")
+    assert queue.enqueue(b)["id"] == erster["id"]
+
+    queue.finish(erster["id"], "abgeschlossen", "Done")
+    neu = queue.enqueue(b)
+    assert not neu["dupliziert"] and neu["id"] != erster["id"]
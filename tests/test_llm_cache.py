@@ -0,0 +1,57 @@
+# test_llm_cache.py – LLM-Antwort-Cache und erneuter Versuch nach negativer Bewertung des Supervisors
+from agents.supervisor_agent import SupervisorAgent
+from utils.llm_cache import LLMCache
+from utils.llm_client import CachedLLM, get_llm, llm_cache_bypass
+
+
+class CountingClient:
+    # Liefert bei jedem echten Aufruf eine neue Antwort
+    model = "test"
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt, **kwargs):
+        self.calls += 1
+        return f"Antwort {self.calls}"
+
+
+class ScriptedReviewer:
+    # Supervisor-Bewertungen in vorgegebener Reihenfolge
+    def __init__(self, *antworten):
+        self.antworten = list(antworten)
+
+    def invoke(self, prompt, **kwargs):
+        return self.antworten.pop(0)
+
+
+def test_identical_prompt_is_answered_from_cache():
+    client = CountingClient()
+    llm = CachedLLM(client, LLMCache("data/llm_cache.db"))
+    assert llm.invoke("Frage") == llm.invoke("Frage") == "Antwort 1"
+    assert client.calls == 1
+
+
+def test_bypass_asks_llm_and_replaces_entry():
+    client = CountingClient()
+    llm = CachedLLM(client, LLMCache("data/llm_cache.db"))
+    llm.invoke("Frage")
+    with llm_cache_bypass():
+        assert llm.invoke("Frage") == "Antwort 2"
+    assert llm.invoke("Frage") == "Antwort 2" and client.calls == 2
+
+
+def test_supervisor_is_not_cached():
+    assert not isinstance(get_llm(agent="supervisor"), CachedLLM)
+
+
+def test_rejected_step_is_retried_with_fresh_answer(make_pdf):
+    client = CountingClient()
+    llm = CachedLLM(client, LLMCache("data/llm_cache.db"))
+    supervisor = SupervisorAgent(make_pdf("rechnung.pdf"), "data/results.json", "data/workflow_status.json")
+    supervisor.llm = ScriptedReviewer("nein, Feld 6 fehlt", "ja")
+    supervisor.steps = [("validation", lambda: llm.invoke("Validierung"))]
+
+    assert supervisor.action() == "Done"
+    assert supervisor.results["validation"] == "Antwort 2" and client.calls == 2
+    assert supervisor.workflow["1_validation"] == 2 and not supervisor.abgelehnt
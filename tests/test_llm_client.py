@@ -0,0 +1,47 @@
+# test_llm_client.py – LLM-Client gegen den lokalen Ollama-Stub (Keep-Alive-Verbindungen, keep_alive des Modells)
+import asyncio
+import pytest
+from config import OLLAMA_KEEP_ALIVE
+from utils.llm_client import LLMClient, get_llm, reset_llm_clients
+from utils.ollama_stub import OllamaStubServer
+
+
+@pytest.fixture
+def stub():
+    server = OllamaStubServer().start()
+    yield server
+    server.stop()
+    reset_llm_clients()
+
+
+def test_sync_requests_reuse_one_connection(stub):
+    client = LLMClient(base_url=stub.base_url)
+    assert [client.invoke(f"Frage {i}") for i in range(5)] == ["ok"] * 5
+    assert len(stub.requests) == 5
+    assert stub.connections == 1
+
+
+def test_async_requests_reuse_one_connection(stub):
+    client = LLMClient(base_url=stub.base_url)
+
+    async def main():
+        return [await client.ainvoke(f"Frage {i}") for i in range(5)]
+
+    assert asyncio.run(main()) == ["ok"] * 5
+    assert stub.connections == 1
+
+
+def test_every_request_keeps_model_loaded(stub):
+    client = LLMClient(base_url=stub.base_url)
+    client.invoke("Frage")
+    asyncio.run(client.ainvoke("Frage"))
+    assert [r.get("keep_alive") for r in stub.requests] == [OLLAMA_KEEP_ALIVE] * 2
+
+
+def test_agents_share_one_client_per_backend(stub):
+    # Opt-out-Agent erhält den rohen Client, alle anderen denselben Client hinter dem Cache
+    roh = get_llm(base_url=stub.base_url + "/", agent=None)
+    roh = getattr(roh, "client", roh)
+    for agent in ("validation", "booking", "supervisor"):
+        llm = get_llm(base_url=stub.base_url, agent=agent)
+        assert getattr(llm, "client", llm) is roh
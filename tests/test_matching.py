@@ -0,0 +1,78 @@
+# test_matching.py – deterministischer Abgleich Rechnung ↔ Referenz und Ähnlichkeitsmaße
+import pytest
+from utils.matching import (
+    amount_match, fold_number, item_overlap, match_invoice, match_stats, number_similarity, positions,
+    supplier_similarity
+)
+
+REFERENZ = {
+    "rechnungsnummer": "R-1321321",
+    "lieferant": "Karbo Power UG",
+    "betrag_brutto": 2915.5,
+    "leistung": "Businessplan; Bankgespräch; Eingangsberatung"
+}
+
+
+def _match(lieferant="Karbo-Power UG, Gutenbergstraße 32", brutto="2915.50",
+           leistung="Eingangsberatung, Erstellung Businessplan, Begleitung Bankgespräch", **referenz):
+    return match_invoice("R-1321321", lieferant, brutto, leistung, {**REFERENZ, **referenz})
+
+
+def test_matching_invoice_is_accepted_without_llm():
+    ergebnis = _match()
+    assert ergebnis.entscheidung == "sachlich_korrekt"
+    assert ergebnis.nummer and ergebnis.betrag and ergebnis.lieferant == 1.0 and ergebnis.positionen == 1.0
+
+
+def test_other_supplier_and_amount_are_rejected_without_llm():
+    ergebnis = _match(lieferant="Ganz Andere AG", brutto="100.00", leistung=None)
+    assert ergebnis.entscheidung == "nicht_nachvollziehbar"
+
+
+def test_wrong_amount_is_borderline_case():
+    assert _match(brutto="2000.00").entscheidung == "grenzfall"
+
+
+def test_other_number_is_never_accepted():
+    ergebnis = match_invoice("R-999", "Karbo-Power UG", "2915.50", None, REFERENZ)
+    assert not ergebnis.nummer and ergebnis.entscheidung == "nicht_nachvollziehbar"
+
+
+def test_decisions_are_counted():
+    vorher = match_stats()
+    _match()
+    _match(brutto="2000.00")
+    nachher = match_stats()
+    assert nachher["eindeutig"] == vorher["eindeutig"] + 1 and nachher["grenzfall"] == vorher["grenzfall"] + 1
+    assert 0.0 <= nachher["ohne_llm_quote"] <= 1.0
+
+
+@pytest.mark.parametrize("a, b, gleich", [
+    ("2915.50", 2915.5, True),
+    ("2915.50", "2915.51", True),
+    ("2915.50", "2915.52", False),
+])
+def test_amount_tolerance(a, b, gleich):
+    assert amount_match(a, b) is gleich
+
+
+def test_missing_amount_is_unknown():
+    assert amount_match(None, 10) is None and amount_match("abc", 10) is None
+
+
+def test_supplier_ignores_legal_form_and_address():
+    assert supplier_similarity("Karbo-Power UG, Gutenbergstraße 32", "karbo power") == 1.0
+    assert supplier_similarity("Karbo-Power UG", "Falling Consult") < 0.3
+
+
+def test_positions_in_any_order_and_separator():
+    assert positions("Beratung, Businessplan<br>Bankgespräch") == ["Beratung", "Businessplan", "Bankgespräch"]
+    assert item_overlap("Bankgespräch; Businessplan", "Businessplan, Bankgespräch") == 1.0
+    assert item_overlap("Bankgespräch", "Businessplan, Bankgespräch") == 0.5
+    assert item_overlap("", "Businessplan") is None
+
+
+def test_ocr_confusions_are_folded():
+    assert fold_number("RE-1O2") == "RE102"
+    assert number_similarity("RE-1O2", "RE102") == 1.0
+    assert number_similarity("R-1321321", "R-1321322") > 0.8
@@ -0,0 +1,47 @@
+# test_pdf_parser.py – Seitentext-Cache: ein Schreibzugriff je Lauf, Fortsetzung nach abgebrochenem Lesen
+import pytest
+from PyPDF2 import PdfWriter
+import utils.pdf_parser as pdf_parser
+
+
+@pytest.fixture
+def blank_pdf(tmp_path):
+    pfad = tmp_path / "leer.pdf"
+    writer = PdfWriter()
+    for _ in range(25):
+        writer.add_blank_page(width=595, height=842)
+    with open(pfad, "wb") as f:
+        writer.write(f)
+    return str(pfad)
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    gespeichert = []
+    original = pdf_parser._store_cached
+
+    def store(digest, page_count, pages):
+        gespeichert.append(len(pages))
+        original(digest, page_count, pages)
+
+    monkeypatch.setattr(pdf_parser, "_store_cached", store)
+    monkeypatch.setattr(pdf_parser, "_memory_cache", pdf_parser.OrderedDict())
+    return gespeichert
+
+
+def test_cache_is_written_once_per_document(blank_pdf, writes):
+    assert len(pdf_parser.extract_pages(blank_pdf, parallel=False)) == 25
+    assert writes == [25]
+    pdf_parser.extract_pages(blank_pdf, parallel=False)
+    assert writes == [25]
+
+
+def test_abandoned_reader_keeps_progress(blank_pdf, writes):
+    seiten = pdf_parser.iter_pdf_pages(blank_pdf, parallel=False)
+    for _ in range(5):
+        next(seiten)
+    seiten.close()
+    assert writes == [5]
+
+    assert len(pdf_parser.extract_pages(blank_pdf, parallel=False)) == 25
+    assert writes == [5, 25]
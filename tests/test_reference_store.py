@@ -0,0 +1,70 @@
+# test_reference_store.py – Referenzdaten im Speicher und in SQLite: gleiche Ergebnisse, Abgleich geänderter Quellen
+import json
+import os
+import pytest
+from utils.reference_store import ReferenceStore, SqliteReferenceStore
+
+
+def _entry(nr, lieferant="Karbo-Power UG", betrag=100.0):
+    return {"rechnungsnummer": nr, "lieferant": lieferant, "betrag_brutto": betrag}
+
+
+ENTRIES = [
+    _entry("R-1321321", betrag=2915.5),
+    _entry("R-1321321", lieferant="Falling Consult", betrag=2915.5),
+    _entry("R-1321322", betrag=2915.5),
+    _entry("RE-2024-0001", lieferant="Bürobedarf Müller", betrag=89.9),
+    _entry("RE-2024-0002", lieferant="Bürobedarf Müller", betrag=89.9),
+    _entry("INV-77", lieferant="Cloud GmbH", betrag=49.0),
+]
+
+
+def _write(pfad, entries, mtime):
+    with open(pfad, "w", encoding="utf-8") as f:
+        json.dump({"invoices": entries}, f, ensure_ascii=False)
+    # Eindeutige Änderungskennung, auch wenn zwei Schreibvorgänge im selben Zeittakt liegen
+    os.utime(pfad, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def source(tmp_path):
+    pfad = str(tmp_path / "known_transactions.json")
+    _write(pfad, ENTRIES, 1_000_000_000)
+    return pfad
+
+
+def _abfragen(store):
+    return [
+        store.by_number("R 1321321"),
+        store.by_supplier("bürobedarf müller"),
+        store.find("R-1321321", "Falling Consult"),
+        store.candidates("R-132132", "Karbo-Power UG", 2915.5, k=3, pool=2),
+        store.candidates("RE-2024-000", None, 89.9),
+        len(store),
+    ]
+
+
+def test_sqlite_store_matches_memory_store(source, tmp_path):
+    sqlite = SqliteReferenceStore(source, str(tmp_path / "reference.db"))
+    assert _abfragen(sqlite) == _abfragen(ReferenceStore(source))
+
+
+def test_diff_refresh_keeps_source_order(source, tmp_path):
+    db = str(tmp_path / "reference.db")
+    sqlite = SqliteReferenceStore(source, db)
+
+    # Ersten Eintrag ändern (neue Zeile in SQLite), einen entfernen und einen anhängen
+    geaendert = [_entry("R-1321321", betrag=2900.0)] + ENTRIES[1:4] + ENTRIES[5:] + [_entry("R-1321321", "Neu AG")]
+    _write(source, geaendert, 2_000_000_000)
+    assert sqlite.refresh()
+
+    memory = ReferenceStore(source)
+    assert _abfragen(sqlite) == _abfragen(memory)
+    assert [e["lieferant"] for e in sqlite.by_number("R-1321321")] == ["Karbo-Power UG", "Falling Consult", "Neu AG"]
+    # Ein neuer Prozess liest den abgeglichenen Stand aus der Datenbank
+    assert _abfragen(SqliteReferenceStore(source, db)) == _abfragen(memory)
+
+
+def test_unchanged_source_is_not_reimported(source, tmp_path):
+    sqlite = SqliteReferenceStore(source, str(tmp_path / "reference.db"))
+    assert not sqlite.refresh()
@@ -0,0 +1,57 @@
+# test_run_context.py – gemeinsame Zustandsdatei (Ergebnisse + Workflow-Status) eines Laufs
+import json
+from utils.run_context import RunContext, as_context, default_workflow_status, state_path
+
+
+def _context(tmp_path, pdf_path=None):
+    return RunContext.load(
+        str(tmp_path / "run" / "results.json"), str(tmp_path / "run" / "workflow_status.json"), pdf_path=pdf_path
+    )
+
+
+def test_checkpoint_writes_state_and_views(tmp_path, make_pdf):
+    context = _context(tmp_path, make_pdf("rechnung.pdf"))
+    context.results["validation"] = "Tabelle"
+    context.workflow["1_validation"] = 2
+    context.checkpoint()
+
+    with open(state_path(context.results_path), encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["results"] == {"validation": "Tabelle"} and state["workflow"]["1_validation"] == 2
+    with open(context.workflow_status_path, encoding="utf-8") as f:
+        assert json.load(f) == context.workflow
+
+
+def test_state_file_wins_over_stale_views(tmp_path, make_pdf):
+    pdf = make_pdf("rechnung.pdf")
+    context = _context(tmp_path, pdf)
+    context.results["validation"] = "Tabelle"
+    context.checkpoint()
+    # Absturz zwischen Zustandsdatei und Ansichten
+    with open(context.results_path, "w", encoding="utf-8") as f:
+        json.dump({}, f)
+    assert _context(tmp_path, pdf).results == {"validation": "Tabelle"}
+
+
+def test_other_invoice_starts_fresh(tmp_path, make_pdf):
+    context = _context(tmp_path, make_pdf("a.pdf"))
+    context.results["validation"] = "Tabelle A"
+    context.workflow.update({key: 2 for key in context.workflow})
+    context.checkpoint()
+
+    andere = _context(tmp_path, make_pdf("b.pdf"))
+    assert andere.results == {} and andere.workflow == default_workflow_status()
+    # Gleiche Rechnung unter anderem Namen setzt fort
+    assert _context(tmp_path, make_pdf("kopie.pdf", "a.pdf")).results == {"validation": "Tabelle A"}
+
+
+def test_single_agent_run_keeps_workflow(tmp_path, make_pdf):
+    context = _context(tmp_path, make_pdf("rechnung.pdf"))
+    context.workflow["1_validation"] = 2
+    context.checkpoint()
+
+    agent = as_context(context.results_path)
+    agent.set("accounting", "1001-Beratung")
+    agent.checkpoint()
+    geladen = _context(tmp_path, context.pdf_path)
+    assert geladen.workflow["1_validation"] == 2 and geladen.get("accounting") == "1001-Beratung"
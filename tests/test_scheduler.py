@@ -0,0 +1,92 @@
+# test_scheduler.py – Vorab-Erkennung (Betrag, Frist, Lieferant), Klassen und Reihenfolge der Abarbeitung
+from datetime import date
+from decimal import Decimal
+import pytest
+from utils import scheduler
+from utils.scheduler import InvoiceFacts, InvoiceScheduler, classify, facts_from_text, timing_report
+
+HEUTE = date(2019, 1, 10)
+
+RECHNUNG = """Karbo-Power UG, Gutenbergstraße 32, 35043 Marburg
+Falling Consult, Südviertel 2, 35037 Marburg
+Rechnungsdatum: 01.01.2019
+Nettobetrag 2.450,00 EUR
+Bruttobetrag 2.915,50 EUR
+Zahlbar innerhalb von 30 Tagen, 2 % Skonto bei Zahlung bis zum 11.01.2019
+"""
+
+
+def test_facts_from_invoice_text():
+    facts = facts_from_text(RECHNUNG)
+    assert facts.brutto == Decimal("2915.50")
+    assert facts.frist == date(2019, 1, 11)
+    assert facts.lieferant == "karbo-power"
+
+
+def test_payment_term_in_days_counts_from_invoice_date():
+    facts = facts_from_text("Muster AG\nDatum 01.01.2019\nGesamt: 100,00 €\nZahlbar binnen 14 Tagen")
+    assert facts.frist == date(2019, 1, 15) and facts.brutto == Decimal("100.00")
+
+
+def test_numbers_without_cents_are_no_amount():
+    assert facts_from_text("Gross GmbH, Weg 1\nTotal 19% MwSt").brutto is None
+    assert facts_from_text("") == InvoiceFacts()
+
+
+@pytest.mark.parametrize("facts, klasse", [
+    (InvoiceFacts(Decimal("2915.50"), date(2019, 1, 11)), "frist"),
+    (InvoiceFacts(Decimal("89.90"), date(2019, 3, 1)), "auto"),
+    (InvoiceFacts(Decimal("2915.50"), date(2019, 3, 1)), "standard"),
+    (InvoiceFacts(), "standard"),
+])
+def test_classify(facts, klasse):
+    assert classify(facts, heute=HEUTE) == klasse
+
+
+def _facts(brutto, lieferant, frist=None):
+    return InvoiceFacts(Decimal(brutto), frist, lieferant)
+
+
+def test_pop_serves_classes_by_rank(monkeypatch):
+    monkeypatch.setattr(scheduler, "classify", lambda facts: classify(facts, heute=HEUTE))
+    queue = InvoiceScheduler()
+    queue.push("standard.pdf", _facts("9000.00", "a"))
+    queue.push("auto.pdf", _facts("50.00", "b"))
+    queue.push("frist.pdf", _facts("9000.00", "c", date(2019, 1, 12)))
+
+    assert [queue.pop()["item"] for _ in range(3)] == ["frist.pdf", "auto.pdf", "standard.pdf"]
+    assert queue.pop() is None
+
+
+def test_suppliers_share_a_class_fairly(monkeypatch):
+    monkeypatch.setitem(scheduler.SCHEDULER_SUPPLIER_WEIGHTS, "wichtig", 2.0)
+    queue = InvoiceScheduler()
+    for i in range(3):
+        queue.push(f"gross-{i}.pdf", _facts("9000.00", "grosslieferant"))
+    queue.push("klein.pdf", _facts("9000.00", "kleinlieferant"))
+    for i in range(2):
+        queue.push(f"wichtig-{i}.pdf", _facts("9000.00", "wichtig"))
+
+    reihenfolge = [queue.pop()["item"] for _ in range(len(queue))]
+    # Kein Lieferant blockiert die Klasse; doppeltes Gewicht → beide Rechnungen in der ersten Runde
+    assert reihenfolge[:4] == ["wichtig-0.pdf", "gross-0.pdf", "klein.pdf", "wichtig-1.pdf"]
+    assert reihenfolge[4:] == ["gross-1.pdf", "gross-2.pdf"]
+
+
+def test_long_waiting_invoice_moves_ahead():
+    queue = InvoiceScheduler(max_wait_s=60)
+    alt = queue.push("alt.pdf", _facts("9000.00", "a"))
+    queue.push("auto.pdf", _facts("50.00", "b"))
+    alt["eingereicht"] -= 120
+
+    erster = queue.pop()
+    assert erster["item"] == "alt.pdf"
+    queue.done(erster)
+    assert queue.pop()["item"] == "auto.pdf"
+    assert queue.report()["standard"]["anzahl"] == 1
+
+
+def test_timing_report_per_class():
+    report = timing_report([("auto", 0.0, 1.0, 3.0), ("auto", 0.0, 3.0, 4.0), ("frist", 0.0, None, None)])
+    assert list(report) == ["auto"]
+    assert report["auto"]["wartezeit_s"]["mittel"] == 2.0 and report["auto"]["bearbeitung_s"]["mittel"] == 1.5
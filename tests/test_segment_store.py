@@ -0,0 +1,48 @@
+# test_segment_store.py – inhaltsadressierte Segmentablage: Dubletten, Aufbewahrung, Löschlauf
+from utils.db import get_connection
+from utils.segment_store import SegmentStore
+
+
+def test_segment_store_keeps_identical_content_once(tmp_path):
+    store = SegmentStore(str(tmp_path / "segmente"), fsync=False)
+    erster = store.put_bytes(b"%PDF-1.4 Rechnung", compress=False)
+    zweiter = store.put_bytes(b"%PDF-1.4 Rechnung", compress=False)
+    assert erster == zweiter
+    assert store.stats()["datensaetze"] == 1
+    assert store.get_bytes(erster) == b"%PDF-1.4 Rechnung"
+
+
+def _aufbewahren_bis(store, digest):
+    return get_connection(store.index_path).execute(
+        "SELECT aufbewahren_bis FROM records WHERE digest = ?", (digest,)
+    ).fetchone()[0]
+
+
+def test_storing_again_extends_retention(tmp_path):
+    store = SegmentStore(str(tmp_path / "segmente"), retention_years=1, fsync=False)
+    digest = store.put_bytes(b"%PDF-1.4 Rechnung", compress=False)
+    frueher = _aufbewahren_bis(store, digest)
+
+    store.retention_s *= 10
+    store.put_bytes(b"%PDF-1.4 Rechnung", compress=False)
+    assert _aufbewahren_bis(store, digest) > frueher + 8 * 365 * 24 * 3600
+
+    # Eine kürzere Frist verkürzt die bestehende nicht
+    store.retention_s = 0
+    store.put_bytes(b"%PDF-1.4 Rechnung", compress=False)
+    assert _aufbewahren_bis(store, digest) > frueher
+
+
+def test_purge_keeps_segment_of_content_archived_again(tmp_path):
+    store = SegmentStore(str(tmp_path / "segmente"), max_bytes=64, retention_years=0, fsync=False)
+    # Jeder Datensatz füllt ein eigenes Segment
+    alt, erneut, neu = (store.put_bytes(inhalt * 40, compress=False) for inhalt in (b"A", b"B", b"C"))
+
+    # B wird erneut archiviert und braucht wieder die volle Frist; A und C sind abgelaufen
+    store.retention_s = 3600
+    store.put_bytes(b"B" * 40, compress=False)
+    bericht = store.purge()
+
+    assert bericht["segmente_geloescht"] == 2
+    assert not store.exists(alt) and not store.exists(neu)
+    assert store.get_bytes(erneut) == b"B" * 40
@@ -0,0 +1,74 @@
+# test_validation_agent.py – strukturierte Extraktion zuerst über die Kopfseiten, Volltext nur für fehlende Felder
+import asyncio
+import json
+import pytest
+import agents.validation_agent as validation_module
+from agents.validation_agent import PFLICHTFELDER, ValidationAgent
+
+
+class JsonLLM:
+    # Beantwortet jeden Aufruf mit "Ja" für alle angefragten Felder außer den fehlenden
+    def __init__(self, fehlend=()):
+        self.fehlend = set(fehlend)
+        self.prompts = []
+
+    def antwort(self, prompt, format):
+        self.prompts.append((prompt, format["required"]))
+        fehlend = self.fehlend if len(self.prompts) == 1 else set()
+        return json.dumps({
+            nr: {"vorhanden": "Nein", "wert": "Fehlt"} if int(nr) in fehlend else {"vorhanden": "Ja", "wert": f"Wert {nr}"}
+            for nr in format["required"]
+        })
+
+    def invoke(self, prompt, format=None):
+        return self.antwort(prompt, format)
+
+    async def ainvoke(self, prompt, format=None):
+        return self.antwort(prompt, format)
+
+
+@pytest.fixture
+def agent_factory(monkeypatch):
+    def make(seiten, llm):
+        gelesen = []
+
+        def pages(pdf_path):
+            for text in seiten:
+                gelesen.append(text)
+                yield text
+
+        monkeypatch.setattr(validation_module, "iter_pdf_pages", pages)
+        agent = ValidationAgent("rechnung.pdf", mode="structured")
+        agent.llm = llm
+        return agent, gelesen
+    return make
+
+
+@pytest.mark.parametrize("asynchron", [False, True])
+def test_complete_header_needs_no_remaining_pages(agent_factory, asynchron):
+    llm = JsonLLM()
+    agent, gelesen = agent_factory(["Kopf 1 ", "Kopf 2 ", "Anhang 3 ", "Anhang 4 "], llm)
+    tabelle = asyncio.run(agent.arun()) if asynchron else agent.run()
+
+    assert len(llm.prompts) == 1 and "Anhang" not in llm.prompts[0][0]
+    assert gelesen == ["Kopf 1 ", "Kopf 2 "]
+    assert tabelle.count("| Ja |") == len(PFLICHTFELDER)
+
+
+@pytest.mark.parametrize("asynchron", [False, True])
+def test_fields_missing_in_header_are_asked_on_full_text(agent_factory, asynchron):
+    llm = JsonLLM(fehlend=[9, 11])
+    agent, _ = agent_factory(["Kopf 1 ", "Kopf 2 ", "Summen 3 "], llm)
+    tabelle = asyncio.run(agent.arun()) if asynchron else agent.run()
+
+    (_, erste), (zweiter_prompt, zweite) = llm.prompts
+    assert len(erste) == len(PFLICHTFELDER) and zweite == ["9", "11"]
+    assert "Summen 3" in zweiter_prompt
+    assert tabelle.count("| Ja |") == len(PFLICHTFELDER)
+
+
+def test_short_document_is_not_asked_twice(agent_factory):
+    llm = JsonLLM(fehlend=[12])
+    agent, _ = agent_factory(["Kopf 1 ", "Kopf 2 "], llm)
+    agent.run()
+    assert len(llm.prompts) == 1
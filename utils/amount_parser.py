@@ -0,0 +1,162 @@
+# amount_parser.py – deterministisches Parsen von Geldbeträgen (deutsches und englisches Format)
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from utils.decision_stats import DecisionStats
+
+# Zahl mit optionalen Tausender-/Dezimaltrennzeichen; Prozentangaben (z. B. "19%") werden ignoriert
+NUMBER_PATTERN = re.compile(r"(?<![\d.,])[-+]?\d+(?:[.,']\d+)*(?![\d.,]*\s*%)")
+
+NETTO_LABELS = ("netto", "net", "zwischensumme", "subtotal")
+STEUER_LABELS = ("steuer", "ust", "mwst", "vat", "tax")
+BRUTTO_LABELS = ("brutto", "gesamt", "gross", "total", "endbetrag", "rechnungsbetrag", "zu zahlen")
+
+# Stichwörter als eine Alternation, längste zuerst ("subtotal" vor "total", "netto" vor "net")
+_LABELS = {label: name for name, labels in (("netto", NETTO_LABELS), ("steuer", STEUER_LABELS),
+                                            ("brutto", BRUTTO_LABELS)) for label in labels}
+LABEL_PATTERN = re.compile("|".join(re.escape(label) for label in sorted(_LABELS, key=len, reverse=True)))
+
+# Zusätze wie "inkl. MwSt" oder "zzgl. 19% USt" benennen keinen eigenen Betrag
+QUALIFIER_PATTERN = re.compile(
+    r"\b(?:inkl|incl|inklusive|zzgl|zuzüglich|exkl|excl|exklusive|ohne)\.?\s+(?:\d+(?:[.,]\d+)?\s*%\s*)?"
+    r"(?:mwst|ust|steuer|vat|tax)\b\.?"
+)
+
+# Abweichung, die bei Netto + Steuer = Brutto toleriert wird
+TOLERANCE = Decimal("0.01")
+
+# Zähler: wie oft der Bruttobetrag ohne LLM bestimmt werden konnte
+_stats = DecisionStats(["fast_path"], "llm_fallback", quote_key="fast_path_quote")
+
+
+class AmbiguousAmountError(ValueError):
+    # Trennzeichen lässt sich nicht eindeutig als Tausender- oder Dezimaltrennzeichen deuten
+    pass
+
+
+def parse_amount(text, locale=None):
+    # Betrag wie "2.915,50 €", "2,915.50", "2915.50" oder "1'234.00" in Decimal umwandeln.
+    # locale ("de"/"en") entscheidet nur Fälle wie "1.234", die sonst mehrdeutig sind.
+    cleaned = re.sub(r"[^\d.,'\-+]", "", str(text)).replace("'", "")
+    if not re.search(r"\d", cleaned):
+        raise ValueError(f"Kein Betrag gefunden: {text!r}")
+
+    sign = -1 if cleaned.startswith("-") else 1
+    cleaned = cleaned.lstrip("+-")
+
+    if "," in cleaned and "." in cleaned:
+        # Das zuletzt stehende Zeichen ist das Dezimaltrennzeichen
+        decimal_sep = "," if cleaned.rfind(",") > cleaned.rfind(".") else "."
+    elif "," in cleaned or "." in cleaned:
+        sep = "," if "," in cleaned else "."
+        parts = cleaned.split(sep)
+        if len(parts) > 2:
+            decimal_sep = None                         # 1.234.567 → nur Tausendertrennzeichen
+        elif len(parts[1]) != 3:
+            decimal_sep = sep                          # 2915,5 / 2915.50 → Dezimaltrennzeichen
+        elif locale in ("de", "en"):
+            german = locale == "de"
+            decimal_sep = sep if (sep == ",") == german else None
+        else:
+            raise AmbiguousAmountError(f"Mehrdeutiger Betrag: {text!r}")
+    else:
+        decimal_sep = None
+
+    thousands_sep = {",": ".", ".": ","}.get(decimal_sep) if decimal_sep else ("," if "," in cleaned else ".")
+    integer_part, _, fraction = cleaned.partition(decimal_sep) if decimal_sep else (cleaned, "", "")
+
+    groups = integer_part.split(thousands_sep)
+    if len(groups) > 1 and (not 1 <= len(groups[0]) <= 3 or any(len(g) != 3 for g in groups[1:])):
+        raise AmbiguousAmountError(f"Ungültige Tausendergruppierung: {text!r}")
+
+    try:
+        return sign * Decimal("".join(groups) + ("." + fraction if fraction else ""))
+    except InvalidOperation:
+        raise ValueError(f"Kein gültiger Betrag: {text!r}")
+
+
+@dataclass
+class AmountBreakdown:
+    netto: Decimal = None
+    steuer: Decimal = None
+    brutto: Decimal = None
+    mehrdeutig: bool = False
+    # Anzahl der gefundenen beschrifteten Beträge (ein abgeleiteter Bruttobetrag zählt nicht)
+    betraege: int = 0
+
+    @property
+    def konsistent(self):
+        # True/False, wenn Netto + Steuer = Brutto prüfbar ist, sonst None
+        if None in (self.netto, self.steuer, self.brutto):
+            return None
+        return abs(self.netto + self.steuer - self.brutto) <= TOLERANCE
+
+    @property
+    def eindeutig(self):
+        # Bruttobetrag darf ohne LLM verwendet werden: Summenprobe bestanden oder Brutto der einzige Betrag
+        if self.brutto is None or self.mehrdeutig:
+            return False
+        return self.konsistent is True or self.betraege == 1
+
+
+def _labels(segment):
+    # Alle im Segment genannten Betragsarten, z. B. "Gesamtbetrag inkl. MwSt" → {"brutto"},
+    # "Bruttobetrag 2.915,50 € inkl. 465,50 € MwSt" → {"brutto", "steuer"}
+    text = QUALIFIER_PATTERN.sub(" ", segment.lower())
+    return {_LABELS[treffer.group()] for treffer in LABEL_PATTERN.finditer(text)}
+
+
+def extract_amounts(text, locale=None):
+    # Netto, Steuer und Brutto aus Feld 9 lesen, z. B.
+    # "Nettobetrag: 2.450,00 €, Steuerbetrag (19%): 465,50 €, Gesamtbetrag: 2.915,50 €"
+    # "2,450.00 EUR (net), 465.50 EUR (VAT), 2,915.50 EUR (total)"
+    result = _extract_amounts(text, locale)
+    if result.mehrdeutig and locale is None:
+        # Mehrdeutige Trennzeichen ("1.190") über die Summenprobe auflösen
+        kandidaten = [b for b in (_extract_amounts(text, "de"), _extract_amounts(text, "en")) if b.konsistent]
+        if len(kandidaten) == 1:
+            return kandidaten[0]
+    return result
+
+
+def _extract_amounts(text, locale):
+    result = AmountBreakdown()
+    # Nur an Kommas/Semikolons trennen, denen keine Ziffer folgt (kein Dezimal-/Tausenderkomma)
+    for segment in re.split(r"[;,](?!\d)|\n", text or ""):
+        labels = _labels(segment)
+        numbers = NUMBER_PATTERN.findall(segment)
+        if not labels or not numbers:
+            continue
+        if len(labels) > 1 or len(numbers) > 1:
+            # Zuordnung Zahl ↔ Stichwort nicht sicher (z. B. "2.915,50 € brutto (2.450,00 € netto)") → LLM
+            result.mehrdeutig = True
+            continue
+        label = labels.pop()
+        try:
+            betrag = parse_amount(numbers[0], locale=locale)
+        except AmbiguousAmountError:
+            result.mehrdeutig = True
+            continue
+        except ValueError:
+            continue
+
+        result.betraege += 1
+        if label == "steuer":
+            # Mehrere Steuersätze werden addiert
+            result.steuer = betrag if result.steuer is None else result.steuer + betrag
+        else:
+            setattr(result, label, betrag)
+
+    if result.brutto is None and result.netto is not None and result.steuer is not None:
+        result.brutto = result.netto + result.steuer
+    return result
+
+
+def count_amount(path):
+    # Zähler für schnellen Pfad ("fast_path") bzw. LLM-Rückfall ("llm_fallback") erhöhen
+    _stats.count(path)
+
+
+def amount_stats():
+    # Aktuelle Zählerstände inkl. Anteil des schnellen Pfads
+    return _stats.snapshot()
@@ -0,0 +1,205 @@
+# approval_queue.py – persistente Warteschlange für menschliche Entscheidungen (Genehmigung, Rückfrage zur Prüfung)
+# Betroffene Rechnungen parken im Status "offen", bis über UI oder CLI entschieden wurde; danach wird fortgesetzt.
+# Aufruf: python -m utils.approval_queue list --rolle Teamleiter
+#         python -m utils.approval_queue approve --rolle Teamleiter --user teamleiter --password ... [--id 3 --id 4]
+import argparse
+import json
+import os
+import time
+from config import APPROVAL_QUEUE_DB_PATH
+from utils.hashing import sha256_file
+from utils.db import get_connection, transaction
+from utils.invoice_record import InvoiceRecord
+from utils.login import check_credentials
+
+STATUS_OFFEN = "offen"
+STATUS_GENEHMIGT = "genehmigt"
+STATUS_VERWEIGERT = "verweigert"
+
+SPALTEN = (
+    "id", "vorgang", "step", "rolle", "status", "grund", "lieferant", "rechnungsnummer", "brutto",
+    "pdf_path", "results_path", "workflow_status_path", "erstellt", "entschieden", "entschieden_von",
+    "kommentar", "fortgesetzt"
+)
+
+_initialized = set()
+
+
+def document_id(context):
+    # Vorgangskennung: Inhalts-Hash der PDF (gleiche Rechnung = gleiche Entscheidung), sonst Pfad der Ergebnisse
+    if context.document_id:
+        return context.document_id
+    if context.pdf_path and os.path.exists(context.pdf_path):
+        return sha256_file(context.pdf_path)
+    return os.path.abspath(context.results_path or "")
+
+
+def _row_to_dict(row):
+    return dict(zip(SPALTEN, row)) if row else None
+
+
+class ApprovalQueue:
+    def __init__(self, db_path=APPROVAL_QUEUE_DB_PATH):
+        self.db_path = db_path
+        key = os.path.abspath(db_path)
+        if key not in _initialized:
+            with transaction(db_path) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS approvals (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        vorgang TEXT NOT NULL,
+                        step TEXT NOT NULL,
+                        rolle TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'offen',
+                        grund TEXT,
+                        lieferant TEXT,
+                        rechnungsnummer TEXT,
+                        brutto REAL,
+                        pdf_path TEXT,
+                        results_path TEXT,
+                        workflow_status_path TEXT,
+                        erstellt REAL,
+                        entschieden REAL,
+                        entschieden_von TEXT,
+                        kommentar TEXT,
+                        fortgesetzt INTEGER NOT NULL DEFAULT 0,
+                        UNIQUE (vorgang, step)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_approvals_status_rolle ON approvals(status, rolle)")
+            _initialized.add(key)
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def request(self, context, step, rolle, grund, brutto=None):
+        # Entscheidung anfordern; liegt für den Vorgang schon eine vor (offen oder entschieden), wird sie geliefert
+        record = InvoiceRecord.from_context(context)
+        if brutto is None and record.brutto is not None:
+            brutto = float(record.brutto)
+        vorgang = document_id(context)
+        with transaction(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO approvals (vorgang, step, rolle, grund, lieferant, rechnungsnummer, brutto, "
+                "pdf_path, results_path, workflow_status_path, erstellt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(vorgang, step) DO UPDATE SET "
+                "results_path = excluded.results_path, workflow_status_path = excluded.workflow_status_path, "
+                "pdf_path = excluded.pdf_path",
+                (vorgang, step, rolle, grund, record.lieferant, record.rechnungsnummer, brutto,
+                 context.pdf_path, context.results_path, context.workflow_status_path, time.time())
+            )
+            row = conn.execute(
+                f"SELECT {', '.join(SPALTEN)} FROM approvals WHERE vorgang = ? AND step = ?", (vorgang, step)
+            ).fetchone()
+        return _row_to_dict(row)
+
+    def get(self, item_id):
+        row = self._conn().execute(
+            f"SELECT {', '.join(SPALTEN)} FROM approvals WHERE id = ?", (item_id,)
+        ).fetchone()
+        return _row_to_dict(row)
+
+    def _where(self, status=None, rolle=None, step=None, lieferant=None, min_brutto=None, max_brutto=None, ids=None):
+        bedingungen, werte = [], []
+        for spalte, wert in (("status", status), ("rolle", rolle), ("step", step)):
+            if wert is not None:
+                bedingungen.append(f"{spalte} = ?")
+                werte.append(wert)
+        if lieferant:
+            bedingungen.append("lieferant LIKE ?")
+            werte.append(f"%{lieferant}%")
+        if min_brutto is not None:
+            bedingungen.append("brutto >= ?")
+            werte.append(min_brutto)
+        if max_brutto is not None:
+            bedingungen.append("brutto <= ?")
+            werte.append(max_brutto)
+        if ids:
+            bedingungen.append(f"id IN ({', '.join('?' for _ in ids)})")
+            werte.extend(ids)
+        return (" WHERE " + " AND ".join(bedingungen)) if bedingungen else "", werte
+
+    def list(self, status=STATUS_OFFEN, **filter):
+        # Einträge (Standard: offene) nach Rolle, Schritt, Lieferant oder Betragsbereich gefiltert, älteste zuerst
+        where, werte = self._where(status=status, **filter)
+        rows = self._conn().execute(
+            f"SELECT {', '.join(SPALTEN)} FROM approvals{where} ORDER BY erstellt, id", werte
+        ).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def pending(self, **filter):
+        return self.list(STATUS_OFFEN, **filter)
+
+    def decide(self, item_id, genehmigt, username, password, kommentar=None):
+        # Einzelentscheidung; nur mit Zugangsdaten der geforderten Rolle. True, wenn entschieden wurde
+        item = self.get(item_id)
+        if item is None or item["status"] != STATUS_OFFEN:
+            return False
+        if not check_credentials(username, password, role=item["rolle"]):
+            return False
+        return self._set_status([item_id], item["rolle"], genehmigt, username, kommentar) == 1
+
+    def bulk_approve(self, rolle, username, password, kommentar=None, **filter):
+        # Alle offenen Einträge einer Rolle (optional weiter gefiltert) auf einmal genehmigen; Anzahl
+        if not check_credentials(username, password, role=rolle):
+            return 0
+        ids = [item["id"] for item in self.pending(rolle=rolle, **filter)]
+        return self._set_status(ids, rolle, True, username, kommentar) if ids else 0
+
+    def _set_status(self, ids, rolle, genehmigt, username, kommentar):
+        status = STATUS_GENEHMIGT if genehmigt else STATUS_VERWEIGERT
+        with transaction(self.db_path) as conn:
+            cursor = conn.execute(
+                f"UPDATE approvals SET status = ?, entschieden = ?, entschieden_von = ?, kommentar = ? "
+                f"WHERE status = ? AND rolle = ? AND id IN ({', '.join('?' for _ in ids)})",
+                (status, time.time(), username, kommentar, STATUS_OFFEN, rolle, *ids)
+            )
+            return cursor.rowcount
+
+    def resumable(self):
+        # Entschiedene Vorgänge, deren Lauf noch nicht fortgesetzt wurde
+        rows = self._conn().execute(
+            f"SELECT {', '.join(SPALTEN)} FROM approvals WHERE status != ? AND fortgesetzt = 0 ORDER BY entschieden",
+            (STATUS_OFFEN,)
+        ).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def mark_resumed(self, item_id):
+        with transaction(self.db_path) as conn:
+            conn.execute("UPDATE approvals SET fortgesetzt = 1 WHERE id = ?", (item_id,))
+
+    def stats(self):
+        # Anzahl Einträge je Status und Rolle
+        rows = self._conn().execute("SELECT status, rolle, COUNT(*) FROM approvals GROUP BY status, rolle").fetchall()
+        stats = {}
+        for status, rolle, anzahl in rows:
+            stats.setdefault(status, {})[rolle] = anzahl
+        return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offene Freigaben anzeigen und entscheiden")
+    parser.add_argument("befehl", choices=["list", "approve", "reject"])
+    parser.add_argument("--rolle")
+    parser.add_argument("--step", choices=["approval", "check"])
+    parser.add_argument("--lieferant")
+    parser.add_argument("--id", type=int, action="append", dest="ids")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--kommentar")
+    args = parser.parse_args()
+
+    queue = ApprovalQueue()
+    if args.befehl == "list":
+        for item in queue.pending(rolle=args.rolle, step=args.step, lieferant=args.lieferant, ids=args.ids):
+            print(json.dumps(item, ensure_ascii=False))
+    elif args.befehl == "approve" and args.rolle:
+        anzahl = queue.bulk_approve(args.rolle, args.user, args.password, args.kommentar,
+                                    step=args.step, lieferant=args.lieferant, ids=args.ids)
+        print(f"{anzahl} Freigabe(n) erteilt.")
+    else:
+        entschieden = [
+            i for i in args.ids or []
+            if queue.decide(i, args.befehl == "approve", args.user, args.password, args.kommentar)
+        ]
+        print(f"Entschieden: {entschieden}")
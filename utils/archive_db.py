@@ -0,0 +1,328 @@
+# archive_db.py – Schema der Archivdatenbank (versioniert über PRAGMA user_version) und Dublettenprüfung
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from config import (
+    ARCHIVE_DB_PATH, ARCHIVE_BLOOM_PATH, ARCHIVE_BLOOM_ERROR_RATE,
+    ARCHIVE_BLOOM_MIN_CAPACITY, ARCHIVE_BLOOM_REFRESH_S
+)
+from utils.bloom_filter import BloomFilter
+from utils.db import get_connection, transaction
+from utils.invoice_record import InvoiceRecord
+
+# Rechtsformen, die beim Vergleich von Lieferantennamen keine Rolle spielen
+RECHTSFORMEN = re.compile(
+    r"\b(gmbh\s*&\s*co\.?\s*kg|gmbh|mbh|ag|kg|ohg|ug|e\.\s*k\.|e\.\s*v\.|se|ltd|inc|co)\b\.?"
+)
+
+
+def normalize_invoice_number(rechnungsnummer):
+    # "Rechnungsnummer: RE-2024/001" → "RE2024001" (nur Buchstaben und Ziffern, Großschreibung)
+    if not rechnungsnummer:
+        return ""
+    nummer = re.sub(r"^\s*Rechnungsnummer\s*[:\-]?\s*", "", rechnungsnummer, flags=re.IGNORECASE)
+    return re.sub(r"[\W_]+", "", nummer).upper()
+
+
+def normalize_supplier(lieferant):
+    # "Muster Bau GmbH, Hauptstr. 1" → "musterbau" (erste Zeile, ohne Rechtsform und Sonderzeichen)
+    if not lieferant:
+        return ""
+    name = re.split(r"[,\n]", lieferant)[0].casefold()
+    name = RECHTSFORMEN.sub(" ", name)
+    return re.sub(r"[\W_]+", "", name)
+
+
+def invoice_key(lieferant, rechnungsnummer):
+    # Fachlicher Schlüssel "lieferant|nummer"; None, wenn keine Rechnungsnummer vorliegt
+    nummer = normalize_invoice_number(rechnungsnummer)
+    if not nummer:
+        return None
+    return f"{normalize_supplier(lieferant)}|{nummer}"
+
+
+def iso_date(datum):
+    # "31.01.2024" → "2024-01-31"; unbekannte Formate bleiben unverändert
+    if not datum:
+        return None
+    datum = datum.strip()
+    for fmt in ("%d.%m.%Y", "%d.%m.%y", "%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(datum, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return datum
+
+
+def _v1(conn):
+    # Ursprüngliche Tabelle
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rechnungsnummer TEXT,
+            archiviert_am TEXT,
+            pfad TEXT
+        )
+    """)
+
+
+def _legacy_results(pfad):
+    # (results.json, Rechnungsdatensatz) eines bestehenden Archiveintrags; (None, None) falls nicht lesbar
+    try:
+        with open(os.path.join(pfad, "results.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, TypeError, json.JSONDecodeError):
+        return None, None
+    if data.get("invoice_record"):
+        return data, InvoiceRecord.from_dict(data["invoice_record"])
+    return data, InvoiceRecord.from_validation(data.get("validation", ""))
+
+
+def _v2(conn):
+    # Lieferant, Rechnungsdatum und fachlicher Schlüssel; eindeutiger Index statt Volltabellen-Scan
+    conn.execute("ALTER TABLE archive ADD COLUMN lieferant TEXT")
+    conn.execute("ALTER TABLE archive ADD COLUMN rechnungsdatum TEXT")
+    conn.execute("ALTER TABLE archive ADD COLUMN invoice_key TEXT")
+
+    # Bestand nachtragen; bei Dubletten behält nur der älteste Eintrag den Schlüssel (übrige: NULL)
+    vergeben = set()
+
+    def backfill():
+        for row_id, rechnungsnummer, pfad in conn.execute(
+                "SELECT id, rechnungsnummer, pfad FROM archive ORDER BY id").fetchall():
+            _, record = _legacy_results(pfad)
+            lieferant, datum = (record.lieferant, record.ausstellungsdatum) if record else (None, None)
+            key = invoice_key(lieferant, rechnungsnummer)
+            if key in vergeben:
+                key = None
+            elif key:
+                vergeben.add(key)
+            yield lieferant, iso_date(datum), key, row_id
+
+    conn.executemany(
+        "UPDATE archive SET lieferant = ?, rechnungsdatum = ?, invoice_key = ? WHERE id = ?", backfill()
+    )
+
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_archive_invoice_key ON archive(invoice_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_rechnungsnummer ON archive(rechnungsnummer)")
+
+
+def _v3(conn):
+    # Kostenstelle und Leistungstext je Rechnung (Trainingsdaten für den Kostenstellen-Klassifikator)
+    conn.execute("ALTER TABLE archive ADD COLUMN kostenstelle TEXT")
+    conn.execute("ALTER TABLE archive ADD COLUMN leistung TEXT")
+
+    def backfill():
+        for row_id, pfad in conn.execute("SELECT id, pfad FROM archive ORDER BY id").fetchall():
+            data, record = _legacy_results(pfad)
+            if data:
+                yield data.get("accounting"), record.leistung, row_id
+
+    conn.executemany("UPDATE archive SET kostenstelle = ?, leistung = ? WHERE id = ?", backfill())
+
+
+def _v4(conn):
+    # Verweise auf den Blob-Store (SHA-256 von PDF und results.json); alte Zeilen behalten ihren Ordner in pfad
+    conn.execute("ALTER TABLE archive ADD COLUMN pdf_blob TEXT")
+    conn.execute("ALTER TABLE archive ADD COLUMN results_blob TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_pdf_blob ON archive(pdf_blob)")
+
+
+# Index + 1 = Schemaversion; neue Migrationen nur hinten anhängen
+MIGRATIONS = [_v1, _v2, _v3, _v4]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def migrate(db_path=ARCHIVE_DB_PATH):
+    # Ausstehende Migrationen in einer Transaktion anwenden; je Prozess und Datei nur einmal
+    key = os.path.abspath(db_path)
+    with _migrated_lock:
+        if key in _migrated:
+            return SCHEMA_VERSION
+
+        with transaction(db_path) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for step in MIGRATIONS[version:]:
+                step(conn)
+            if version < SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        _migrated.add(key)
+        return SCHEMA_VERSION
+
+
+def _lookup_keys(lieferant, rechnungsnummer):
+    # Eigener Schlüssel plus Schlüssel ohne Lieferant (Bestand, dessen Lieferant unbekannt war)
+    key = invoice_key(lieferant, rechnungsnummer)
+    if key is None:
+        return []
+    return [key] if key.startswith("|") else [key, "|" + key.split("|", 1)[1]]
+
+
+class ArchivePrefilter:
+    # Bloom-Filter über alle invoice_keys des Archivs: "sicher nicht archiviert" ohne Datenbankzugriff
+    def __init__(self, db_path=ARCHIVE_DB_PATH, snapshot_path=ARCHIVE_BLOOM_PATH,
+                 error_rate=ARCHIVE_BLOOM_ERROR_RATE, refresh_s=ARCHIVE_BLOOM_REFRESH_S):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self.error_rate = error_rate
+        self.refresh_s = refresh_s
+        self.max_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.skipped = 0
+        self.false_positives = 0
+        self.load()
+
+    def load(self):
+        # Snapshot laden und nur Zeilen mit id > max_id nachtragen; sonst komplett aus der DB aufbauen
+        migrate(self.db_path)
+        conn = get_connection(self.db_path)
+        total, max_id = conn.execute(
+            "SELECT COUNT(invoice_key), COALESCE(MAX(id), 0) FROM archive"
+        ).fetchone()
+
+        bloom, meta = BloomFilter.load(self.snapshot_path) if self.snapshot_path else (None, {})
+        rebuilt = (bloom is None or meta.get("db_path") != os.path.abspath(self.db_path)
+                   or meta.get("max_id", 0) > max_id or max(total, len(bloom)) > bloom.capacity)
+        if rebuilt:
+            # Kein/fremder/veralteter Snapshot oder Filter zu klein: neu aufbauen (mit Reserve)
+            bloom = BloomFilter(max(ARCHIVE_BLOOM_MIN_CAPACITY, total * 2), self.error_rate)
+            meta = {"max_id": 0}
+
+        with self._lock:
+            self.bloom = bloom
+            self.max_id = meta.get("max_id", 0)
+        if not self.refresh(force=True) and rebuilt:
+            self.save()
+
+    def refresh(self, force=False):
+        # Neue Zeilen (auch von anderen Prozessen) nachladen und Snapshot fortschreiben;
+        # liefert die Anzahl nachgeladener Zeilen
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < self.refresh_s:
+            return 0
+        with self._lock:
+            self._refreshed_at = now
+            rows = get_connection(self.db_path).execute(
+                "SELECT id, invoice_key FROM archive WHERE id > ? ORDER BY id", (self.max_id,)
+            ).fetchall()
+            for row_id, key in rows:
+                if key:
+                    self.bloom.add(key)
+                self.max_id = row_id
+        if len(self.bloom) > self.bloom.capacity:
+            self.load()
+        elif rows:
+            self.save()
+        return len(rows)
+
+    def add(self, key):
+        # Nach erfolgreichem Insert im eigenen Prozess sofort eintragen
+        if key:
+            self.bloom.add(key)
+
+    def might_contain(self, keys):
+        self.refresh()
+        with self._lock:
+            self.checks += 1
+            treffer = any(key in self.bloom for key in keys)
+            if not treffer:
+                self.skipped += 1
+            return treffer
+
+    def record_false_positive(self):
+        with self._lock:
+            self.false_positives += 1
+
+    def save(self):
+        if self.snapshot_path:
+            self.bloom.save(self.snapshot_path, db_path=os.path.abspath(self.db_path), max_id=self.max_id)
+
+    def stats(self):
+        # Füllstand, Speicherbedarf sowie erwartete und gemessene Falsch-positiv-Rate
+        # (gemessen: Anteil der nicht archivierten Rechnungen, die trotzdem die DB abfragen mussten)
+        with self._lock:
+            moegliche = self.checks - self.skipped
+            negative = self.skipped + self.false_positives
+            return {
+                "eintraege": len(self.bloom),
+                "kapazitaet": self.bloom.capacity,
+                "speicher_bytes": self.bloom.memory_bytes,
+                "fpr_erwartet": round(self.bloom.expected_fpr(), 6),
+                "abfragen": self.checks,
+                "ohne_db": self.skipped,
+                "falsch_positiv": self.false_positives,
+                "fpr_gemessen": round(self.false_positives / negative, 6) if negative else 0.0,
+                "moegliche_treffer": moegliche
+            }
+
+
+_prefilters = {}
+_prefilters_lock = threading.Lock()
+
+
+def get_prefilter(db_path=ARCHIVE_DB_PATH):
+    # Ein Filter je Datenbank und Prozess; eigener Snapshot nur für die Standard-Datenbank
+    key = os.path.abspath(db_path)
+    with _prefilters_lock:
+        if key not in _prefilters:
+            snapshot = ARCHIVE_BLOOM_PATH if key == os.path.abspath(ARCHIVE_DB_PATH) else None
+            _prefilters[key] = ArchivePrefilter(db_path, snapshot_path=snapshot)
+        return _prefilters[key]
+
+
+def prefilter_stats(db_path=ARCHIVE_DB_PATH):
+    return get_prefilter(db_path).stats()
+
+
+def is_archived(lieferant, rechnungsnummer, db_path=ARCHIVE_DB_PATH):
+    # Erst Bloom-Filter (sicher neu → keine Datenbankabfrage), dann Indexsuche über invoice_key
+    keys = _lookup_keys(lieferant, rechnungsnummer)
+    if not keys:
+        return False
+    prefilter = get_prefilter(db_path)
+    if not prefilter.might_contain(keys):
+        return False
+
+    placeholders = ", ".join("?" for _ in keys)
+    row = get_connection(db_path).execute(
+        f"SELECT 1 FROM archive WHERE invoice_key IN ({placeholders}) LIMIT 1", keys
+    ).fetchone()
+    if row is None:
+        prefilter.record_false_positive()
+    return row is not None
+
+
+def claim(conn, lieferant, rechnungsnummer, rechnungsdatum, pfad, db_path=ARCHIVE_DB_PATH,
+          kostenstelle=None, leistung=None, pdf_blob=None, results_blob=None):
+    # Atomarer Check-and-Insert innerhalb einer laufenden Transaktion.
+    # False, wenn die Rechnung (gleicher Schlüssel) bereits archiviert ist.
+    keys = _lookup_keys(lieferant, rechnungsnummer)
+    if len(keys) > 1 and conn.execute(
+        "SELECT 1 FROM archive WHERE invoice_key = ? LIMIT 1", (keys[1],)
+    ).fetchone():
+        return False
+
+    cursor = conn.execute(
+        "INSERT INTO archive (rechnungsnummer, archiviert_am, pfad, lieferant, rechnungsdatum, invoice_key, "
+        "kostenstelle, leistung, pdf_blob, results_blob) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(invoice_key) DO NOTHING",
+        (rechnungsnummer, datetime.now().isoformat(), pfad, lieferant,
+         iso_date(rechnungsdatum), keys[0] if keys else None, kostenstelle, leistung, pdf_blob, results_blob)
+    )
+    if cursor.rowcount != 1:
+        return False
+
+    # Bereits geladenen Filter sofort ergänzen (ein Rollback erzeugt höchstens einen Falsch-positiv-Treffer)
+    prefilter = _prefilters.get(os.path.abspath(db_path))
+    if prefilter and keys:
+        prefilter.add(keys[0])
+    return True
@@ -0,0 +1,17 @@
+# async_threads.py – blockierende Arbeit (DB, Datei-IO, PDF-Seiten) aus Coroutinen heraus im Thread ausführen
+import asyncio
+
+
+async def to_thread(func, *args, complete=False):
+    # Wie asyncio.to_thread, aber ein Abbruch (z. B. Zeitlimit eines Schritts) wartet das Ende des Threads ab:
+    # Threads lassen sich nicht abbrechen, und danach darf nichts mehr den Laufzustand ändern oder parallel zu
+    # einem erneuten Versuch laufen (z. B. derselbe Seiten-Generator). complete=True liefert dann das Ergebnis
+    # statt des Abbruchs (für die letzte Arbeit eines Schritts, etwa Status setzen und Checkpoint)
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait({future})
+        if complete:
+            return future.result()
+        raise
@@ -0,0 +1,79 @@
+# bench_archive_db.py – Dublettenprüfung im Archiv: altes Schema (COUNT(*)-Scan) vs. migriertes Schema (Index)
+# Aufruf: python -m utils.bench_archive_db [--rows 1000000] [--lookups 1000]
+import argparse
+import os
+import random
+import tempfile
+import time
+from utils import archive_db
+from utils.db import get_connection, transaction, close_all
+
+LIEFERANTEN = [f"Lieferant {i} GmbH" for i in range(500)]
+
+
+def fill_legacy(db_path, rows):
+    # Tabelle im ursprünglichen Schema (Version 1) mit Zufallsdaten füllen
+    with transaction(db_path) as conn:
+        archive_db.MIGRATIONS[0](conn)
+        conn.execute("PRAGMA user_version = 1")
+        conn.executemany(
+            "INSERT INTO archive (rechnungsnummer, archiviert_am, pfad) VALUES (?, ?, ?)",
+            ((f"RE-{n:08d}", "2024-01-01T00:00:00", f"archive/RE-{n:08d}") for n in range(rows))
+        )
+
+
+def timed(label, func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    dauer = time.perf_counter() - start
+    print(f"{label:<42} {dauer / count * 1000:>10.3f} ms/Aufruf")
+
+
+def main(rows, lookups):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "archive.db")
+        conn = get_connection(db_path)
+
+        start = time.perf_counter()
+        fill_legacy(db_path, rows)
+        print(f"{rows} Zeilen angelegt: {time.perf_counter() - start:.1f}s")
+
+        nummern = [f"RE-{random.randrange(rows * 2):08d}" for _ in range(lookups)]
+        it = iter(nummern * 2)
+
+        # Alter Pfad: COUNT(*) ohne Index (nur wenige Aufrufe, da jeder die ganze Tabelle liest)
+        scans = max(1, min(lookups, 20))
+        timed("alt: COUNT(*) ohne Index", lambda: conn.execute(
+            "SELECT COUNT(*) FROM archive WHERE rechnungsnummer = ?", (next(it),)
+        ).fetchone(), scans)
+
+        start = time.perf_counter()
+        archive_db.migrate(db_path)
+        print(f"Migration auf Version {archive_db.SCHEMA_VERSION}: {time.perf_counter() - start:.1f}s")
+
+        it = iter(nummern)
+        timed("neu: is_archived (Index auf invoice_key)",
+              lambda: archive_db.is_archived(None, next(it), db_path), lookups)
+
+        # Atomarer Check-and-Insert: neue Rechnungen und Dubletten
+        neu = iter(range(lookups))
+        def claim_neu():
+            with transaction(db_path) as c:
+                archive_db.claim(c, random.choice(LIEFERANTEN), f"NEU-{next(neu)}", "01.02.2024", "archive/x")
+        timed("neu: claim (neue Rechnung)", claim_neu, lookups)
+
+        def claim_dublette():
+            with transaction(db_path) as c:
+                assert not archive_db.claim(c, None, "RE-00000001", None, "archive/x")
+        timed("neu: claim (Dublette)", claim_dublette, lookups)
+
+        close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark der Archiv-Dublettenprüfung")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.rows, args.lookups)
@@ -0,0 +1,88 @@
+# bench_pdf_parser.py – Laufzeit der PDF-Textextraktion (sequentiell vs. Prozesspool) auf synthetischen PDFs
+# Aufruf: python -m utils.bench_pdf_parser [--pages 1 10 100]
+import argparse
+import os
+import tempfile
+import time
+from utils import pdf_parser
+from utils.hashing import sha256_file
+
+ZEILEN_JE_SEITE = 45
+
+
+def write_synthetic_pdf(path, page_count):
+    # Minimales PDF mit Helvetica-Textseiten (ohne zusätzliche Abhängigkeiten)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,                                                    # Seitenbaum, wird unten gesetzt
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    kids = []
+    for p in range(page_count):
+        zeilen = " ".join(
+            f"(Position {z + 1} Seite {p + 1}: Beratungsleistung 12,50 EUR x 8 = 100,00 EUR) '"
+            for z in range(ZEILEN_JE_SEITE)
+        )
+        stream = f"BT /F1 9 Tf 40 800 Td 16 TL {zeilen} ET".encode("latin-1")
+        page_nr, content_nr = len(objects) + 1, len(objects) + 2
+        kids.append(f"{page_nr} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_nr} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for nr, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{nr} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def measure(path, parallel):
+    # Cache leeren, damit wirklich extrahiert wird
+    pdf_parser._memory_cache.clear()
+    cache_file = pdf_parser._cache_path(sha256_file(path))
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    start = time.perf_counter()
+    first_page = None
+    for n, _ in enumerate(pdf_parser.iter_pdf_pages(path, parallel=parallel)):
+        if n == 0:
+            first_page = time.perf_counter() - start
+    return time.perf_counter() - start, first_page
+
+
+def main(page_counts):
+    # Alle Pool-Prozesse vorab starten (spawn startet sie erst bei Bedarf), damit die Startzeit nicht in die Messung fällt
+    list(pdf_parser._get_pool().map(time.sleep, [0.2] * pdf_parser.PDF_PARALLEL_WORKERS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'Seiten':>6} | {'sequentiell':>11} | {'Pool':>8} | {'1. Seite (Pool)':>15}")
+        for pages in page_counts:
+            path = os.path.join(tmp, f"synthetisch_{pages}.pdf")
+            write_synthetic_pdf(path, pages)
+            seq, _ = measure(path, parallel=False)
+            par, first = measure(path, parallel=True)
+            print(f"{pages:>6} | {seq:>10.3f}s | {par:>7.3f}s | {first:>14.3f}s")
+
+        # Zweiter Aufruf trifft den Cache (Datei-Hash)
+        start = time.perf_counter()
+        pdf_parser.extract_text_from_pdf(path)
+        print(f"Cache-Treffer ({page_counts[-1]} Seiten): {time.perf_counter() - start:.4f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark der PDF-Textextraktion")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+    main(args.pages)
@@ -0,0 +1,61 @@
+# bench_validation.py – vergleicht LLM-Aufrufe und Laufzeit des Validierungsschritts (legacy vs. structured)
+# Aufruf: python -m utils.bench_validation data/invoices/rechnung1.pdf [weitere.pdf ...]
+import sys
+import time
+from agents.supervisor_agent import SupervisorAgent
+from agents.validation_agent import ValidationAgent
+from utils.run_context import RunContext
+
+
+class CountingLLM:
+    # Zählt die Aufrufe an das eigentliche LLM (Wrapper um llm.invoke). Ein CachedLLM wird umgangen, sonst
+    # beantwortete ab der zweiten Messung der Antwort-Cache und Cache-Treffer zählten als Aufrufe
+    def __init__(self, llm):
+        self.llm = getattr(llm, "client", llm)
+        self.calls = 0
+
+    def invoke(self, *args, **kwargs):
+        self.calls += 1
+        return self.llm.invoke(*args, **kwargs)
+
+
+def run_validation_step(pdf_path, mode):
+    # Validierungsschritt wie im Supervisor inkl. Nachprüfung fehlender Felder, ohne Dateiablage
+    start = time.perf_counter()
+    context = RunContext(pdf_path=pdf_path, results_path=None, workflow_status_path=None)
+    supervisor = SupervisorAgent(pdf_path, context=context)
+    supervisor.validation_agent = ValidationAgent(pdf_path, mode=mode)
+
+    counter = CountingLLM(supervisor.validation_agent.llm)
+    supervisor.validation_agent.llm = counter
+    supervisor.llm = CountingLLM(supervisor.llm)
+
+    if mode == "legacy":
+        # Altes Verhalten: Nachprüfung mit neuer Instanz (PDF wird erneut geparst)
+        def rerun(fehlende_felder):
+            agent = ValidationAgent(pdf_path, mode=mode)
+            agent.llm = counter
+            return agent.run(missing_fields=fehlende_felder)
+        supervisor.rerun_validation_for_missing = rerun
+
+    supervisor.run_agent_and_validate("validation", lambda: supervisor.validation_agent.run())
+    return {
+        "llm_aufrufe": counter.calls + supervisor.llm.calls,
+        "dauer_s": time.perf_counter() - start
+    }
+
+
+def main(pdf_paths):
+    for mode in ("legacy", "structured"):
+        messungen = [run_validation_step(path, mode) for path in pdf_paths]
+        n = len(messungen)
+        aufrufe = sum(m["llm_aufrufe"] for m in messungen) / n
+        dauer = sum(m["dauer_s"] for m in messungen) / n
+        print(f"{mode:<10} | {n} Rechnung(en) | Ø LLM-Aufrufe: {aufrufe:.2f} | Ø Dauer: {dauer:.2f} s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Aufruf: python -m utils.bench_validation <rechnung.pdf> [...]")
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -0,0 +1,173 @@
+# blob_store.py – inhaltsadressierte Ablage (SHA-256) für archivierte PDFs und Ergebnisse
+# Gleiche Inhalte liegen genau einmal auf der Platte; PDFs werden wo möglich per Reflink (Copy-on-Write) abgelegt.
+# Kein Hardlink: der Blob teilte sich dann die Datei mit der weiterhin beschreibbaren Quelle (z. B. Upload-Ordner),
+# und jede spätere Änderung der Quelle würde das Archiv unbemerkt mit verändern.
+# Aufruf: python -m utils.blob_store stats
+#         python -m utils.blob_store import-legacy [--delete]   (alte Archivordner übernehmen)
+import argparse
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+from config import (
+    ARCHIVE_BLOB_DIR, ARCHIVE_BLOB_PLACEMENT, ARCHIVE_BLOB_COMPRESS, ARCHIVE_DB_PATH, ARCHIVE_STORE_BACKEND
+)
+from utils.archive_db import migrate
+from utils.db import get_connection, transaction
+from utils.hashing import sha256_file
+from utils.segment_store import SegmentStore
+
+try:
+    import zstandard
+except ImportError:                                     # Komprimierung ist optional
+    zstandard = None
+
+# ioctl FICLONE (Linux): Copy-on-Write-Kopie auf Btrfs, XFS u. a.
+FICLONE = 0x40049409
+
+ZSTD_SUFFIX = ".zst"
+
+
+def _reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def _tmp_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class BlobStore:
+    def __init__(self, root=ARCHIVE_BLOB_DIR, placement=ARCHIVE_BLOB_PLACEMENT, compress=ARCHIVE_BLOB_COMPRESS):
+        self.root = root
+        self.placement = placement
+        self.compress = compress and zstandard is not None
+
+    def path(self, digest):
+        # Zwei Verzeichnisebenen (ab/cd/abcd…), damit kein Ordner zu groß wird; komprimierte Blobs mit .zst
+        base = os.path.join(self.root, digest[:2], digest[2:4], digest)
+        return base + ZSTD_SUFFIX if os.path.exists(base + ZSTD_SUFFIX) else base
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def _place(self, src, dst):
+        # Erstes funktionierendes Verfahren (reflink → copy); Ergebnis: verwendetes Verfahren
+        tmp = _tmp_path(dst)
+        for verfahren in self.placement:
+            try:
+                if verfahren == "reflink":
+                    _reflink(src, tmp)
+                else:
+                    shutil.copyfile(src, tmp)
+                os.replace(tmp, dst)
+                return verfahren
+            except OSError as e:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                if verfahren == "copy" or e.errno not in (
+                    errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EPERM
+                ):
+                    raise
+        raise OSError(f"Kein Ablageverfahren verfügbar: {self.placement}")
+
+    def put_file(self, src, digest=None):
+        # Datei ablegen; existiert der Inhalt schon, wird nichts geschrieben. Ergebnis: SHA-256
+        digest = digest or sha256_file(src)
+        if self.exists(digest):
+            return digest
+        dst = self.path(digest)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        self._place(src, dst)
+        return digest
+
+    def put_bytes(self, data, compress=None):
+        # Bytes ablegen (Schlüssel = Hash des unkomprimierten Inhalts); optional zstd-komprimiert
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists(digest):
+            return digest
+        compress = self.compress if compress is None else compress and zstandard is not None
+        dst = os.path.join(self.root, digest[:2], digest[2:4], digest) + (ZSTD_SUFFIX if compress else "")
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = _tmp_path(dst)
+        with open(tmp, "wb") as f:
+            f.write(zstandard.ZstdCompressor(level=10).compress(data) if compress else data)
+        os.replace(tmp, dst)
+        return digest
+
+    def put_json(self, data):
+        # Kanonische Serialisierung, damit gleiche Ergebnisse denselben Hash ergeben
+        return self.put_bytes(json.dumps(data, ensure_ascii=False, sort_keys=True, indent=1).encode("utf-8"))
+
+    def get_bytes(self, digest):
+        path = self.path(digest)
+        with open(path, "rb") as f:
+            data = f.read()
+        return zstandard.ZstdDecompressor().decompress(data) if path.endswith(ZSTD_SUFFIX) else data
+
+    def get_json(self, digest):
+        return json.loads(self.get_bytes(digest))
+
+    def stats(self):
+        # Anzahl Blobs und belegter Speicher (Hardlinks älterer Ablagen zählen nur einmal je Inode)
+        blobs, groesse, inodes = 0, 0, set()
+        for ordner, _, dateien in os.walk(self.root):
+            for name in dateien:
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(ordner, name))
+                blobs += 1
+                if (stat.st_dev, stat.st_ino) not in inodes:
+                    inodes.add((stat.st_dev, stat.st_ino))
+                    groesse += stat.st_size
+        return {"blobs": blobs, "bytes": groesse, "zstd": self.compress}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_archive_store(backend=ARCHIVE_STORE_BACKEND):
+    # Prozessweit geteilte Ablage für den ArchiveAgent (Segmente halten ihre Speicherabbilder offen)
+    with _stores_lock:
+        if backend not in _stores:
+            _stores[backend] = SegmentStore() if backend == "segments" else BlobStore()
+        return _stores[backend]
+
+
+def import_legacy(store=None, db_path=ARCHIVE_DB_PATH, delete=False):
+    # Alte Archivordner (results.json + invoice.pdf) in die Ablage übernehmen; Anzahl übernommener Zeilen
+    store = store or get_archive_store()
+    migrate(db_path)
+    rows = get_connection(db_path).execute(
+        "SELECT id, pfad FROM archive WHERE pdf_blob IS NULL AND pfad IS NOT NULL"
+    ).fetchall()
+    uebernommen = 0
+    for row_id, pfad in rows:
+        pdf, results = os.path.join(pfad, "invoice.pdf"), os.path.join(pfad, "results.json")
+        if not (os.path.isfile(pdf) and os.path.isfile(results)):
+            continue
+        with open(results, "r", encoding="utf-8") as f:
+            results_blob = store.put_json(json.load(f))
+        pdf_blob = store.put_file(pdf)
+        with transaction(db_path) as conn:
+            conn.execute("UPDATE archive SET pdf_blob = ?, results_blob = ? WHERE id = ?",
+                         (pdf_blob, results_blob, row_id))
+        if delete:
+            shutil.rmtree(pfad, ignore_errors=True)
+        uebernommen += 1
+    return uebernommen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inhaltsadressierte Archivablage")
+    parser.add_argument("befehl", choices=["stats", "import-legacy"])
+    parser.add_argument("--delete", action="store_true", help="Alte Ordner nach der Übernahme löschen")
+    args = parser.parse_args()
+
+    if args.befehl == "import-legacy":
+        print(f"{import_legacy(delete=args.delete)} Archiveinträge übernommen.")
+    print(json.dumps(get_archive_store().stats()))
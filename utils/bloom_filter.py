@@ -0,0 +1,93 @@
+# bloom_filter.py – Bloom-Filter (probabilistische Mengenprüfung) mit Snapshot auf der Platte
+import hashlib
+import json
+import math
+import os
+import threading
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        # Bitanzahl m und Hashanzahl k aus erwarteter Größe und gewünschter Fehlerrate
+        self.capacity = max(1, int(capacity))
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        # Double Hashing: k Positionen aus zwei 64-Bit-Werten eines Hashes
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        with self._lock:
+            neu = False
+            for pos in self._positions(key):
+                byte, bit = divmod(pos, 8)
+                if not self.bits[byte] & (1 << bit):
+                    self.bits[byte] |= 1 << bit
+                    neu = True
+            if neu:
+                self.count += 1
+            return neu
+
+    def __contains__(self, key):
+        # False = sicher nicht enthalten; True = möglicherweise enthalten
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def memory_bytes(self):
+        return len(self.bits)
+
+    def expected_fpr(self):
+        # Theoretische Fehlerrate beim aktuellen Füllstand: (1 - e^(-k·n/m))^k
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def save(self, path, **meta):
+        # Snapshot atomar schreiben: JSON-Kopfzeile + Bitfeld
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        header = {"capacity": self.capacity, "error_rate": self.error_rate, "size": self.size,
+                  "hashes": self.hashes, "count": self.count, **meta}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock, open(tmp_path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # (Filter, Metadaten) aus einem Snapshot; (None, {}) wenn nicht vorhanden oder beschädigt
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                bits = f.read()
+        except (OSError, ValueError):
+            return None, {}
+
+        bloom = cls.__new__(cls)
+        try:
+            bloom.capacity = int(header.pop("capacity"))
+            bloom.error_rate = float(header.pop("error_rate"))
+            bloom.size = int(header.pop("size"))
+            bloom.hashes = int(header.pop("hashes"))
+            bloom.count = int(header.pop("count"))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            # Kopfzeile ohne Pflichtangaben (älteres Format, fremde Datei) → wie beschädigt behandeln
+            return None, {}
+        bloom.bits = bytearray(bits)
+        bloom._lock = threading.Lock()
+        if bloom.size < 8 or bloom.hashes < 1 or len(bloom.bits) != (bloom.size + 7) // 8:
+            return None, {}
+        return bloom, header
@@ -0,0 +1,87 @@
+# checkpoint_store.py – dauerhafte Checkpoints je Rechnung (Schrittergebnisse + Workflow-Status), Schlüssel = PDF-Hash
+# Ein neu gestarteter Prozess setzt jede unterbrochene Rechnung beim ersten unvollständigen Schritt fort.
+# Aufruf (offene Läufe anzeigen): python -m utils.checkpoint_store
+import json
+import os
+import time
+from config import CHECKPOINT_DB_PATH
+from utils.db import get_connection, transaction
+
+_initialized = set()
+
+
+def is_finished(workflow):
+    # Abgeschlossen (alle Schritte 2) oder abgebrochen (ein Schritt 3)
+    return all(v == 2 for v in workflow.values()) or any(v == 3 for v in workflow.values())
+
+
+class CheckpointStore:
+    def __init__(self, db_path=CHECKPOINT_DB_PATH):
+        self.db_path = db_path
+        key = os.path.abspath(db_path)
+        if key not in _initialized:
+            with transaction(db_path) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS checkpoints (
+                        doc_hash TEXT PRIMARY KEY,
+                        pdf_path TEXT,
+                        results_path TEXT,
+                        workflow_status_path TEXT,
+                        results TEXT NOT NULL,
+                        workflow TEXT NOT NULL,
+                        beendet INTEGER NOT NULL DEFAULT 0,
+                        erstellt REAL,
+                        aktualisiert REAL
+                    )
+                """)
+                # Teilindex: die Wiederaufnahme liest nur laufende Rechnungen, nicht das ganze Archiv
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_checkpoints_laufend ON checkpoints(aktualisiert) WHERE beendet = 0"
+                )
+            _initialized.add(key)
+
+    def save(self, context):
+        # Zustand eines Laufs sichern (Upsert je PDF-Hash)
+        results, workflow = dict(context.results), dict(context.workflow)
+        now = time.time()
+        with transaction(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO checkpoints (doc_hash, pdf_path, results_path, workflow_status_path, results, workflow, "
+                "beendet, erstellt, aktualisiert) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(doc_hash) DO UPDATE SET pdf_path = excluded.pdf_path, "
+                "results_path = excluded.results_path, workflow_status_path = excluded.workflow_status_path, "
+                "results = excluded.results, workflow = excluded.workflow, beendet = excluded.beendet, "
+                "aktualisiert = excluded.aktualisiert",
+                (context.document_id, context.pdf_path, context.results_path, context.workflow_status_path,
+                 json.dumps(results, ensure_ascii=False), json.dumps(workflow), int(is_finished(workflow)), now, now)
+            )
+
+    def load(self, doc_hash):
+        # (results, workflow) eines früheren Laufs oder None
+        row = get_connection(self.db_path).execute(
+            "SELECT results, workflow FROM checkpoints WHERE doc_hash = ?", (doc_hash,)
+        ).fetchone()
+        return (json.loads(row[0]), json.loads(row[1])) if row else None
+
+    def in_flight(self):
+        # Alle unterbrochenen bzw. wartenden Läufe (älteste zuerst) als Dicts
+        rows = get_connection(self.db_path).execute(
+            "SELECT doc_hash, pdf_path, results_path, workflow_status_path, workflow, aktualisiert "
+            "FROM checkpoints WHERE beendet = 0 ORDER BY aktualisiert"
+        ).fetchall()
+        return [
+            {"doc_hash": doc_hash, "pdf_path": pdf_path, "results_path": results_path,
+             "workflow_status_path": workflow_status_path, "workflow": json.loads(workflow),
+             "aktualisiert": aktualisiert}
+            for doc_hash, pdf_path, results_path, workflow_status_path, workflow, aktualisiert in rows
+        ]
+
+    def discard(self, doc_hash):
+        # Checkpoint verwerfen (Rechnung wird beim nächsten Mal komplett neu verarbeitet)
+        with transaction(self.db_path) as conn:
+            conn.execute("DELETE FROM checkpoints WHERE doc_hash = ?", (doc_hash,))
+
+
+if __name__ == "__main__":
+    for eintrag in CheckpointStore().in_flight():
+        print(json.dumps(eintrag, ensure_ascii=False))
@@ -0,0 +1,264 @@
+# cost_center_classifier.py – Kostenstellen-Zuordnung in Stufen: Schlüsselwörter → Vektormodell (Archiv) → LLM
+# Aufruf (Massenklassifikation): python -m utils.cost_center_classifier leistungen.txt
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, asdict
+from config import (
+    ARCHIVE_DB_PATH, COST_CENTER_MIN_CONFIDENCE, COST_CENTER_VECTOR_MODEL, COST_CENTER_VECTOR_MIN_EXAMPLES
+)
+from utils.cost_center import COST_CENTER_RULES, DEFAULT_COST_CENTER
+from utils.archive_db import migrate
+from utils.db import get_connection
+from utils.decision_stats import DecisionStats
+from utils.matching import positions
+
+# Gültige Kostenstellen (nur diese werden aus dem Archiv gelernt bzw. aus LLM-Antworten übernommen)
+KOSTENSTELLEN = sorted(set(COST_CENTER_RULES.values()) | {DEFAULT_COST_CENTER})
+
+# Abstand zur zweitbesten Kostenstelle, ab dem das Vektormodell volle Konfidenz erhält
+VEKTOR_ABSTAND = 0.2
+
+# Lokale Ergebnisse (Schlüsselwörter/Vektormodell) je Leistungstext, solange sich das Archiv nicht ändert
+_LOKAL_CACHE_SIZE = 1024
+
+# Zähler: welche Stufe entschieden hat
+_stats = DecisionStats(["keyword", "vektor", "default"], "llm")
+
+
+@dataclass(frozen=True)
+class Classification:
+    kostenstelle: str
+    konfidenz: float
+    stufe: str                                          # keyword | vektor | llm | default
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class KeywordMatcher:
+    # Stufe 1: alle Schlüsselwörter in einem kompilierten Muster (auch innerhalb von Komposita, z. B. Eingangsberatung)
+    def __init__(self, rules=COST_CENTER_RULES):
+        self.rules = {k.casefold(): v for k, v in rules.items()}
+        alternativen = sorted(self.rules, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(k) for k in alternativen), re.IGNORECASE)
+
+    def classify(self, leistung):
+        # Stimmen je Kostenstelle über alle Positionen; Konfidenz = Einigkeit × Abdeckung der Positionen
+        items = positions(leistung)
+        if not items:
+            return None
+        stimmen, abgedeckt = Counter(), 0
+        for item in items:
+            treffer = {self.rules[m.group(0).casefold()] for m in self.pattern.finditer(item)}
+            if treffer:
+                abgedeckt += 1
+                stimmen.update(treffer)
+        if not stimmen:
+            return None
+        kostenstelle, anzahl = stimmen.most_common(1)[0]
+        einigkeit = anzahl / sum(stimmen.values())
+        konfidenz = einigkeit * (0.5 + 0.5 * abgedeckt / len(items))
+        return Classification(kostenstelle, round(konfidenz, 3), "keyword")
+
+
+def _features(text):
+    # Wörter plus Zeichen-Trigramme je Wort (trägt Komposita und Flexion), L2-normiert
+    merkmale = Counter()
+    for wort in re.findall(r"\w{3,}", (text or "").casefold()):
+        merkmale["w:" + wort] += 1
+        wort = f"_{wort}_"
+        merkmale.update(wort[i:i + 3] for i in range(len(wort) - 2))
+    norm = math.sqrt(sum(v * v for v in merkmale.values())) or 1.0
+    return {k: v / norm for k, v in merkmale.items()}
+
+
+class VectorModel:
+    # Stufe 2: Nearest-Centroid über bisherige Zuordnungen aus dem Archiv (inkrementell nachtrainiert)
+    def __init__(self, db_path=ARCHIVE_DB_PATH):
+        self.db_path = db_path
+        self.centroids = {}
+        self.examples = 0
+        self.max_id = 0
+        self._signatur = None
+        self._lock = threading.Lock()
+
+    def learn(self, leistung, kostenstelle):
+        if kostenstelle not in KOSTENSTELLEN or not leistung:
+            return
+        centroid = self.centroids.setdefault(kostenstelle, Counter())
+        for k, v in _features(leistung).items():
+            centroid[k] += v
+        self.examples += 1
+
+    def _archive_signature(self):
+        # Änderungsmerkmal des Archivs (Datei und WAL); ändert sich mit jedem Commit, auch aus anderen Prozessen
+        signatur = []
+        for pfad in (self.db_path, self.db_path + "-wal"):
+            try:
+                stat = os.stat(pfad)
+                signatur.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signatur.append(None)
+        return tuple(signatur)
+
+    def train_from_archive(self):
+        # Nur neue Archivzeilen (id > max_id) lernen; solange das Archiv unverändert ist, ohne Abfrage.
+        # Ergebnis: Anzahl neu gelernter Zuordnungen
+        signatur = self._archive_signature()
+        if signatur == self._signatur:
+            return 0
+        migrate(self.db_path)
+        rows = get_connection(self.db_path).execute(
+            "SELECT id, leistung, kostenstelle FROM archive WHERE id > ? ORDER BY id", (self.max_id,)
+        ).fetchall()
+        gelernt = 0
+        with self._lock:
+            for row_id, leistung, kostenstelle in rows:
+                # Parallel abgefragte Zeilen nur einmal lernen
+                if row_id > self.max_id:
+                    self.learn(leistung, (kostenstelle or "").strip())
+                    self.max_id = row_id
+                    gelernt += 1
+            self._signatur = signatur
+        return gelernt
+
+    def classify(self, leistung):
+        if self.examples < COST_CENTER_VECTOR_MIN_EXAMPLES or not leistung:
+            return None
+        vektor = _features(leistung)
+        with self._lock:
+            aehnlichkeiten = sorted(
+                (
+                    sum(v * centroid.get(k, 0.0) for k, v in vektor.items())
+                    / (math.sqrt(sum(c * c for c in centroid.values())) or 1.0),
+                    kostenstelle
+                )
+                for kostenstelle, centroid in self.centroids.items()
+            )
+        if not aehnlichkeiten:
+            return None
+        beste, kostenstelle = aehnlichkeiten[-1]
+        zweite = aehnlichkeiten[-2][0] if len(aehnlichkeiten) > 1 else 0.0
+        konfidenz = beste * min(1.0, (beste - zweite) / VEKTOR_ABSTAND)
+        return Classification(kostenstelle, round(konfidenz, 3), "vektor")
+
+
+def parse_llm_answer(antwort):
+    # Bekannte Kostenstelle aus einer freien LLM-Antwort; sonst die bereinigte Antwort selbst
+    for kostenstelle in KOSTENSTELLEN:
+        if kostenstelle.casefold() in (antwort or "").casefold():
+            return Classification(kostenstelle, 0.5, "llm")
+    return Classification((antwort or "").strip() or DEFAULT_COST_CENTER, 0.0, "llm")
+
+
+class CostCenterClassifier:
+    def __init__(self, db_path=ARCHIVE_DB_PATH, use_vectors=COST_CENTER_VECTOR_MODEL,
+                 min_confidence=COST_CENTER_MIN_CONFIDENCE):
+        self.keywords = KeywordMatcher()
+        self.vectors = VectorModel(db_path) if use_vectors else None
+        self.min_confidence = min_confidence
+        self._lokal = OrderedDict()
+        self._lokal_stand = 0                           # Anzahl gelernter Beispiele, zu der die Ergebnisse gehören
+        self._lokal_lock = threading.Lock()
+
+    def classify(self, leistung, llm_fallback=None):
+        # Erste Stufe mit ausreichender Konfidenz entscheidet; llm_fallback() liefert die LLM-Antwort
+        ergebnis = self._classify_local(leistung)
+        if self.needs_llm(ergebnis) and llm_fallback is not None:
+            ergebnis = parse_llm_answer(llm_fallback())
+        return self._finish(ergebnis)
+
+    async def aclassify(self, leistung, llm_fallback=None):
+        # Wie classify(); llm_fallback ist hier eine Coroutine-Funktion
+        ergebnis = self._classify_local(leistung)
+        if self.needs_llm(ergebnis) and llm_fallback is not None:
+            ergebnis = parse_llm_answer(await llm_fallback())
+        return self._finish(ergebnis)
+
+    def needs_llm(self, ergebnis):
+        return ergebnis is None or ergebnis.konfidenz < self.min_confidence
+
+    def _finish(self, ergebnis):
+        if ergebnis is None:
+            ergebnis = Classification(DEFAULT_COST_CENTER, 0.0, "default")
+        _stats.count(ergebnis.stufe)
+        return ergebnis
+
+    def _classify_local(self, leistung):
+        # Gleiche Leistungstexte (z. B. wiederkehrende Rechnungen eines Lieferanten, parallele Batch-Läufe)
+        # werden nur einmal lokal klassifiziert; neu gelernte Archivzeilen verwerfen die gemerkten Ergebnisse
+        stand = 0
+        if self.vectors is not None:
+            self.vectors.train_from_archive()
+            stand = self.vectors.examples
+        with self._lokal_lock:
+            if stand != self._lokal_stand:
+                self._lokal.clear()
+                self._lokal_stand = stand
+            if leistung in self._lokal:
+                self._lokal.move_to_end(leistung)
+                return self._lokal[leistung]
+
+        ergebnis = self._classify_stages(leistung)
+        with self._lokal_lock:
+            self._lokal[leistung] = ergebnis
+            while len(self._lokal) > _LOKAL_CACHE_SIZE:
+                self._lokal.popitem(last=False)
+        return ergebnis
+
+    def _classify_stages(self, leistung):
+        kandidaten = [self.keywords.classify(leistung)]
+        if self.vectors is not None:
+            kandidaten.append(self.vectors.classify(leistung))
+        kandidaten = [k for k in kandidaten if k is not None]
+        if not kandidaten:
+            return None
+        # Schlüsselwörter haben Vorrang, sobald sie sicher genug sind
+        if kandidaten[0].stufe == "keyword" and kandidaten[0].konfidenz >= self.min_confidence:
+            return kandidaten[0]
+        return max(kandidaten, key=lambda k: k.konfidenz)
+
+    def classify_bulk(self, leistungen, llm_fallback=None):
+        # Viele Leistungstexte auf einmal: gleiche Texte nur einmal klassifizieren,
+        # llm_fallback(text) nur für die übrigen unsicheren Texte
+        eindeutig = {}
+        for leistung in leistungen:
+            if leistung not in eindeutig:
+                fallback = (lambda t=leistung: llm_fallback(t)) if llm_fallback else None
+                eindeutig[leistung] = self.classify(leistung, fallback)
+        return [eindeutig[leistung] for leistung in leistungen]
+
+
+def classifier_stats():
+    # Anzahl Entscheidungen je Stufe inkl. Anteil ohne LLM
+    return _stats.snapshot()
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_cost_center_classifier():
+    # Prozessweit geteilter Klassifikator (Vektormodell wird nur einmal aufgebaut)
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = CostCenterClassifier()
+        return _classifier
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kostenstellen für viele Leistungstexte (eine Zeile je Rechnung)")
+    parser.add_argument("datei")
+    args = parser.parse_args()
+
+    with open(args.datei, "r", encoding="utf-8") as f:
+        texte = [zeile.strip() for zeile in f if zeile.strip()]
+    for text, ergebnis in zip(texte, get_cost_center_classifier().classify_bulk(texte)):
+        print(json.dumps({"leistung": text, **ergebnis.to_dict()}, ensure_ascii=False))
+    print(json.dumps(classifier_stats()))
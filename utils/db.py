@@ -0,0 +1,84 @@
+# db.py – geteilte SQLite-Verbindungen (eine je Thread und Datenbank) mit WAL und Busy-Timeout
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from config import ARCHIVE_DB_PATH, SQLITE_BUSY_TIMEOUT_MS, SQLITE_STATEMENT_CACHE
+
+_local = threading.local()
+# Schwache Referenzen: die Verbindungen eines Threads gehören allein dessen Thread-lokalem Halter
+_holders = weakref.WeakSet()
+_holders_lock = threading.Lock()
+
+
+class _ThreadConnections:
+    # Verbindungen eines Threads; endet der Thread, wird der Halter freigegeben und schließt sie
+    def __init__(self):
+        self.by_path = {}
+        weakref.finalize(self, _close_connections, self.by_path)
+
+
+def _close_connections(by_path):
+    for conn in list(by_path.values()):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    by_path.clear()
+
+
+def _open(db_path):
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # isolation_level=None: Autocommit; Schreibtransaktionen laufen explizit über transaction()
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        cached_statements=SQLITE_STATEMENT_CACHE,        # vorbereitete Statements je Verbindung wiederverwenden
+        check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")             # Leser blockieren Schreiber nicht (Batch-Worker)
+    conn.execute("PRAGMA synchronous=NORMAL")           # im WAL-Modus sicher, deutlich weniger fsyncs
+    conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+    return conn
+
+
+def get_connection(db_path=ARCHIVE_DB_PATH):
+    # Persistente Verbindung des aktuellen Threads zu db_path (wird beim ersten Zugriff geöffnet)
+    holder = getattr(_local, "connections", None)
+    if holder is None:
+        holder = _local.connections = _ThreadConnections()
+        with _holders_lock:
+            _holders.add(holder)
+
+    key = os.path.abspath(db_path)
+    conn = holder.by_path.get(key)
+    if conn is None:
+        conn = holder.by_path[key] = _open(db_path)
+    return conn
+
+
+@contextmanager
+def transaction(db_path=ARCHIVE_DB_PATH):
+    # Schreibtransaktion: BEGIN IMMEDIATE holt die Schreibsperre sofort (kein Lock-Upgrade-Deadlock)
+    conn = get_connection(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+def close_all():
+    # Alle geöffneten Verbindungen schließen (z. B. vor dem Löschen der Datenbankdatei)
+    with _holders_lock:
+        holders = list(_holders)
+    for holder in holders:
+        _close_connections(holder.by_path)
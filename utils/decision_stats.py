@@ -0,0 +1,23 @@
+# decision_stats.py – threadsichere Zähler, wie oft ohne bzw. mit LLM entschieden wurde (für den Batch-Report)
+import threading
+
+
+class DecisionStats:
+    # Zähler je Pfad; llm_key ist der Pfad mit LLM, quote_key der Anteil aller übrigen Entscheidungen
+    def __init__(self, keys, llm_key, quote_key="ohne_llm_quote"):
+        self.llm_key = llm_key
+        self.quote_key = quote_key
+        self._counts = dict.fromkeys((*keys, llm_key), 0)
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def snapshot(self):
+        # Aktuelle Zählerstände inkl. Anteil ohne LLM
+        with self._lock:
+            stats = dict(self._counts)
+        total = sum(stats.values())
+        stats[self.quote_key] = round((total - stats[self.llm_key]) / total, 3) if total else 0.0
+        return stats
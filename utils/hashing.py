@@ -0,0 +1,18 @@
+# hashing.py – SHA-256 über Dateiinhalte (PDF-Cache, Checkpoints, Freigaben, Archivablage)
+import hashlib
+import os
+
+
+def sha256_file(file):
+    # Hash blockweise über einen Pfad oder ein Datei-Objekt (Position wird danach zurückgesetzt)
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        file.seek(0)
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+        file.seek(0)
+    return digest.hexdigest()
@@ -0,0 +1,141 @@
+# invoice_record.py – einmal geparster, typisierter Rechnungsdatensatz aus der Validierungs-Tabelle
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+from config import OWN_COMPANY_FULL
+from utils.amount_parser import extract_amounts, parse_amount, count_amount
+
+# Eine Tabellenzeile: | <nr>. <Pflichtangabe> | <Vorhanden> | <Extrahierter Wert> |
+ROW_PATTERN = re.compile(r"^\|\s*(\d+)\.\s*([^|]*?)\s*\|\s*([^|]*?)\s*\|\s*([^|]*?)\s*\|\s*$")
+
+
+def parse_validation_table(markdown_table):
+    # Alle nummerierten Zeilen der Tabelle: {nr: (Pflichtangabe, Vorhanden, Wert)}
+    felder = {}
+    for line in (markdown_table or "").splitlines():
+        match = ROW_PATTERN.match(line.strip())
+        if match:
+            nr, label, vorhanden, wert = match.groups()
+            felder[int(nr)] = (f"{nr}. {label}", vorhanden, wert.replace("<br>", ", "))
+    return felder
+
+
+def _wert(felder, nr):
+    # Extrahierter Wert eines Feldes oder None, wenn es fehlt
+    eintrag = felder.get(nr)
+    if not eintrag or eintrag[2].strip() in ("", "Fehlt"):
+        return None
+    return eintrag[2].strip()
+
+
+@dataclass
+class InvoiceRecord:
+    felder: dict = field(default_factory=dict)
+    rechnungsnummer: str = None
+    lieferant: str = None
+    leistungsempfaenger: str = None
+    ausstellungsdatum: str = None
+    leistung: str = None
+    positionen: list = field(default_factory=list)
+    netto: Decimal = None
+    steuer: Decimal = None
+    brutto: Decimal = None
+    betrag_eindeutig: bool = False
+
+    @classmethod
+    def from_validation(cls, markdown_table):
+        # Tabelle einmal parsen und alle von den Folge-Agenten benötigten Werte ableiten
+        felder = parse_validation_table(markdown_table)
+
+        unternehmer = _wert(felder, 1) or ""
+        empfaenger = _wert(felder, 2) or ""
+
+        # Lieferant ist immer die Partei, die nicht dem eigenen Unternehmen entspricht
+        if OWN_COMPANY_FULL in unternehmer:
+            lieferant, empfaenger = empfaenger, unternehmer
+        else:
+            lieferant = unternehmer
+
+        rechnungsnummer = _wert(felder, 6)
+        if rechnungsnummer:
+            rechnungsnummer = re.sub(r"^Rechnungsnummer\s*[:\-]?\s*", "", rechnungsnummer, flags=re.IGNORECASE).strip()
+
+        leistung = _wert(felder, 7)
+        positionen = [p.strip() for p in re.split(r"[;,]", leistung) if p.strip()] if leistung else []
+
+        # Beträge deterministisch parsen; eindeutig = kein mehrdeutiges Format und Netto + Steuer = Brutto
+        betraege = extract_amounts(_wert(felder, 9) or "")
+
+        return cls(
+            felder=felder,
+            rechnungsnummer=rechnungsnummer,
+            lieferant=lieferant or None,
+            leistungsempfaenger=empfaenger or None,
+            ausstellungsdatum=_wert(felder, 5),
+            leistung=leistung,
+            positionen=positionen,
+            netto=betraege.netto,
+            steuer=betraege.steuer,
+            brutto=betraege.brutto,
+            betrag_eindeutig=betraege.eindeutig
+        )
+
+    @classmethod
+    def from_context(cls, context):
+        # Bereits im Validierungsschritt erzeugten Datensatz nutzen, sonst aus der Tabelle parsen
+        data = context.get("invoice_record")
+        if data:
+            return cls.from_dict(data)
+        return cls.from_validation(context.get("validation", ""))
+
+    def vorhanden(self, nr):
+        # True, wenn das Pflichtfeld in der Tabelle mit "Ja" markiert ist
+        eintrag = self.felder.get(nr)
+        return bool(eintrag) and eintrag[1] == "Ja"
+
+    def brutto_mit_fallback(self, llm_fallback):
+        # Schneller Pfad: eindeutig geparster Bruttobetrag; nur sonst das LLM fragen
+        if self.brutto is not None and self.betrag_eindeutig:
+            count_amount("fast_path")
+            return self.brutto
+
+        count_amount("llm_fallback")
+        try:
+            return parse_amount(llm_fallback(), locale="en")
+        except ValueError:
+            return self.brutto if self.brutto is not None else Decimal("0.00")
+
+    def to_dict(self):
+        # JSON-taugliche Darstellung (Decimal als String, damit keine Rundung entsteht)
+        return {
+            "felder": {str(nr): list(eintrag) for nr, eintrag in self.felder.items()},
+            "rechnungsnummer": self.rechnungsnummer,
+            "lieferant": self.lieferant,
+            "leistungsempfaenger": self.leistungsempfaenger,
+            "ausstellungsdatum": self.ausstellungsdatum,
+            "leistung": self.leistung,
+            "positionen": list(self.positionen),
+            "netto": None if self.netto is None else str(self.netto),
+            "steuer": None if self.steuer is None else str(self.steuer),
+            "brutto": None if self.brutto is None else str(self.brutto),
+            "betrag_eindeutig": self.betrag_eindeutig
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        def dec(value):
+            return None if value is None else Decimal(value)
+
+        return cls(
+            felder={int(nr): tuple(eintrag) for nr, eintrag in data.get("felder", {}).items()},
+            rechnungsnummer=data.get("rechnungsnummer"),
+            lieferant=data.get("lieferant"),
+            leistungsempfaenger=data.get("leistungsempfaenger"),
+            ausstellungsdatum=data.get("ausstellungsdatum"),
+            leistung=data.get("leistung"),
+            positionen=list(data.get("positionen", [])),
+            netto=dec(data.get("netto")),
+            steuer=dec(data.get("steuer")),
+            brutto=dec(data.get("brutto")),
+            betrag_eindeutig=data.get("betrag_eindeutig", False)
+        )
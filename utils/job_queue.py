@@ -0,0 +1,277 @@
+# job_queue.py – persistente Auftragswarteschlange vor der Pipeline (HTTP-API → Worker-Prozesse)
+# Eingereichte PDFs liegen unter ihrem SHA-256 in UPLOAD_DIR; Worker holen Aufträge mit einer Lease ab,
+# sodass Aufträge abgestürzter Worker nach Ablauf der Lease erneut vergeben werden.
+# Vergeben wird nach Scheduler-Klasse und virtueller Endzeit je Lieferant (siehe utils/scheduler.py); eingestuft
+# werden neue Aufträge erst von den Workern (plan()), damit das Einreichen nie auf die PDF-Extraktion wartet.
+# Aufruf: python -m utils.job_queue stats
+#         python -m utils.job_queue list [--status eingereiht]
+#         python -m utils.job_queue timing   (Wartezeit vs. Bearbeitungszeit je Klasse)
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from config import JOB_QUEUE_DB_PATH, JOB_LEASE_S, JOB_PLAN_BATCH, SCHEDULER_MAX_WAIT_S, UPLOAD_DIR
+from utils.db import get_connection, transaction
+from utils.hashing import sha256_file
+from utils.scheduler import KLASSEN, classify, prescan, supplier_weight, timing_report
+
+STATUS_EINGEREIHT = "eingereiht"
+STATUS_LAEUFT = "läuft"
+# Endzustände wie im BatchRunner: abgeschlossen | wartend | abgebrochen | fehler
+STATUS_WARTEND = "wartend"
+# Je Rechnung (PDF-Hash) darf höchstens ein Auftrag in diesen Zuständen existieren
+AKTIV = (STATUS_EINGEREIHT, STATUS_LAEUFT, STATUS_WARTEND)
+
+SPALTEN = (
+    "id", "name", "pdf_path", "quelle", "status", "result", "results_path", "worker", "versuche",
+    "eingereicht", "gestartet", "beendet", "lease_bis", "klasse", "lieferant", "vfinish", "frist", "doc_hash"
+)
+
+# Spalten, die älteren jobs-Tabellen nachträglich hinzugefügt werden
+ZUSATZ_SPALTEN = {
+    "klasse": "TEXT", "rang": "INTEGER", "lieferant": "TEXT", "vfinish": "REAL", "frist": "TEXT", "doc_hash": "TEXT"
+}
+
+# Sortierschlüssel für Aufträge, deren Frist unbekannt ist (ISO-Datum, sortiert nach allen echten Fristen)
+OHNE_FRIST = "9999-12-31"
+
+_initialized = set()
+
+
+def store_pdf(data, upload_dir=UPLOAD_DIR):
+    # PDF unter seinem Inhalts-Hash ablegen (gleiche Rechnung = gleiche Datei, keine verwaisten Temp-Dateien)
+    os.makedirs(upload_dir, exist_ok=True)
+    pfad = os.path.join(upload_dir, hashlib.sha256(data).hexdigest() + ".pdf")
+    if not os.path.exists(pfad):
+        tmp_pfad = f"{pfad}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_pfad, "wb") as f:
+            f.write(data)
+        os.replace(tmp_pfad, pfad)
+    return pfad
+
+
+def _row_to_dict(row):
+    return dict(zip(SPALTEN, row)) if row else None
+
+
+class JobQueue:
+    def __init__(self, db_path=JOB_QUEUE_DB_PATH):
+        self.db_path = db_path
+        key = os.path.abspath(db_path)
+        if key not in _initialized:
+            with transaction(db_path) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        name TEXT,
+                        pdf_path TEXT NOT NULL,
+                        quelle TEXT,
+                        status TEXT NOT NULL DEFAULT 'eingereiht',
+                        result TEXT,
+                        results_path TEXT,
+                        worker TEXT,
+                        versuche INTEGER NOT NULL DEFAULT 0,
+                        eingereicht REAL,
+                        gestartet REAL,
+                        beendet REAL,
+                        lease_bis REAL
+                    )
+                """)
+                vorhanden = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                for spalte, typ in ZUSATZ_SPALTEN.items():
+                    if spalte not in vorhanden:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {spalte} {typ}")
+                # Virtuelle Zeit je Klasse für das Weighted Fair Queuing
+                conn.execute("CREATE TABLE IF NOT EXISTS job_clock (klasse TEXT PRIMARY KEY, v REAL NOT NULL)")
+                # Teilindizes: Worker lesen nur eingereihte bzw. laufende Aufträge, nicht die ganze Historie
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_jobs_eingereiht ON jobs(eingereicht) WHERE status = 'eingereiht'"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_jobs_plan ON jobs(rang, vfinish) WHERE status = 'eingereiht'"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_jobs_ungeplant ON jobs(eingereicht) "
+                    "WHERE status = 'eingereiht' AND klasse IS NULL"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_laeuft ON jobs(lease_bis) WHERE status = 'läuft'")
+                # Zwei Worker dürfen nie dieselbe Rechnung (Checkpoint, Laufverzeichnis) gleichzeitig bearbeiten
+                conn.execute(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_aktiv_doc ON jobs(doc_hash) "
+                    "WHERE status IN ('eingereiht', 'läuft', 'wartend')"
+                )
+            _initialized.add(key)
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def enqueue(self, pdf_path, name=None, quelle=None):
+        return self.enqueue_many([(pdf_path, name)], quelle)[0]
+
+    def enqueue_many(self, items, quelle=None):
+        # Mehrere (pdf_path, name) in einer Transaktion einreihen (Multipart-Stapel); Ergebnis: Aufträge.
+        # Nur Hash und INSERT – die Einstufung übernimmt plan() im Worker. Ist dieselbe Rechnung (PDF-Hash)
+        # bereits aktiv, wird deren Auftrag geliefert (dupliziert=True) statt eines zweiten
+        now = time.time()
+        neu = [(pdf_path, name, sha256_file(pdf_path)) for pdf_path, name in items]
+        jobs = []
+        with transaction(self.db_path) as conn:
+            for pdf_path, name, doc_hash in neu:
+                row = conn.execute(
+                    f"SELECT {', '.join(SPALTEN)} FROM jobs WHERE doc_hash = ? "
+                    f"AND status IN ({', '.join('?' for _ in AKTIV)})",
+                    (doc_hash, *AKTIV)
+                ).fetchone()
+                if row is not None:
+                    jobs.append({**_row_to_dict(row), "dupliziert": True})
+                    continue
+                job = {"id": uuid.uuid4().hex, "name": name or os.path.basename(pdf_path), "pdf_path": pdf_path,
+                       "quelle": quelle, "status": STATUS_EINGEREIHT, "eingereicht": now, "doc_hash": doc_hash}
+                conn.execute(
+                    "INSERT INTO jobs (id, name, pdf_path, quelle, status, eingereicht, doc_hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job["id"], job["name"], job["pdf_path"], job["quelle"], job["status"], job["eingereicht"],
+                     doc_hash)
+                )
+                jobs.append({**job, "dupliziert": False})
+        return jobs
+
+    def plan(self, limit=JOB_PLAN_BATCH):
+        # Noch nicht eingestufte Aufträge vorab scannen (Betrag, Frist, Lieferant) und einplanen; Anzahl.
+        # Der Scan läuft außerhalb der Transaktion, damit die Schreibsperre kurz bleibt
+        offen = self._conn().execute(
+            "SELECT id, pdf_path FROM jobs WHERE status = ? AND klasse IS NULL ORDER BY eingereicht LIMIT ?",
+            (STATUS_EINGEREIHT, limit)
+        ).fetchall()
+        geplant = [(job_id, prescan(pdf_path)) for job_id, pdf_path in offen]
+
+        with transaction(self.db_path) as conn:
+            anzahl = 0
+            for job_id, facts in geplant:
+                klasse, lieferant = classify(facts), facts.lieferant or ""
+                # Weighted Fair Queuing: Start = max(virtuelle Zeit der Klasse, letzte Endzeit des Lieferanten)
+                uhr = conn.execute("SELECT v FROM job_clock WHERE klasse = ?", (klasse,)).fetchone()
+                letzte = conn.execute(
+                    "SELECT MAX(vfinish) FROM jobs WHERE status = ? AND klasse = ? AND lieferant = ?",
+                    (STATUS_EINGEREIHT, klasse, lieferant)
+                ).fetchone()[0]
+                vfinish = max(uhr[0] if uhr else 0.0, letzte or 0.0) + 1.0 / supplier_weight(lieferant)
+                # Ein anderer Worker kann denselben Auftrag inzwischen eingeplant oder übernommen haben
+                anzahl += conn.execute(
+                    "UPDATE jobs SET klasse = ?, rang = ?, lieferant = ?, vfinish = ?, frist = ? "
+                    "WHERE id = ? AND status = ? AND klasse IS NULL",
+                    (klasse, KLASSEN[klasse], lieferant, vfinish, facts.frist.isoformat() if facts.frist else None,
+                     job_id, STATUS_EINGEREIHT)
+                ).rowcount
+        return anzahl
+
+    def claim(self, worker, lease_s=JOB_LEASE_S, max_wait_s=SCHEDULER_MAX_WAIT_S):
+        # Nächsten Auftrag atomar übernehmen (oder None): zu lange wartende zuerst, untereinander nach Frist
+        # und Eingang; sonst nach Klasse und virtueller Endzeit (fair über die Lieferanten).
+        # Noch nicht eingeplante Aufträge zählen als "standard" und kommen nach den eingeplanten ihrer Klasse
+        now = time.time()
+        grenze = now - max_wait_s
+        with transaction(self.db_path) as conn:
+            row = conn.execute(
+                f"UPDATE jobs SET status = ?, worker = ?, gestartet = ?, lease_bis = ?, versuche = versuche + 1 "
+                f"WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY "
+                f"CASE WHEN eingereicht < ? THEN 0 ELSE 1 END, "
+                f"CASE WHEN eingereicht < ? THEN COALESCE(frist, ?) END, "
+                f"CASE WHEN eingereicht < ? THEN eingereicht END, "
+                f"COALESCE(rang, ?), vfinish IS NULL, vfinish, eingereicht "
+                f"LIMIT 1) RETURNING {', '.join(SPALTEN)}",
+                (STATUS_LAEUFT, worker, now, now + lease_s, STATUS_EINGEREIHT,
+                 grenze, grenze, OHNE_FRIST, grenze, KLASSEN["standard"])
+            ).fetchone()
+            job = _row_to_dict(row)
+            if job is not None and job["klasse"] and job["eingereicht"] >= grenze:
+                conn.execute(
+                    "INSERT INTO job_clock (klasse, v) VALUES (?, ?) ON CONFLICT(klasse) DO UPDATE SET v = excluded.v",
+                    (job["klasse"], job["vfinish"])
+                )
+        return job
+
+    def heartbeat(self, worker, lease_s=JOB_LEASE_S):
+        # Lease aller laufenden Aufträge eines Workers verlängern
+        with transaction(self.db_path) as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_bis = ? WHERE status = ? AND worker = ?",
+                (time.time() + lease_s, STATUS_LAEUFT, worker)
+            )
+
+    def finish(self, job_id, status, result, results_path=None):
+        with transaction(self.db_path) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, results_path = ?, beendet = ?, lease_bis = NULL WHERE id = ?",
+                (status, result, results_path, time.time(), job_id)
+            )
+
+    def requeue_stale(self):
+        # Aufträge mit abgelaufener Lease (Worker abgestürzt) wieder einreihen; Anzahl
+        with transaction(self.db_path) as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_bis = NULL WHERE status = ? AND lease_bis < ?",
+                (STATUS_EINGEREIHT, STATUS_LAEUFT, time.time())
+            ).rowcount
+
+    def reopen(self, pdf_path):
+        # Wartende Aufträge einer Rechnung nach getroffener Freigabe-Entscheidung erneut einreihen; Anzahl.
+        # Die Wartezeit zählt ab jetzt, damit die Entscheidungsdauer nicht als Warteschlangenzeit erscheint
+        with transaction(self.db_path) as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, eingereicht = ?, beendet = NULL "
+                "WHERE status = ? AND pdf_path = ?",
+                (STATUS_EINGEREIHT, time.time(), STATUS_WARTEND, pdf_path)
+            ).rowcount
+
+    def get(self, job_id):
+        row = self._conn().execute(f"SELECT {', '.join(SPALTEN)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_dict(row)
+
+    def results(self, job_id):
+        # Schrittergebnisse (results.json) eines Auftrags oder None, solange keine vorliegen
+        job = self.get(job_id)
+        if job is None or not job["results_path"] or not os.path.exists(job["results_path"]):
+            return None
+        with open(job["results_path"], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list(self, status=None, limit=100):
+        # Neueste Aufträge zuerst, optional nach Status gefiltert
+        where, werte = (" WHERE status = ?", [status]) if status else ("", [])
+        rows = self._conn().execute(
+            f"SELECT {', '.join(SPALTEN)} FROM jobs{where} ORDER BY eingereicht DESC LIMIT ?", (*werte, limit)
+        ).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def stats(self):
+        # Anzahl Aufträge je Status
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def timing(self, seit=None):
+        # Wartezeit vs. Bearbeitungszeit je Scheduler-Klasse (optional nur Aufträge ab Zeitstempel seit)
+        rows = self._conn().execute(
+            "SELECT klasse, eingereicht, gestartet, beendet FROM jobs WHERE beendet IS NOT NULL AND eingereicht >= ?",
+            (seit or 0,)
+        ).fetchall()
+        return timing_report(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auftragswarteschlange anzeigen")
+    parser.add_argument("befehl", choices=["list", "stats", "timing"])
+    parser.add_argument("--status")
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    queue = JobQueue()
+    if args.befehl == "list":
+        for job in queue.list(args.status, args.limit):
+            print(json.dumps(job, ensure_ascii=False))
+    elif args.befehl == "timing":
+        print(json.dumps(queue.timing(), ensure_ascii=False, indent=4))
+    else:
+        print(json.dumps(queue.stats(), ensure_ascii=False))
@@ -0,0 +1,121 @@
+# llm_cache.py – persistenter, inhaltsadressierter Cache für LLM-Antworten (SQLite, TTL + LRU)
+import hashlib
+import json
+import threading
+import time
+from config import LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
+from utils.db import get_connection, transaction
+
+
+def cache_key(model, prompt, options=None):
+    # SHA-256 über Modell, Prompt und Aufrufoptionen (z. B. format=JSON-Schema)
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "options": options or {}},
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        # ttl in Sekunden; max_entries begrenzt die Größe (älteste Zugriffe werden zuerst entfernt)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                latency REAL,
+                created_at REAL,
+                last_access REAL
+            )
+        """)
+        self._conn().execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+
+    def _conn(self):
+        # Geteilte Verbindung des aktuellen Threads (WAL, Autocommit), siehe utils/db.py
+        return get_connection(self.path)
+
+    def get(self, key):
+        # Antwort oder None; abgelaufene Einträge zählen als Fehlversuch
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT response, latency, created_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or (self.ttl and now - row[2] > self.ttl):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += row[1] or 0.0
+        return row[0]
+
+    def put(self, key, model, response, latency):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, model, response, latency, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, latency, now, now)
+        )
+
+        # Aufräumen nicht bei jedem Schreibzugriff, sondern alle 100 Einträge
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % 100 == 1
+        if evict:
+            self.evict()
+
+    def evict(self):
+        # Abgelaufene Einträge löschen und auf max_entries kürzen (LRU nach last_access)
+        with transaction(self.path) as conn:
+            if self.ttl:
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        # Treffer/Fehlversuche und eingesparte LLM-Zeit dieses Prozesses
+        entries = self._conn().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "saved_s": round(self.saved_seconds, 3),
+                "entries": entries
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    # Prozessweit geteilter Cache
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def llm_cache_stats():
+    return get_llm_cache().stats()
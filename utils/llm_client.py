@@ -0,0 +1,140 @@
+# llm_client.py – prozessweit geteilte LLM-Clients je Ollama-Backend (Connection-Pooling, Keep-Alive)
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+import httpx
+from langchain_ollama import OllamaLLM
+from config import (
+    OLLAMA_MODEL,
+    OLLAMA_BASE_URL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_MAX_CONCURRENT_REQUESTS,
+    OLLAMA_POOL_CONNECTIONS,
+    OLLAMA_TIMEOUT,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_OPT_OUT
+)
+from utils.llm_cache import cache_key, get_llm_cache
+
+_registry = {}
+_backend_slots = {}
+_registry_lock = threading.Lock()
+
+# Asynchrone Gegenstücke zu _backend_slots: je Event-Loop und Backend ein Semaphor
+_async_slots = weakref.WeakKeyDictionary()
+
+# Gesetzt, solange ein Schritt nach negativer Bewertung wiederholt wird (gilt je Thread bzw. Task)
+_cache_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+def _normalize_url(base_url):
+    return base_url.rstrip("/")
+
+
+class LLMClient:
+    # Dünner Wrapper um OllamaLLM: ein HTTP-Client mit Keep-Alive-Pool je Modell/Backend
+    # und eine Obergrenze für gleichzeitige Anfragen je Backend
+    def __init__(self, model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE):
+        self.model = model
+        self.base_url = _normalize_url(base_url)
+
+        limits = httpx.Limits(
+            max_connections=OLLAMA_POOL_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_POOL_CONNECTIONS
+        )
+        self.llm = OllamaLLM(
+            model=model,
+            base_url=self.base_url,
+            keep_alive=keep_alive,                   # Modell bleibt zwischen den Anfragen geladen
+            client_kwargs={"limits": limits, "timeout": OLLAMA_TIMEOUT}
+        )
+        self.slots = _backend_slots.setdefault(
+            self.base_url, threading.BoundedSemaphore(OLLAMA_MAX_CONCURRENT_REQUESTS)
+        )
+
+    def invoke(self, prompt, **kwargs):
+        # Blockiert, solange bereits OLLAMA_MAX_CONCURRENT_REQUESTS Anfragen am Backend laufen
+        with self.slots:
+            return self.llm.invoke(prompt, **kwargs)
+
+    def async_slots(self):
+        # Semaphor des laufenden Event-Loops (asyncio-Primitive sind an ihren Loop gebunden)
+        loop = asyncio.get_running_loop()
+        with _registry_lock:
+            per_backend = _async_slots.setdefault(loop, {})
+            return per_backend.setdefault(self.base_url, asyncio.Semaphore(OLLAMA_MAX_CONCURRENT_REQUESTS))
+
+    async def ainvoke(self, prompt, **kwargs):
+        # Wartet ohne Thread-Blockade auf einen freien Platz (Backpressure für viele Rechnungen je Loop)
+        async with self.async_slots():
+            return await self.llm.ainvoke(prompt, **kwargs)
+
+
+class CachedLLM:
+    # Gleiche Schnittstelle wie LLMClient; identische Anfragen werden aus dem Cache beantwortet
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+
+    def _lookup(self, key):
+        # Bei Wiederholung nicht lesen: die neue Antwort überschreibt den verworfenen Eintrag
+        return None if _cache_bypass.get() else self.cache.get(key)
+
+    def invoke(self, prompt, **kwargs):
+        key = cache_key(self.client.model, prompt, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        response = self.client.invoke(prompt, **kwargs)
+        self.cache.put(key, self.client.model, response, time.perf_counter() - start)
+        return response
+
+    async def ainvoke(self, prompt, **kwargs):
+        # Cache-Zugriffe sind lokale SQLite-Abfragen (Sekundenbruchteile) und laufen direkt im Loop
+        key = cache_key(self.client.model, prompt, kwargs)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        response = await self.client.ainvoke(prompt, **kwargs)
+        self.cache.put(key, self.client.model, response, time.perf_counter() - start)
+        return response
+
+
+@contextmanager
+def llm_cache_bypass():
+    # Innerhalb des Blocks fragen CachedLLM-Instanzen immer das LLM (z. B. erneuter Versuch eines Schritts,
+    # dessen Ergebnis der Supervisor mit "nein" bewertet hat – sonst käme dieselbe Antwort aus dem Cache)
+    token = _cache_bypass.set(True)
+    try:
+        yield
+    finally:
+        _cache_bypass.reset(token)
+
+
+def get_llm(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, agent=None):
+    # Geteilte Instanz je (Modell, Backend); wird beim ersten Aufruf angelegt.
+    # agent: Name des aufrufenden Agenten – steht er in LLM_CACHE_OPT_OUT, wird nicht gecacht
+    key = (model, _normalize_url(base_url))
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = LLMClient(model=model, base_url=base_url)
+        client = _registry[key]
+
+    if LLM_CACHE_ENABLED and agent not in LLM_CACHE_OPT_OUT:
+        return CachedLLM(client, get_llm_cache())
+    return client
+
+
+def reset_llm_clients():
+    # Registry leeren, z. B. nach Änderung von OLLAMA_BASE_URL (Stub-Server in Tests)
+    with _registry_lock:
+        _registry.clear()
+        _backend_slots.clear()
+        _async_slots.clear()
@@ -0,0 +1,181 @@
+# matching.py – deterministischer Abgleich Rechnung ↔ Referenz (Lieferant, Bruttobetrag, Leistungspositionen)
+import re
+from dataclasses import dataclass, asdict
+from difflib import SequenceMatcher
+from decimal import Decimal, InvalidOperation
+from config import MATCH_ACCEPT_SCORE, MATCH_REJECT_SCORE
+from utils.amount_parser import TOLERANCE
+from utils.archive_db import RECHTSFORMEN, normalize_invoice_number
+from utils.decision_stats import DecisionStats
+
+# Gewichte der Teilergebnisse im Gesamtscore
+GEWICHT_LIEFERANT = 0.4
+GEWICHT_BETRAG = 0.4
+GEWICHT_POSITIONEN = 0.2
+
+# Eine Leistungsposition gilt als abgedeckt, wenn sie mindestens so ähnlich ist
+POSITION_SCHWELLE = 0.5
+
+# Typische OCR-Verwechslungen in Rechnungsnummern (Buchstabe → Ziffer)
+OCR_FOLD = str.maketrans({"O": "0", "Q": "0", "D": "0", "I": "1", "L": "1", "Z": "2", "S": "5", "B": "8", "G": "6"})
+
+# Zähler: wie oft ohne LLM entschieden wurde ("eindeutig") bzw. das LLM nötig war ("grenzfall")
+_stats = DecisionStats(["eindeutig"], "grenzfall")
+
+
+def _tokens(text):
+    return set(re.findall(r"\w+", text))
+
+
+def _trigrams(text):
+    # Zeichen-Trigramme über den zusammengezogenen Text (robust gegen Tippfehler und Leerzeichen)
+    text = "  " + re.sub(r"[\W_]+", " ", text).strip() + " "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(a, b):
+    # Maximum aus Token-Jaccard und Trigramm-Dice, jeweils 0..1
+    a, b = (a or "").casefold(), (b or "").casefold()
+    if not a.strip() or not b.strip():
+        return 0.0
+    ta, tb = _tokens(a), _tokens(b)
+    jaccard = len(ta & tb) / len(ta | tb) if ta | tb else 0.0
+    ga, gb = _trigrams(a), _trigrams(b)
+    dice = 2 * len(ga & gb) / (len(ga) + len(gb)) if ga and gb else 0.0
+    return max(jaccard, dice)
+
+
+def fold_number(rechnungsnummer):
+    # Normalisierte Rechnungsnummer mit vereinheitlichten OCR-Verwechslungen ("RE-1O2" → "RE102")
+    nummer = normalize_invoice_number(rechnungsnummer)
+    return nummer[:1] + nummer[1:].translate(OCR_FOLD) if nummer else ""
+
+
+def number_grams(rechnungsnummer):
+    # Trigramme der gefalteten Nummer mit Rand-Markern, Grundlage des Kandidaten-Index
+    nummer = fold_number(rechnungsnummer)
+    if not nummer:
+        return set()
+    text = f"^{nummer}$"
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def number_similarity(a, b):
+    # Zeichenweise Ähnlichkeit der gefalteten Nummern (0..1), bewertet Vertipper und fehlende Zeichen
+    a, b = fold_number(a), fold_number(b)
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def amount_closeness(brutto, referenz_brutto):
+    # 1,0 innerhalb der Toleranz, fällt linear bis 0 bei 10 % Abweichung
+    brutto, referenz_brutto = _decimal(brutto), _decimal(referenz_brutto)
+    if brutto is None or referenz_brutto is None:
+        return 0.0
+    abweichung = abs(brutto - referenz_brutto)
+    if abweichung <= TOLERANCE:
+        return 1.0
+    return max(0.0, 1.0 - float(abweichung / max(abs(referenz_brutto), Decimal("1"))) * 10)
+
+
+def candidate_score(rechnungsnummer, lieferant, brutto, referenz):
+    # Rangfolge der Kandidaten: Nummer am wichtigsten, dann Lieferant und Betrag
+    return (0.5 * number_similarity(rechnungsnummer, referenz.get("rechnungsnummer"))
+            + 0.3 * supplier_similarity(lieferant, referenz.get("lieferant"))
+            + 0.2 * amount_closeness(brutto, referenz.get("betrag_brutto")))
+
+
+def supplier_name(lieferant):
+    # Nur der Name: erste Zeile bzw. erster Abschnitt vor der Adresse, ohne Rechtsform
+    name = re.split(r"[,\n]|<br>", lieferant or "")[0].casefold()
+    return RECHTSFORMEN.sub(" ", name).strip()
+
+
+def supplier_similarity(a, b):
+    return similarity(supplier_name(a), supplier_name(b))
+
+
+def positions(leistung):
+    # "Beratung, Businessplan<br>Bankgespräch" → ["Beratung", "Businessplan", "Bankgespräch"]
+    return [p.strip() for p in re.split(r"[;,\n]|<br>", leistung or "") if p.strip()]
+
+
+def item_overlap(leistung, referenz_leistung):
+    # Anteil der Referenzpositionen, die in der Rechnung (in beliebiger Reihenfolge) wiederkommen
+    items, referenz = positions(leistung), positions(referenz_leistung)
+    if not items or not referenz:
+        return None
+    abgedeckt = sum(1 for r in referenz if max(similarity(r, i) for i in items) >= POSITION_SCHWELLE)
+    return abgedeckt / len(referenz)
+
+
+def _decimal(value):
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+def amount_match(brutto, referenz_brutto):
+    # True/False bei bekannten Beträgen (Toleranz 0,01 €), None wenn ein Betrag fehlt
+    brutto, referenz_brutto = _decimal(brutto), _decimal(referenz_brutto)
+    if brutto is None or referenz_brutto is None:
+        return None
+    return abs(brutto - referenz_brutto) <= TOLERANCE
+
+
+@dataclass
+class MatchResult:
+    nummer: bool
+    lieferant: float
+    betrag: bool
+    positionen: float
+    score: float
+    entscheidung: str                                   # sachlich_korrekt | nicht_nachvollziehbar | grenzfall
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def match_invoice(rechnungsnummer, lieferant, brutto, leistung, referenz,
+                  accept=MATCH_ACCEPT_SCORE, reject=MATCH_REJECT_SCORE, count=True):
+    # Gesamtscore aus Lieferant, Betrag und Positionen; nur zwischen reject und accept entscheidet das LLM
+    nummer = normalize_invoice_number(rechnungsnummer) == normalize_invoice_number(referenz.get("rechnungsnummer"))
+    lieferant_score = supplier_similarity(lieferant, referenz.get("lieferant"))
+    betrag = amount_match(brutto, referenz.get("betrag_brutto"))
+    positionen_score = item_overlap(leistung, referenz.get("leistung"))
+
+    # Fehlende Werte zählen neutral (0,5), damit sie allein weder bestätigen noch ablehnen
+    betrag_score = 0.5 if betrag is None else float(betrag)
+    score = (GEWICHT_LIEFERANT * lieferant_score
+             + GEWICHT_BETRAG * betrag_score
+             + GEWICHT_POSITIONEN * (0.5 if positionen_score is None else positionen_score))
+
+    if not nummer:
+        entscheidung = "nicht_nachvollziehbar"
+    elif score >= accept and betrag:
+        entscheidung = "sachlich_korrekt"
+    elif score < reject:
+        entscheidung = "nicht_nachvollziehbar"
+    else:
+        entscheidung = "grenzfall"
+
+    if count:
+        _stats.count("grenzfall" if entscheidung == "grenzfall" else "eindeutig")
+
+    return MatchResult(
+        nummer=nummer,
+        lieferant=round(lieferant_score, 3),
+        betrag=betrag,
+        positionen=None if positionen_score is None else round(positionen_score, 3),
+        score=round(score, 3),
+        entscheidung=entscheidung
+    )
+
+
+def match_stats():
+    # Aktuelle Zählerstände inkl. Anteil der Prüfungen ohne LLM
+    return _stats.snapshot()
@@ -0,0 +1,98 @@
+# ollama_stub.py – minimaler lokaler Ollama-Ersatz (nur /api/generate) für Tests ohne Modell
+# Aufruf: python -m utils.ollama_stub --port 11500   →   OLLAMA_BASE_URL=http://127.0.0.1:11500
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_responder(prompt, request):
+    # Feste Antwort; bei JSON-Format ein leeres Objekt
+    return "{}" if request.get("format") else "ok"
+
+
+class OllamaStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, responder=default_responder, delay=0.0):
+        # responder(prompt, request) liefert den Antworttext; delay simuliert Modell-Latenz
+        self.responder = responder
+        self.delay = delay
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__((host, port), _Handler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        # Server im Hintergrund-Thread starten (für Tests)
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1, damit Keep-Alive-Verbindungen des Clients wiederverwendet werden
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path != "/api/generate":
+            self._send(404, json.dumps({"error": "not found"}).encode(), "application/json")
+            return
+
+        with self.server._lock:
+            self.server.requests.append(request)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        text = self.server.responder(request.get("prompt", ""), request)
+        created = datetime.now(timezone.utc).isoformat()
+        model = request.get("model", "stub")
+        final = {"model": model, "created_at": created, "response": "", "done": True, "done_reason": "stop"}
+
+        if request.get("stream", True):
+            # NDJSON wie beim echten Ollama: Teilantwort + Abschlusszeile
+            parts = [{"model": model, "created_at": created, "response": text, "done": False}, final]
+            body = "".join(json.dumps(p) + "\n" for p in parts).encode()
+            self._send(200, body, "application/x-ndjson")
+        else:
+            self._send(200, json.dumps({**final, "response": text}).encode(), "application/json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokaler Ollama-Stub für Tests")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--delay", type=float, default=0.0, help="Künstliche Antwortzeit in Sekunden")
+    args = parser.parse_args()
+
+    server = OllamaStubServer(port=args.port, delay=args.delay)
+    print(f"Ollama-Stub läuft auf {server.base_url}")
+    server.serve_forever()
@@ -1,8 +1,136 @@
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
+from config import PDF_TEXT_CACHE_DIR, PDF_PARALLEL_MIN_PAGES, PDF_PARALLEL_WORKERS
+from utils.hashing import sha256_file
+
+# Zuletzt genutzte Dokumente zusätzlich im Speicher (Hash → Seitentexte)
+_MEMORY_CACHE_SIZE = 32
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _cache_path(digest):
+    return os.path.join(PDF_TEXT_CACHE_DIR, f"{digest}.json")
+
+
+def _load_cached(digest):
+    # (Seitenanzahl, {Seitenindex: Text}) aus Speicher oder Platte; (None, {}) falls unbekannt
+    with _memory_lock:
+        if digest in _memory_cache:
+            _memory_cache.move_to_end(digest)
+            page_count, pages = _memory_cache[digest]
+            return page_count, dict(pages)
+    try:
+        with open(_cache_path(digest), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data["page_count"], {int(i): text for i, text in data["pages"].items()}
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None, {}
+
+
+def _store_cached(digest, page_count, pages):
+    # Atomar schreiben (temporäre Datei + os.replace), damit parallele Läufe nie halbe Dateien lesen
+    os.makedirs(PDF_TEXT_CACHE_DIR, exist_ok=True)
+    path = _cache_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"page_count": page_count, "pages": {str(i): t for i, t in pages.items()}}, f)
+    os.replace(tmp_path, path)
+
+    if len(pages) == page_count:
+        with _memory_lock:
+            _memory_cache[digest] = (page_count, dict(pages))
+            _memory_cache.move_to_end(digest)
+            while len(_memory_cache) > _MEMORY_CACHE_SIZE:
+                _memory_cache.popitem(last=False)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # Prozesspool wird einmal angelegt und von allen Aufrufen (auch Batch-Threads) geteilt;
+    # spawn statt fork, da der aufrufende Prozess bereits Threads (Batch, Streamlit, SQLite) hat
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_PARALLEL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _extract_range(pdf_path, indices):
+    # Läuft im Worker-Prozess: eigene PdfReader-Instanz, Text für einen Seitenbereich
+    reader = PdfReader(pdf_path)
+    return {i: reader.pages[i].extract_text() or "" for i in indices}
+
+
+def _chunks(indices, workers):
+    # Zusammenhängende Seitenbereiche, etwa zwei je Worker (damit die ersten Seiten früh fertig sind)
+    size = max(1, -(-len(indices) // (workers * 2)))
+    return [indices[i:i + size] for i in range(0, len(indices), size)]
+
+
+def iter_pdf_pages(pdf_file, parallel=None):
+    # Generator: liefert die Seitentexte in Reihenfolge, sobald sie vorliegen.
+    # parallel=None → Prozesspool erst ab PDF_PARALLEL_MIN_PAGES fehlenden Seiten (nur bei Dateipfaden)
+    digest = sha256_file(pdf_file)
+    page_count, pages = _load_cached(digest)
+    if page_count is not None and len(pages) == page_count:
+        yield from (pages[i] for i in range(page_count))
+        return
 
-def extract_text_from_pdf(pdf_file):
     reader = PdfReader(pdf_file)
-    text = ''
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
+    page_count = len(reader.pages)
+    missing = [i for i in range(page_count) if i not in pages]
+
+    if parallel is None:
+        parallel = len(missing) >= PDF_PARALLEL_MIN_PAGES and PDF_PARALLEL_WORKERS > 1
+    parallel = parallel and isinstance(pdf_file, (str, os.PathLike))
+
+    if parallel:
+        pool = _get_pool()
+        pending = [pool.submit(_extract_range, os.fspath(pdf_file), chunk)
+                   for chunk in _chunks(missing, PDF_PARALLEL_WORKERS)]
+
+    next_page = 0
+    bekannt = len(pages)
+    try:
+        for i in missing:
+            if parallel:
+                if i not in pages:
+                    # Nächsten Bereich abwarten (Bereiche sind aufsteigend sortiert)
+                    pages.update(pending.pop(0).result())
+            else:
+                pages[i] = reader.pages[i].extract_text() or ""
+
+            # Alle Seiten bis einschließlich i sind jetzt vorhanden
+            while next_page <= i:
+                yield pages[next_page]
+                next_page += 1
+    finally:
+        # Einmal am Ende schreiben – bei Abbruch des Lesers mit dem bisherigen Stand, damit ein neuer Lauf
+        # dort fortsetzt (Zwischenstände je Seitenblock würden große PDFs quadratisch oft neu schreiben)
+        if len(pages) > bekannt:
+            _store_cached(digest, page_count, pages)
+
+    while next_page < page_count:
+        yield pages[next_page]
+        next_page += 1
+
+
+def extract_pages(pdf_file, parallel=None):
+    # Text je Seite; bereits extrahierte Seiten (gleicher Dateiinhalt) werden nicht erneut geparst
+    return list(iter_pdf_pages(pdf_file, parallel=parallel))
+
+
+def extract_text_from_pdf(pdf_file, parallel=None):
+    # Seitentexte einmal zusammenfügen (statt += in der Schleife)
+    return "".join(extract_pages(pdf_file, parallel=parallel))
@@ -0,0 +1,302 @@
+# reference_store.py – einmal geladene, indizierte Referenzdaten (known_transactions.json) für den CheckAgent
+import heapq
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from config import (
+    REFERENCE_DATA_PATH, REFERENCE_STORE_BACKEND, REFERENCE_DB_PATH,
+    CANDIDATE_POOL_SIZE, CANDIDATE_AMOUNT_RANGE
+)
+from utils.archive_db import normalize_invoice_number, normalize_supplier
+from utils.db import get_connection, transaction
+from utils.matching import number_grams, candidate_score
+
+# Trigramme, die in mehr als diesem Anteil der Einträge vorkommen, tragen zur Suche nichts bei
+STOP_GRAM_SHARE = 0.05
+
+# Version der SQLite-Tabellen (Cache, wird bei Änderung neu aufgebaut)
+REFERENCE_SCHEMA_VERSION = 3
+
+
+def _source_state(path):
+    # Änderungskennung der Quelldatei (mtime + Größe)
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_source(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("invoices", [])
+
+
+def _amount(entry):
+    try:
+        return float(entry.get("betrag_brutto"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _amount_window(brutto):
+    # Suchbereich um den Bruttobetrag (mindestens ±1 ct)
+    brutto = float(brutto)
+    spanne = max(0.01, abs(brutto) * CANDIDATE_AMOUNT_RANGE)
+    return brutto - spanne, brutto + spanne
+
+
+class ReferenceStore:
+    # Alle Einträge im Speicher, Hash-Indizes auf normalisierte Rechnungsnummer und Lieferant
+    def __init__(self, path=REFERENCE_DATA_PATH):
+        self.path = path
+        self._state = None
+        self._lock = threading.Lock()
+        self._entries = []
+        self._by_number = {}
+        self._by_supplier = {}
+        self._grams = {}
+        self._amounts = []
+        self._amount_ids = []
+        self.refresh()
+
+    def refresh(self):
+        # Neu laden, wenn sich die Quelldatei geändert hat; True bei Neuladen
+        state = _source_state(self.path)
+        if state == self._state:
+            return False
+        with self._lock:
+            if state == self._state:
+                return False
+            entries = _read_source(self.path)
+            by_number, by_supplier, grams, amounts = {}, {}, {}, []
+            for i, entry in enumerate(entries):
+                by_number.setdefault(normalize_invoice_number(entry.get("rechnungsnummer")), []).append(i)
+                by_supplier.setdefault(normalize_supplier(entry.get("lieferant")), []).append(i)
+                for gram in number_grams(entry.get("rechnungsnummer")):
+                    grams.setdefault(gram, []).append(i)
+                betrag = _amount(entry)
+                if betrag is not None:
+                    amounts.append((betrag, i))
+            amounts.sort()
+
+            # Indizes komplett ersetzen, damit parallele Leser nie einen halben Stand sehen
+            (self._entries, self._by_number, self._by_supplier, self._grams,
+             self._amounts, self._amount_ids) = (
+                entries, by_number, by_supplier, grams,
+                [a for a, _ in amounts], [i for _, i in amounts]
+            )
+            self._state = state
+            return True
+
+    def by_number(self, rechnungsnummer):
+        entries = self._entries
+        return [entries[i] for i in self._by_number.get(normalize_invoice_number(rechnungsnummer), [])]
+
+    def by_supplier(self, lieferant):
+        entries = self._entries
+        return [entries[i] for i in self._by_supplier.get(normalize_supplier(lieferant), [])]
+
+    def find(self, rechnungsnummer, lieferant=None):
+        # Erster Eintrag zur Rechnungsnummer; bei mehreren bevorzugt der mit passendem Lieferanten
+        treffer = self.by_number(rechnungsnummer)
+        if lieferant and len(treffer) > 1:
+            lieferant = normalize_supplier(lieferant)
+            treffer.sort(key=lambda e: normalize_supplier(e.get("lieferant")) != lieferant)
+        return treffer[0] if treffer else None
+
+    def _candidate_ids(self, grams, lieferant, brutto, pool):
+        # Kandidaten aus Nummern-Trigrammen, gleichem Lieferanten und Betragsbereich (je höchstens pool)
+        stop = max(pool, int(len(self._entries) * STOP_GRAM_SHARE))
+        treffer = Counter()
+        for gram in grams:
+            posting = self._grams.get(gram, [])
+            if len(posting) <= stop:
+                treffer.update(posting)
+        # Meiste gemeinsame Trigramme zuerst, bei Gleichstand die frühere Position
+        ids = {i for i, _ in heapq.nsmallest(pool, treffer.items(), key=lambda t: (-t[1], t[0]))}
+
+        if lieferant:
+            ids.update(self._by_supplier.get(normalize_supplier(lieferant), [])[:pool])
+
+        if brutto is not None:
+            low, high = _amount_window(brutto)
+            start, end = bisect_left(self._amounts, low), bisect_right(self._amounts, high)
+            ids.update(self._amount_ids[start:min(end, start + pool)])
+        return ids
+
+    def _load(self, ids):
+        # {Position in der Quelldatei: Eintrag}
+        entries = self._entries
+        return {i: entries[i] for i in ids}
+
+    def candidates(self, rechnungsnummer, lieferant=None, brutto=None, k=5, pool=CANDIDATE_POOL_SIZE):
+        # Top-k ähnlichste Referenzen als [(Score, Eintrag)], absteigend sortiert
+        ids = self._candidate_ids(number_grams(rechnungsnummer), lieferant, brutto, pool)
+        bewertet = [
+            (round(candidate_score(rechnungsnummer, lieferant, brutto, entry), 3), entry)
+            for _, entry in sorted(self._load(ids).items())
+        ]
+        # Stabil sortiert: bei gleichem Score gewinnt der frühere Eintrag der Quelldatei (wie in by_number)
+        bewertet.sort(key=lambda t: t[0], reverse=True)
+        return bewertet[:k]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteReferenceStore(ReferenceStore):
+    # Gleiche Schnittstelle, Einträge und Indizes liegen in SQLite statt im Speicher
+    def __init__(self, path=REFERENCE_DATA_PATH, db_path=REFERENCE_DB_PATH):
+        self.db_path = db_path
+        with transaction(db_path) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != REFERENCE_SCHEMA_VERSION:
+                # Reiner Cache der Quelldatei: bei neuem Schema verwerfen und neu importieren
+                for table in ("reference", "reference_ngram", "reference_meta"):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"PRAGMA user_version = {REFERENCE_SCHEMA_VERSION}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reference (
+                    id INTEGER PRIMARY KEY,
+                    pos INTEGER,
+                    nummer_norm TEXT,
+                    lieferant_norm TEXT,
+                    betrag REAL,
+                    data TEXT
+                )
+            """)
+            # pos = Index in der Quelldatei; Abfragen liefern in dieser Reihenfolge (wie der Speicher-Store)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reference_nummer ON reference(nummer_norm, pos)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reference_lieferant ON reference(lieferant_norm, pos)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reference_betrag ON reference(betrag, pos)")
+            conn.execute("CREATE TABLE IF NOT EXISTS reference_ngram (gram TEXT, ref_id INTEGER)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reference_ngram ON reference_ngram(gram, ref_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reference_ngram_ref ON reference_ngram(ref_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS reference_meta (key TEXT PRIMARY KEY, value TEXT)")
+        super().__init__(path)
+
+    def refresh(self):
+        # Abgleich nur, wenn sich die Quelldatei seit dem letzten Import geändert hat (auch über Prozesse hinweg)
+        state = json.dumps(list(_source_state(self.path)))
+        if state == self._state:
+            return False
+        with self._lock, transaction(self.db_path) as conn:
+            row = conn.execute("SELECT value FROM reference_meta WHERE key = 'source'").fetchone()
+            if row is None or row[0] != state:
+                self._apply_diff(conn, _read_source(self.path))
+                conn.execute("INSERT OR REPLACE INTO reference_meta (key, value) VALUES ('source', ?)", (state,))
+            self._count = conn.execute("SELECT COUNT(*) FROM reference").fetchone()[0]
+            self._state = state
+            return True
+
+    def _apply_diff(self, conn, entries):
+        # Einträge über ihren normalisierten Inhalt abgleichen: unveränderte bleiben samt Trigrammen stehen,
+        # nur entfernte werden gelöscht und neue angehängt (statt die ganze Tabelle neu zu schreiben).
+        # Verschobene Einträge erhalten ihre neue Position in der Quelldatei
+        bestand = {}
+        for ref_id, pos, data in conn.execute("SELECT id, pos, data FROM reference ORDER BY pos"):
+            bestand.setdefault(data, []).append((ref_id, pos))
+
+        neu, verschoben = [], []
+        for pos, e in enumerate(entries):
+            data = json.dumps(e, ensure_ascii=False)
+            if bestand.get(data):
+                ref_id, alte_pos = bestand[data].pop(0)
+                if alte_pos != pos:
+                    verschoben.append((pos, ref_id))
+            else:
+                neu.append((pos, e, data))
+
+        entfernt = [(ref_id,) for rows in bestand.values() for ref_id, _ in rows]
+        conn.executemany("DELETE FROM reference WHERE id = ?", entfernt)
+        conn.executemany("DELETE FROM reference_ngram WHERE ref_id = ?", entfernt)
+        conn.executemany("UPDATE reference SET pos = ? WHERE id = ?", verschoben)
+
+        naechste_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM reference").fetchone()[0] + 1
+        for i, (pos, e, data) in enumerate(neu, start=naechste_id):
+            conn.execute(
+                "INSERT INTO reference (id, pos, nummer_norm, lieferant_norm, betrag, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (i, pos, normalize_invoice_number(e.get("rechnungsnummer")), normalize_supplier(e.get("lieferant")),
+                 _amount(e), data)
+            )
+            conn.executemany(
+                "INSERT INTO reference_ngram (gram, ref_id) VALUES (?, ?)",
+                ((gram, i) for gram in number_grams(e.get("rechnungsnummer")))
+            )
+        return len(neu), len(entfernt)
+
+    def _query(self, column, value):
+        rows = get_connection(self.db_path).execute(
+            f"SELECT data FROM reference WHERE {column} = ? ORDER BY pos", (value,)
+        ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def by_number(self, rechnungsnummer):
+        return self._query("nummer_norm", normalize_invoice_number(rechnungsnummer))
+
+    def by_supplier(self, lieferant):
+        return self._query("lieferant_norm", normalize_supplier(lieferant))
+
+    def _candidate_ids(self, grams, lieferant, brutto, pool):
+        conn = get_connection(self.db_path)
+        ids = set()
+
+        grams = list(grams)
+        if grams:
+            placeholders = ", ".join("?" for _ in grams)
+            stop = max(pool, int(len(self) * STOP_GRAM_SHARE))
+            # Häufige Trigramme vorab aussortieren (Zählung über den Index, ohne Tabellenzugriff)
+            grams = [
+                gram for gram, anzahl in conn.execute(
+                    f"SELECT gram, COUNT(*) FROM reference_ngram WHERE gram IN ({placeholders}) GROUP BY gram",
+                    grams
+                ) if anzahl <= stop
+            ]
+        if grams:
+            placeholders = ", ".join("?" for _ in grams)
+            ids.update(ref_id for (ref_id,) in conn.execute(
+                f"SELECT n.ref_id FROM reference_ngram n JOIN reference r ON r.id = n.ref_id "
+                f"WHERE n.gram IN ({placeholders}) GROUP BY n.ref_id ORDER BY COUNT(*) DESC, r.pos LIMIT ?",
+                (*grams, pool)
+            ))
+
+        if lieferant:
+            ids.update(ref_id for (ref_id,) in conn.execute(
+                "SELECT id FROM reference WHERE lieferant_norm = ? ORDER BY pos LIMIT ?",
+                (normalize_supplier(lieferant), pool)
+            ))
+
+        if brutto is not None:
+            low, high = _amount_window(brutto)
+            ids.update(ref_id for (ref_id,) in conn.execute(
+                "SELECT id FROM reference WHERE betrag BETWEEN ? AND ? ORDER BY betrag, pos LIMIT ?", (low, high, pool)
+            ))
+        return ids
+
+    def _load(self, ids):
+        if not ids:
+            return {}
+        ids = list(ids)
+        placeholders = ", ".join("?" for _ in ids)
+        rows = get_connection(self.db_path).execute(
+            f"SELECT pos, data FROM reference WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        return {pos: json.loads(data) for pos, data in rows}
+
+    def __len__(self):
+        return self._count
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_reference_store(path=REFERENCE_DATA_PATH, backend=REFERENCE_STORE_BACKEND):
+    # Prozessweit geteilter Store je Quelldatei; bei jedem Abruf auf geänderte Quelldatei prüfen
+    key = (os.path.abspath(path), backend)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = SqliteReferenceStore(path) if backend == "sqlite" else ReferenceStore(path)
+            return store
+    store.refresh()
+    return store
@@ -0,0 +1,144 @@
+# run_context.py – Laufzustand einer Rechnung im Speicher, persistiert nur an Schrittgrenzen
+import json
+import os
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from config import RESULTS_PATH, WORKFLOW_STATUS_PATH
+from utils.checkpoint_store import CheckpointStore, is_finished
+from utils.hashing import sha256_file
+
+
+def default_workflow_status():
+    # Ausgangsstatus: alle sechs Schritte offen (0)
+    return {
+        "1_validation": 0,
+        "2_accounting": 0,
+        "3_check": 0,
+        "4_approval": 0,
+        "5_booking": 0,
+        "6_archiving": 0
+    }
+
+
+def atomic_write_json(path, data):
+    # In temporäre Datei im Zielordner schreiben und per os.replace atomar austauschen
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def state_path(results_path):
+    # Gemeinsame Zustandsdatei (Ergebnisse + Workflow-Status) neben results.json
+    return os.path.join(os.path.dirname(results_path), "run_state.json") if results_path else None
+
+
+def _load_json(path, default):
+    if not path:
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+@dataclass
+class RunContext:
+    # Zwischenergebnisse (Format von results.json) und Workflow-Status eines Laufs
+    pdf_path: str = None
+    results_path: str = RESULTS_PATH
+    workflow_status_path: str = WORKFLOW_STATUS_PATH
+    results: dict = field(default_factory=dict)
+    workflow: dict = field(default_factory=default_workflow_status)
+    document_id: str = None                             # PDF-Hash, Schlüssel im CheckpointStore
+    checkpoints: CheckpointStore = field(default=None, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @classmethod
+    def load(cls, results_path=RESULTS_PATH, workflow_status_path=WORKFLOW_STATUS_PATH, pdf_path=None):
+        # Vorhandenen Zustand von der Platte übernehmen (z. B. Fortsetzen eines Laufs); maßgeblich ist die
+        # gemeinsame Zustandsdatei. Mit pdf_path nur, wenn sie zu derselben Rechnung (PDF-Hash) gehört – sonst
+        # beginnt der Lauf neu; die Einzeldateien nur ohne pdf_path (Einzelaufruf eines Agenten)
+        document_id = sha256_file(pdf_path) if pdf_path and os.path.exists(pdf_path) else None
+        state = _load_json(state_path(results_path), None)
+        if pdf_path is not None:
+            if state is None or document_id is None or state.get("document_id") != document_id:
+                state = {"results": {}, "workflow": default_workflow_status()}
+        elif state is None:
+            state = {"results": _load_json(results_path, {}),
+                     "workflow": _load_json(workflow_status_path, default_workflow_status())}
+        return cls(
+            pdf_path=pdf_path,
+            results_path=results_path,
+            workflow_status_path=workflow_status_path,
+            results=state["results"],
+            workflow=state["workflow"],
+            document_id=document_id or state.get("document_id")
+        )
+
+    @classmethod
+    def resume(cls, pdf_path, results_path=RESULTS_PATH, workflow_status_path=WORKFLOW_STATUS_PATH, store=None):
+        # Unterbrochenen bzw. wartenden Lauf zur Rechnung (PDF-Hash = gleiche Rechnung, unabhängig vom Dateinamen) aus dem CheckpointStore fortsetzen;
+        # eine bereits abgeschlossene oder abgebrochene Rechnung wird beim erneuten Einreichen neu verarbeitet
+        store = store or CheckpointStore()
+        document_id = sha256_file(pdf_path)
+        state = store.load(document_id)
+        if state is None or is_finished(state[1]):
+            state = ({}, default_workflow_status())
+        results, workflow = state
+        return cls(
+            pdf_path=pdf_path,
+            results_path=results_path,
+            workflow_status_path=workflow_status_path,
+            results=results,
+            workflow=workflow,
+            document_id=document_id,
+            checkpoints=store
+        )
+
+    def get(self, key, default=None):
+        return self.results.get(key, default)
+
+    def set(self, key, value):
+        self.results[key] = value
+
+    def export(self):
+        # Kopie im results.json-Format (z. B. für die Streamlit-Ansicht oder das Archiv)
+        return json.loads(json.dumps(self.results))
+
+    def checkpoint(self):
+        # Schrittgrenze: Ergebnisse und Status gemeinsam in einer Datei atomar schreiben (ein Absturz hinterlässt
+        # nie Status und Ergebnisse aus verschiedenen Schritten); results.json und workflow_status.json folgen
+        # als Ansichten im bisherigen Format. Parallel laufende Schritte sichern nacheinander, jeweils von einer
+        # Momentaufnahme
+        with self._lock:
+            if self.document_id is None and self.pdf_path and os.path.exists(self.pdf_path):
+                self.document_id = sha256_file(self.pdf_path)
+            results, workflow = dict(self.results), dict(self.workflow)
+            if self.results_path:
+                atomic_write_json(
+                    state_path(self.results_path),
+                    {"document_id": self.document_id, "results": results, "workflow": workflow}
+                )
+                atomic_write_json(self.results_path, results)
+            if self.workflow_status_path:
+                atomic_write_json(self.workflow_status_path, workflow)
+            if self.checkpoints is not None and self.document_id:
+                self.checkpoints.save(self)
+
+
+def as_context(context_or_path):
+    # Agenten akzeptieren weiterhin einen Pfad zu results.json (Einzelaufruf ohne Supervisor); der
+    # Workflow-Status kommt aus der Zustandsdatei, damit ein Checkpoint ihn nicht zurücksetzt
+    if isinstance(context_or_path, RunContext):
+        return context_or_path
+    return RunContext.load(results_path=context_or_path, workflow_status_path=None)
@@ -0,0 +1,180 @@
+# scheduler.py – Reihenfolge der Rechnungsverarbeitung nach Betrag, Zahlungs-/Skontofrist und Lieferant
+# Klassen werden strikt nach Rang bedient (Rechnungen, die länger als SCHEDULER_MAX_WAIT_S warten, rücken vor);
+# innerhalb einer Klasse teilen sich die Lieferanten die Worker per Weighted Fair Queuing (virtuelle Endzeiten).
+import heapq
+import itertools
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from config import APPROVAL_RULES, SCHEDULER_DEADLINE_DAYS, SCHEDULER_MAX_WAIT_S, SCHEDULER_SUPPLIER_WEIGHTS
+from utils.amount_parser import BRUTTO_LABELS, parse_amount
+from utils.matching import supplier_name
+from utils.pdf_parser import extract_text_from_pdf
+
+# Rang je Klasse (kleiner = früher): knappe Frist vor automatisch genehmigbaren Kleinbeträgen vor dem Rest
+KLASSEN = {"frist": 0, "auto": 1, "standard": 2}
+
+# Betrag mit Cent-Stellen direkt hinter einem Brutto-Stichwort, z. B. "Netto 2.450,00 EUR  Brutto 2.915,50 EUR";
+# ohne Cent-Stellen zählt eine Zahl nicht (sonst träfe z. B. "Gross GmbH, Weg 1" als Betrag 1)
+BRUTTO_PATTERN = re.compile(
+    r"(?:" + "|".join(BRUTTO_LABELS) + r")[^\d\n]{0,40}?(\d[\d.,']*[.,]\d{2})(?![\d%])", re.IGNORECASE
+)
+DATUM = r"(\d{1,2})\.(\d{1,2})\.(\d{2,4})"
+FRIST_PATTERN = re.compile(
+    r"(?:zahlbar|fällig|zahlungsziel|skonto)[^\n]*?(?:bis(?: zum)?|am|:)\s*" + DATUM, re.IGNORECASE
+)
+TAGE_PATTERN = re.compile(r"(?:innerhalb|binnen)\s+(?:von\s+)?(\d{1,3})\s+tag", re.IGNORECASE)
+RECHNUNGSDATUM_PATTERN = re.compile(r"datum\D{0,20}?" + DATUM, re.IGNORECASE)
+
+
+@dataclass
+class InvoiceFacts:
+    brutto: Decimal = None
+    frist: date = None                  # früheste Zahlungs- bzw. Skontofrist
+    lieferant: str = None
+
+
+def _datum(match):
+    tag, monat, jahr = (int(g) for g in match.groups()[-3:])
+    try:
+        return date(jahr + 2000 if jahr < 100 else jahr, monat, tag)
+    except ValueError:
+        return None
+
+
+def facts_from_text(text):
+    # Deterministische Vorab-Erkennung (ohne LLM); nicht erkannte Angaben bleiben None
+    zeilen = [zeile.strip() for zeile in (text or "").splitlines() if zeile.strip()]
+
+    # Letzter Betrag hinter einem Brutto-Stichwort (Summen stehen am Ende); mehrdeutige Beträge zählen nicht
+    brutto = None
+    for treffer in BRUTTO_PATTERN.finditer(text or ""):
+        try:
+            brutto = parse_amount(treffer.group(1))
+        except ValueError:
+            continue
+
+    fristen = [_datum(m) for m in FRIST_PATTERN.finditer(text or "")]
+    rechnungsdatum = RECHNUNGSDATUM_PATTERN.search(text or "")
+    basis = _datum(rechnungsdatum) if rechnungsdatum else None
+    if basis:
+        # "zahlbar innerhalb von 30 Tagen", "2 % Skonto binnen 10 Tagen" → ab Rechnungsdatum
+        fristen += [basis + timedelta(days=int(m.group(1))) for m in TAGE_PATTERN.finditer(text)]
+    fristen = [frist for frist in fristen if frist]
+
+    # Absender steht auf Rechnungen üblicherweise in der ersten Zeile
+    return InvoiceFacts(brutto, min(fristen) if fristen else None, supplier_name(zeilen[0]) if zeilen else None)
+
+
+def prescan(pdf_path):
+    # Fakten aus dem PDF-Text (der Text landet im PDF-Cache und wird von der Validierung wiederverwendet)
+    try:
+        return facts_from_text(extract_text_from_pdf(pdf_path))
+    except Exception:
+        return InvoiceFacts()
+
+
+def classify(facts, heute=None):
+    heute = heute or date.today()
+    if facts.frist is not None and facts.frist - heute <= timedelta(days=SCHEDULER_DEADLINE_DAYS):
+        return "frist"
+    if facts.brutto is not None and facts.brutto <= APPROVAL_RULES["employee"]:
+        return "auto"
+    return "standard"
+
+
+def supplier_weight(lieferant):
+    return float(SCHEDULER_SUPPLIER_WEIGHTS.get(lieferant or "", 1.0))
+
+
+def _quantil(werte, q):
+    werte = sorted(werte)
+    return werte[min(len(werte) - 1, int(q * len(werte)))] if werte else None
+
+
+def timing_report(eintraege):
+    # Wartezeit in der Schlange vs. Bearbeitungszeit je Klasse; eintraege: (klasse, eingereicht, gestartet, beendet)
+    je_klasse = {}
+    for klasse, eingereicht, gestartet, beendet in eintraege:
+        if gestartet is None or beendet is None:
+            continue
+        werte = je_klasse.setdefault(klasse or "standard", ([], []))
+        werte[0].append(gestartet - eingereicht)
+        werte[1].append(beendet - gestartet)
+
+    report = {}
+    for klasse in sorted(je_klasse, key=lambda k: KLASSEN.get(k, len(KLASSEN))):
+        warten, bearbeitung = je_klasse[klasse]
+        report[klasse] = {
+            "anzahl": len(warten),
+            "wartezeit_s": {"mittel": round(sum(warten) / len(warten), 3), "p95": round(_quantil(warten, 0.95), 3)},
+            "bearbeitung_s": {
+                "mittel": round(sum(bearbeitung) / len(bearbeitung), 3), "p95": round(_quantil(bearbeitung, 0.95), 3)
+            }
+        }
+    return report
+
+
+class InvoiceScheduler:
+    def __init__(self, max_wait_s=SCHEDULER_MAX_WAIT_S):
+        self.max_wait_s = max_wait_s
+        self._heaps = {klasse: [] for klasse in KLASSEN}
+        self._uhr = {klasse: 0.0 for klasse in KLASSEN}        # virtuelle Zeit je Klasse
+        self._letzte = {}                                       # (klasse, lieferant) → letzte virtuelle Endzeit
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.erledigt = []
+
+    def __len__(self):
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def push(self, item, facts=None):
+        # item: PDF-Pfad (ohne facts wird vorab gescannt); Ergebnis: Planungseintrag
+        facts = facts or prescan(item)
+        klasse, lieferant = classify(facts), facts.lieferant or ""
+        eintrag = {"item": item, "klasse": klasse, "lieferant": lieferant, "facts": facts,
+                   "eingereicht": time.time(), "gestartet": None, "beendet": None}
+        with self._lock:
+            # Weighted Fair Queuing: jeder Lieferant bekommt Anteile gemäß Gewicht, keiner blockiert die Klasse
+            start = max(self._uhr[klasse], self._letzte.get((klasse, lieferant), 0.0))
+            ende = self._letzte[(klasse, lieferant)] = start + 1.0 / supplier_weight(lieferant)
+            heapq.heappush(self._heaps[klasse], (ende, next(self._seq), eintrag))
+        return eintrag
+
+    def pop(self):
+        # Nächster Eintrag oder None, wenn die Schlange leer ist
+        with self._lock:
+            heaps = [(klasse, heap) for klasse, heap in self._heaps.items() if heap]
+            if not heaps:
+                return None
+            # Zu lange wartende Rechnungen zuerst (verhindert Aushungern großer Rechnungen), untereinander nach
+            # Frist und Eingang; die virtuelle Zeit der Klasse bleibt dabei unverändert
+            grenze = time.time() - self.max_wait_s
+            ueberfaellig = [
+                (e[2]["facts"].frist or date.max, e[2]["eingereicht"], e[1], klasse, e)
+                for klasse, heap in heaps for e in heap if e[2]["eingereicht"] < grenze
+            ]
+            if ueberfaellig:
+                *_, klasse, element = min(ueberfaellig)
+                self._heaps[klasse].remove(element)
+                heapq.heapify(self._heaps[klasse])
+                eintrag = element[2]
+            else:
+                klasse = min(heaps, key=lambda kh: KLASSEN[kh[0]])[0]
+                ende, _, eintrag = heapq.heappop(self._heaps[klasse])
+                self._uhr[klasse] = ende
+        eintrag["gestartet"] = time.time()
+        return eintrag
+
+    def done(self, eintrag):
+        eintrag["beendet"] = time.time()
+        with self._lock:
+            self.erledigt.append(eintrag)
+
+    def report(self):
+        with self._lock:
+            eintraege = [(e["klasse"], e["eingereicht"], e["gestartet"], e["beendet"]) for e in self.erledigt]
+        return timing_report(eintraege)
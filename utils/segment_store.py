@@ -0,0 +1,364 @@
+# segment_store.py – Archiv in großen, unveränderlichen Segmentdateien (append-only) mit Offset-Index in SQLite
+# Gleiche Schnittstelle wie der BlobStore (Schlüssel = SHA-256 des Inhalts), aber wenige große Dateien statt
+# Millionen kleiner. Jeder Datensatz trägt eine CRC32 der gespeicherten Bytes; der Inhalt wird zusätzlich
+# über seinen SHA-256 geprüft. Abgeschlossene Segmente sind schreibgeschützt (GoBD: keine Änderung).
+# Aufruf: python -m utils.segment_store verify [--repair-index]
+#         python -m utils.segment_store purge [--drop-orphans]
+#         python -m utils.segment_store import-blobs
+#         python -m utils.segment_store stats
+import argparse
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from config import (
+    ARCHIVE_SEGMENT_DIR, ARCHIVE_SEGMENT_MAX_BYTES, ARCHIVE_SEGMENT_FSYNC, ARCHIVE_RETENTION_YEARS, ARCHIVE_BLOB_COMPRESS, ARCHIVE_BLOB_DIR, ARCHIVE_DB_PATH
+)
+from utils.archive_db import migrate
+from utils.db import get_connection, transaction
+
+try:
+    import zstandard
+except ImportError:                                     # Komprimierung ist optional
+    zstandard = None
+
+# Datensatzkopf: Magic, SHA-256 (roh), Flags, Länge unkomprimiert, Länge gespeichert, CRC32 der gespeicherten Bytes
+MAGIC = b"IMAR"
+HEADER = struct.Struct(">4s32sBQQI")
+FLAG_ZSTD = 1
+
+SEGMENT_NAME = re.compile(r"^seg-(\d{6})\.dat$")
+INDEX_SCHEMA_VERSION = 1
+JAHR_S = 365.25 * 24 * 3600
+
+# Unreferenzierte Datensätze (z. B. Ergebnisse einer als Dublette abgelehnten Archivierung) erst nach dieser
+# Wartezeit als verwaist behandeln, damit laufende Archivierungen nicht betroffen sind
+ORPHAN_GRACE_S = 24 * 3600
+
+
+class CorruptRecord(Exception):
+    pass
+
+
+def _segment_name(nummer):
+    return f"seg-{nummer:06d}.dat"
+
+
+class SegmentStore:
+    def __init__(self, root=ARCHIVE_SEGMENT_DIR, max_bytes=ARCHIVE_SEGMENT_MAX_BYTES, compress=ARCHIVE_BLOB_COMPRESS,
+                 retention_years=ARCHIVE_RETENTION_YEARS, fsync=ARCHIVE_SEGMENT_FSYNC):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.compress = compress and zstandard is not None
+        self.retention_s = retention_years * JAHR_S
+        self.fsync = fsync
+        self.index_path = os.path.join(root, "index.db")
+        self._maps = {}
+        self._maps_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        with transaction(self.index_path) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < INDEX_SCHEMA_VERSION:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS records (
+                        digest TEXT PRIMARY KEY,
+                        segment INTEGER NOT NULL,
+                        offset INTEGER NOT NULL,
+                        length INTEGER NOT NULL,
+                        raw_length INTEGER NOT NULL,
+                        flags INTEGER NOT NULL,
+                        crc INTEGER NOT NULL,
+                        erstellt REAL NOT NULL,
+                        aufbewahren_bis REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_records_segment ON records(segment)")
+                conn.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+
+
+    def segment_path(self, nummer):
+        return os.path.join(self.root, _segment_name(nummer))
+
+    def segments(self):
+        return sorted(int(m.group(1)) for m in map(SEGMENT_NAME.match, os.listdir(self.root)) if m)
+
+    @contextmanager
+    def _locked(self):
+        # Schreibzugriffe seriell: im Prozess (Threads) und zwischen Prozessen (Sperrdatei)
+        with self._write_lock, open(os.path.join(self.root, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _active_segment(self, zusatz):
+        # Aktuelles Segment; ist es voll, wird es versiegelt (schreibgeschützt) und ein neues begonnen
+        segmente = self.segments()
+        nummer = segmente[-1] if segmente else 1
+        pfad = self.segment_path(nummer)
+        if os.path.exists(pfad) and os.path.getsize(pfad) > 0 and os.path.getsize(pfad) + zusatz > self.max_bytes:
+            os.chmod(pfad, 0o444)
+            nummer += 1
+        return nummer
+
+    def _map(self, nummer, ende):
+        # Speicherabbild je Segment; wird neu erstellt, wenn das aktive Segment inzwischen gewachsen ist
+        with self._maps_lock:
+            eintrag = self._maps.get(nummer)
+            if eintrag is None or len(eintrag) < ende:
+                with open(self.segment_path(nummer), "rb") as f:
+                    eintrag = self._maps[nummer] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return eintrag
+
+
+    def _append(self, conn, digest, data, compress, aufbewahren_bis=None):
+        # Datensatz ans aktive Segment anhängen und indizieren (Aufrufer hält die Schreibsperre)
+        gespeichert = zstandard.ZstdCompressor(level=10).compress(data) if compress else data
+        crc = zlib.crc32(gespeichert)
+        flags = FLAG_ZSTD if compress else 0
+        kopf = HEADER.pack(MAGIC, bytes.fromhex(digest), flags, len(data), len(gespeichert), crc)
+
+        nummer = self._active_segment(len(kopf) + len(gespeichert))
+        with open(self.segment_path(nummer), "ab") as f:
+            offset = f.tell()
+            f.write(kopf + gespeichert)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO records (digest, segment, offset, length, raw_length, flags, crc, erstellt, "
+            "aufbewahren_bis) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (digest, nummer, offset, len(gespeichert), len(data), flags, crc, now,
+             aufbewahren_bis or now + self.retention_s)
+        )
+
+    def exists(self, digest):
+        return get_connection(self.index_path).execute(
+            "SELECT 1 FROM records WHERE digest = ?", (digest,)
+        ).fetchone() is not None
+
+    def _retain(self, conn, digest):
+        # Erneut abgelegter Inhalt: Aufbewahrungsfrist ab jetzt verlängern, nie verkürzen (die neue Archivierung
+        # braucht ihre volle Frist, auch wenn derselbe Inhalt schon früher archiviert wurde).
+        # True, wenn der Inhalt bereits vorhanden war
+        return conn.execute(
+            "UPDATE records SET aufbewahren_bis = MAX(aufbewahren_bis, ?) WHERE digest = ?",
+            (time.time() + self.retention_s, digest)
+        ).rowcount == 1
+
+    def _put_existing(self, digest):
+        with transaction(self.index_path) as conn:
+            return self._retain(conn, digest)
+
+    def put_bytes(self, data, compress=None, digest=None):
+        # Inhalt ablegen; bereits vorhandene Inhalte werden nicht erneut geschrieben. Ergebnis: SHA-256
+        digest = digest or hashlib.sha256(data).hexdigest()
+        if self._put_existing(digest):
+            return digest
+        compress = self.compress if compress is None else compress and zstandard is not None
+        with self._locked(), transaction(self.index_path) as conn:
+            if not self._retain(conn, digest):
+                self._append(conn, digest, data, compress)
+        return digest
+
+    def put_file(self, src, digest=None):
+        # PDFs sind bereits komprimiert und werden unverändert abgelegt
+        if digest and self._put_existing(digest):
+            return digest
+        with open(src, "rb") as f:
+            data = f.read()
+        return self.put_bytes(data, compress=False, digest=digest)
+
+    def put_json(self, data):
+        # Kanonische Serialisierung, damit gleiche Ergebnisse denselben Hash ergeben
+        return self.put_bytes(json.dumps(data, ensure_ascii=False, sort_keys=True, indent=1).encode("utf-8"))
+
+
+    def _read(self, nummer, offset, ende=None):
+        # (Digest, Inhalt) des Datensatzes an offset; CorruptRecord bei Prüfsummenfehler
+        mm = self._map(nummer, ende or offset + HEADER.size)
+        if offset + HEADER.size > len(mm):
+            raise CorruptRecord(f"Segment {nummer}: Datensatzkopf bei {offset} unvollständig")
+        magic, digest, flags, raw_length, length, crc = HEADER.unpack_from(mm, offset)
+        start = offset + HEADER.size
+        if magic != MAGIC or start + length > len(mm):
+            raise CorruptRecord(f"Segment {nummer}: ungültiger Datensatz bei {offset}")
+        gespeichert = mm[start:start + length]
+        if zlib.crc32(gespeichert) != crc:
+            raise CorruptRecord(f"Segment {nummer}: CRC-Fehler bei {offset}")
+        data = zstandard.ZstdDecompressor().decompress(gespeichert) if flags & FLAG_ZSTD else gespeichert
+        return digest.hex(), data, start + length
+
+    def get_bytes(self, digest):
+        row = get_connection(self.index_path).execute(
+            "SELECT segment, offset, length FROM records WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        nummer, offset, length = row
+        _, data, _ = self._read(nummer, offset, offset + HEADER.size + length)
+        return data
+
+    def get_json(self, digest):
+        return json.loads(self.get_bytes(digest))
+
+    def scan(self, nummer):
+        # Alle Datensätze eines Segments der Reihe nach: (Offset, Digest, Inhalt) bzw. (Offset, None, Fehler)
+        groesse = os.path.getsize(self.segment_path(nummer))
+        offset = 0
+        while offset < groesse:
+            try:
+                digest, data, naechster = self._read(nummer, offset, groesse)
+            except CorruptRecord as e:
+                # Ab hier ist die Satzgrenze unbekannt (z. B. abgebrochener Schreibvorgang am Ende)
+                yield offset, None, e
+                return
+            yield offset, digest, data
+            offset = naechster
+
+
+    def verify(self, repair_index=False):
+        # Jeden Datensatz prüfen (CRC + SHA-256) und mit dem Index abgleichen
+        conn = get_connection(self.index_path)
+        index = {}
+        for digest, nummer, offset in conn.execute("SELECT digest, segment, offset FROM records"):
+            index[(nummer, offset)] = digest
+        bericht = {"segmente": 0, "datensaetze": 0, "ok": 0, "korrupt": [], "ohne_index": 0, "index_fehlt": 0}
+        gefunden = set()
+
+        for nummer in self.segments():
+            bericht["segmente"] += 1
+            for offset, digest, data in self.scan(nummer):
+                if digest is None:
+                    bericht["korrupt"].append(str(data))
+                    continue
+                bericht["datensaetze"] += 1
+                if hashlib.sha256(data).hexdigest() != digest:
+                    bericht["korrupt"].append(f"Segment {nummer}: SHA-256 weicht ab bei {offset}")
+                    continue
+                bericht["ok"] += 1
+                gefunden.add((nummer, offset))
+                if (nummer, offset) not in index:
+                    bericht["ohne_index"] += 1
+                    if repair_index and not self.exists(digest):
+                        # Nach einem Absturz zwischen Schreiben und Indizieren den Eintrag nachtragen
+                        with self._locked(), transaction(self.index_path) as conn_w:
+                            kopf = HEADER.unpack_from(self._map(nummer, offset + HEADER.size), offset)
+                            now = time.time()
+                            conn_w.execute(
+                                "INSERT OR IGNORE INTO records (digest, segment, offset, length, raw_length, flags, "
+                                "crc, erstellt, aufbewahren_bis) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (digest, nummer, offset, kopf[4], kopf[3], kopf[2], kopf[5], now,
+                                 now + self.retention_s)
+                            )
+        bericht["index_fehlt"] = len(set(index) - gefunden)
+        return bericht
+
+    def purge(self, drop_orphans=False, archive_db_path=ARCHIVE_DB_PATH):
+        # Aufbewahrungslauf: versiegelte Segmente werden nie umgeschrieben, sondern nur als Ganzes gelöscht, wenn
+        # kein aufzubewahrender Datensatz mehr darin liegt (alle Aufbewahrungsfristen abgelaufen). drop_orphans
+        # nimmt verwaiste Datensätze ohne Archiveintrag aus dem Index; ihre Bytes verschwinden erst mit dem Segment
+        now = time.time()
+        bericht = {"segmente_geloescht": 0, "bytes_frei": 0, "entfernt": 0, "verwaist": 0}
+
+        with self._locked():
+            if drop_orphans:
+                migrate(archive_db_path)
+                referenziert = {
+                    digest for row in get_connection(archive_db_path).execute(
+                        "SELECT pdf_blob, results_blob FROM archive"
+                    ) for digest in row if digest
+                }
+                with transaction(self.index_path) as conn_w:
+                    verwaist = [
+                        (digest,) for digest, erstellt in conn_w.execute("SELECT digest, erstellt FROM records")
+                        if digest not in referenziert and erstellt < now - ORPHAN_GRACE_S
+                    ]
+                    conn_w.executemany("DELETE FROM records WHERE digest = ?", verwaist)
+                bericht["verwaist"] = len(verwaist)
+
+            aktiv = self._active_segment(0)
+            for nummer in self.segments():
+                if nummer >= aktiv:
+                    continue
+                with transaction(self.index_path) as conn_w:
+                    if conn_w.execute(
+                        "SELECT 1 FROM records WHERE segment = ? AND aufbewahren_bis >= ? LIMIT 1", (nummer, now)
+                    ).fetchone():
+                        continue
+                    entfernt = conn_w.execute("DELETE FROM records WHERE segment = ?", (nummer,)).rowcount
+                with self._maps_lock:
+                    mm = self._maps.pop(nummer, None)
+                if mm is not None:
+                    mm.close()
+                groesse = os.path.getsize(self.segment_path(nummer))
+                os.remove(self.segment_path(nummer))
+                bericht["segmente_geloescht"] += 1
+                bericht["bytes_frei"] += groesse
+                bericht["entfernt"] += entfernt
+        return bericht
+
+    def stats(self):
+        conn = get_connection(self.index_path)
+        datensaetze, roh, gespeichert = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_length), 0), COALESCE(SUM(length), 0) FROM records"
+        ).fetchone()
+        return {
+            "segmente": len(self.segments()),
+            "datensaetze": datensaetze,
+            "bytes_roh": roh,
+            "bytes_gespeichert": gespeichert,
+            "bytes_segmente": sum(os.path.getsize(self.segment_path(n)) for n in self.segments()),
+            "zstd": self.compress
+        }
+
+
+def import_blobs(store=None, blob_dir=ARCHIVE_BLOB_DIR):
+    # Vorhandene Einzeldateien des BlobStore in Segmente übernehmen (Schlüssel bleiben gleich)
+    store = store or SegmentStore()
+    uebernommen = 0
+    for ordner, _, dateien in os.walk(blob_dir):
+        for name in dateien:
+            digest = name.split(".")[0]
+            if name.endswith(".tmp") or len(digest) != 64 or store.exists(digest):
+                continue
+            with open(os.path.join(ordner, name), "rb") as f:
+                data = f.read()
+            if name.endswith(".zst"):
+                data = zstandard.ZstdDecompressor().decompress(data)
+                store.put_bytes(data, digest=digest)
+            else:
+                store.put_bytes(data, compress=False, digest=digest)
+            uebernommen += 1
+    return uebernommen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segment-Archiv prüfen, abgelaufene Segmente löschen und befüllen")
+    parser.add_argument("befehl", choices=["verify", "purge", "import-blobs", "stats"])
+    parser.add_argument("--repair-index", action="store_true", help="Nicht indizierte, gültige Datensätze nachtragen")
+    parser.add_argument("--drop-orphans", action="store_true",
+                        help="Datensätze ohne Archiveintrag (älter als 24 h) aus dem Index nehmen")
+    args = parser.parse_args()
+
+    store = SegmentStore()
+    if args.befehl == "verify":
+        ergebnis = store.verify(repair_index=args.repair_index)
+    elif args.befehl == "purge":
+        ergebnis = store.purge(drop_orphans=args.drop_orphans)
+    elif args.befehl == "import-blobs":
+        ergebnis = {"uebernommen": import_blobs(store)}
+    else:
+        ergebnis = store.stats()
+    print(json.dumps(ergebnis, ensure_ascii=False, indent=2))